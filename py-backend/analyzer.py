@@ -14,27 +14,30 @@ from __future__ import annotations
 import json
 import os
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-from parser import VCFFile, Variant
+from genotype_matrix import GenotypeMatrix
+import llm_cache
+import llm_client
+from parallel_parser import ParallelVCFReader
+from parser import IndexedVCFReader, SampleGenotype, VCFFile, VCFReader, VCFSource, Variant
 from pgx_knowledgebase import (
-    ALLELE_FUNCTION,
-    KNOWN_GENES,
-    RSID_TO_ALLELE,
     SAFE,
     ADJUST,
     TOXIC,
     INEFFECTIVE,
     UNKNOWN,
     DrugGeneInteraction,
-    build_diplotype,
-    get_genes_for_drug,
-    infer_phenotype,
-    lookup_interaction,
+    InteractionOutcome,
+    KnowledgeBase,
+    current,
 )
+from star_caller import StarCall
 
 # ---------------------------------------------------------------------------
 # Data structures for analysis results
@@ -52,6 +55,7 @@ class DetectedVariant:
     genotype: str
     is_variant: bool
     function: str            # "normal" / "decreased" / "no_function"
+    annotated: bool = False  # star allele came from an INFO STAR tag
 
     def to_dict(self) -> dict:
         return {
@@ -203,117 +207,199 @@ class AnalysisResult:
     genes: List[GenePhenotype]
     drug_results: List[DrugResult]
     summary: dict = field(default_factory=dict)
+    kb_version: str = ""
     _parse_time_ms: float = 0.0
     _analysis_time_ms: float = 0.0
     _vcf_variant_count: int = 0
+    _llm_fallbacks: int = 0        # LLM explanations that fell back to the template
 
     def to_dict(self) -> dict:
         """Structured output matching the EXACT required JSON schema."""
         timestamp = datetime.now(timezone.utc).isoformat()
 
-        results = []
-        for dr in self.drug_results:
-            entry = dr.to_structured_dict(self.patient_id, timestamp)
-            # Attach quality_metrics per drug entry
-            entry["quality_metrics"] = {
-                "vcf_parsing_success": True,
-                "vcf_format_version": "VCFv4.2",
-                "total_variants_in_file": self._vcf_variant_count,
-                "pharmacogenomic_variants_detected": sum(
-                    len(g.detected_alleles) for g in self.genes
-                ),
-                "genes_screened": len(self.genes),
-                "parse_time_ms": round(self._parse_time_ms, 1),
-                "analysis_time_ms": round(self._analysis_time_ms, 1),
-            }
-            results.append(entry)
-
         return {
             "patient_id": self.patient_id,
             "timestamp": timestamp,
-            "results": results,
+            "results": [self.drug_entry(dr, timestamp) for dr in self.drug_results],
             "genes": [g.to_dict() for g in self.genes],
             "summary": self.summary,
         }
 
+    def drug_entry(self, dr: DrugResult, timestamp: str) -> dict:
+        """One element of ``results`` in :meth:`to_dict`."""
+        entry = dr.to_structured_dict(self.patient_id, timestamp)
+        # Attach quality_metrics per drug entry
+        entry["quality_metrics"] = {
+            "vcf_parsing_success": True,
+            "vcf_format_version": "VCFv4.2",
+            "total_variants_in_file": self._vcf_variant_count,
+            "pharmacogenomic_variants_detected": sum(
+                len(g.detected_alleles) for g in self.genes
+            ),
+            "genes_screened": len(self.genes),
+            "parse_time_ms": round(self._parse_time_ms, 1),
+            "analysis_time_ms": round(self._analysis_time_ms, 1),
+        }
+        return entry
+
 
 # ---------------------------------------------------------------------------
 # Core analysis logic
 # ---------------------------------------------------------------------------
 
-def _extract_pharmacogenomic_variants(vcf: VCFFile, sample: Optional[str] = None) -> List[DetectedVariant]:
+def _classify_row(v: Variant, kb: KnowledgeBase) -> Optional[Tuple[str, str, str, str]]:
+    """
+    Classify one VCF row.  Returns (gene, star_allele, rsid, function) when
+    the row is pharmacogenomically relevant, otherwise None.
+    Uses INFO GENE/STAR tags when available, otherwise falls back to rsID
+    lookup and then to the CPIC position index (for rows whose ID is ".").
+    """
+    gene = v.gene
+    star = v.star_allele
+    rsid = v.rsid or ""
+
+    # Fallback: look up by rsID if GENE/STAR not in INFO
+    if (not gene or not star) and rsid:
+        # Handle compound rsIDs (e.g. "rs123;chrX_456_A_G;rs123")
+        for rs_part in rsid.split(";"):
+            rs_part = rs_part.strip()
+            if rs_part in kb.rsid_to_allele:
+                gene, star = kb.rsid_to_allele[rs_part]
+                break
+
+    # Fallback: look up by CHROM/POS/REF/ALT against the definition tables
+    if not gene or not star:
+        hit = kb.lookup_position(v.chrom, v.pos, v.ref, v.alt)
+        if hit:
+            gene, star, _ = hit
+
+    if not gene:
+        return None
+    gene = gene.upper()
+    if gene not in kb.known_gene_set:
+        return None
+
+    func_map = kb.allele_function.get(gene, {})
+    func = func_map.get(star, "normal") if star else "normal"
+    return gene, star or "", rsid, func
+
+
+def _make_detected(
+    v: Variant, site: Tuple[str, str, str, str], gt_raw: str, is_variant: bool,
+) -> DetectedVariant:
+    gene, star, rsid, func = site
+    return DetectedVariant(
+        gene=gene,
+        star_allele=star,
+        rsid=rsid,
+        chrom=v.chrom,
+        pos=v.pos,
+        ref=v.ref,
+        alt=v.alt,
+        genotype=gt_raw,
+        is_variant=is_variant,
+        function=func,
+        annotated=bool(v.star_allele),
+    )
+
+
+class _VariantExtractor:
     """
-    Scan every variant in the VCF and identify pharmacogenomically relevant ones.
-    Uses INFO GENE/STAR tags when available, otherwise falls back to rsID lookup.
+    One-pass extraction of one sample's pharmacogenomic rows, grouped by
+    gene in :attr:`by_gene`.  The sample's column is located once per
+    file; a row whose genotypes don't line up with the header falls back
+    to a lookup by name.  With no *sample* the first column is used.
+    """
+
+    __slots__ = ("kb", "sample", "slot", "by_gene")
+
+    def __init__(self, kb: KnowledgeBase, samples: Sequence[str], sample: Optional[str]):
+        self.kb = kb
+        self.sample = sample
+        if sample is None:
+            self.slot: Optional[int] = 0
+        else:
+            self.slot = samples.index(sample) if sample in samples else None
+        self.by_gene: Dict[str, List[DetectedVariant]] = {}
+
+    def add(self, v: Variant) -> None:
+        """Classify *v* and keep it if it is pharmacogenomically relevant."""
+        site = _classify_row(v, self.kb)
+        if site is None:
+            return
+        g = self._genotype(v)
+        if g is None:
+            detected = _make_detected(v, site, "0/0", False)
+        else:
+            detected = _make_detected(v, site, g.raw, g.is_variant)
+        by_gene = self.by_gene
+        if site[0] in by_gene:
+            by_gene[site[0]].append(detected)
+        else:
+            by_gene[site[0]] = [detected]
+
+    def _genotype(self, v: Variant) -> Optional[SampleGenotype]:
+        slot = self.slot
+        if slot is None:
+            return None
+        genotypes = v.genotypes
+        if slot < len(genotypes):
+            g = genotypes[slot]
+            if self.sample is None or g.sample == self.sample:
+                return g
+        return v.genotype_for(self.sample) if self.sample else None
+
+
+def _extract_pharmacogenomic_variants(
+    vcf: VCFFile, sample: Optional[str], kb: KnowledgeBase,
+) -> Dict[str, List[DetectedVariant]]:
+    """
+    Scan every variant in the VCF and return the pharmacogenomically
+    relevant ones, grouped by gene.
     """
     if sample is None and vcf.samples:
         sample = vcf.samples[0]
 
-    detected: List[DetectedVariant] = []
-
+    extractor = _VariantExtractor(kb, vcf.samples, sample)
     for v in vcf.variants:
-        gene = v.gene
-        star = v.star_allele
-        rsid = v.rsid or ""
-
-        # Fallback: look up by rsID if GENE/STAR not in INFO
-        if (not gene or not star) and rsid:
-            # Handle compound rsIDs (e.g. "rs123;chrX_456_A_G;rs123")
-            for rs_part in rsid.split(";"):
-                rs_part = rs_part.strip()
-                if rs_part in RSID_TO_ALLELE:
-                    gene, star = RSID_TO_ALLELE[rs_part]
-                    break
-
-        if not gene or gene.upper() not in [g.upper() for g in KNOWN_GENES]:
-            continue
+        extractor.add(v)
+    return extractor.by_gene
 
-        # Get genotype for the target sample
-        gt_raw = "0/0"
-        is_variant = False
-        if sample:
-            for g in v.genotypes:
-                if g.sample == sample:
-                    gt_raw = g.raw
-                    is_variant = g.is_variant
-                    break
-        elif v.genotypes:
-            gt_raw = v.genotypes[0].raw
-            is_variant = v.genotypes[0].is_variant
-
-        func_map = ALLELE_FUNCTION.get(gene.upper(), {})
-        func = func_map.get(star, "normal") if star else "normal"
-
-        detected.append(DetectedVariant(
-            gene=gene.upper() if gene else "",
-            star_allele=star or "",
-            rsid=rsid,
-            chrom=v.chrom,
-            pos=v.pos,
-            ref=v.ref,
-            alt=v.alt,
-            genotype=gt_raw,
-            is_variant=is_variant,
-            function=func,
-        ))
 
-    return detected
+def _deferring_rows(caller, rows, stars: List[str], annotated: List[bool]) -> Tuple[list, List[bool]]:
+    """
+    The caller's per-row variant mapping, and per row whether a variant
+    call there keeps the gene on the single-site path: the row's star
+    allele came from an INFO STAR tag (the annotation wins, as in
+    :func:`_classify_row`), or the caller cannot place it.
+    """
+    placed = caller.row_variants([(v.chrom, v.pos, v.ref, v.alt, v.rsid or "") for v in rows])
+    return placed, [
+        tagged or (bool(star) and not hits)
+        for hits, star, tagged in zip(placed, stars, annotated)
+    ]
 
 
-def _group_by_gene(variants: List[DetectedVariant]) -> Dict[str, List[DetectedVariant]]:
-    grouped: Dict[str, List[DetectedVariant]] = {}
-    for v in variants:
-        grouped.setdefault(v.gene, []).append(v)
-    return grouped
+def _call_star_alleles(gene: str, variants: List[DetectedVariant], kb: KnowledgeBase) -> Optional[StarCall]:
+    """
+    Multi-site diplotype call for *gene* from the sample's rows there, or
+    None to keep the single-site path (no caller for the gene, or see
+    :func:`_deferring_rows`).
+    """
+    caller = kb.star_callers.get(gene)
+    if caller is None:
+        return None
+    placed, defer = _deferring_rows(
+        caller, variants, [v.star_allele for v in variants], [v.annotated for v in variants],
+    )
+    if any(v.is_variant and d for v, d in zip(variants, defer)):
+        return None
+    sites = [(v.chrom, v.pos, v.ref, v.alt, v.rsid) for v in variants]
+    return caller.call(sites, [v.genotype for v in variants], placed)
 
 
-def _build_clinical_explanation(
-    drug: str,
-    interaction: DrugGeneInteraction,
-    phenotype: str,
-    variants: List[DetectedVariant],
-) -> str:
-    """Build a deterministic clinical explanation with variant citations."""
+def _variant_citations(variants: List[DetectedVariant]) -> str:
+    """The "Detected variant(s): ..." lead of a template explanation, or ""."""
     variant_citations = []
     for v in variants:
         if v.is_variant:
@@ -321,13 +407,20 @@ def _build_clinical_explanation(
                 f"{v.gene} {v.star_allele} ({v.rsid}, {v.chrom}:{v.pos} "
                 f"{v.ref}>{','.join(v.alt)}, genotype {v.genotype})"
             )
+    if not variant_citations:
+        return ""
+    return "Detected variant(s): " + "; ".join(variant_citations) + ". "
 
-    citations_text = ""
-    if variant_citations:
-        citations_text = "Detected variant(s): " + "; ".join(variant_citations) + ". "
 
+def _build_clinical_explanation(
+    drug: str,
+    interaction: DrugGeneInteraction,
+    phenotype: str,
+    variants: List[DetectedVariant],
+) -> str:
+    """Build a deterministic clinical explanation with variant citations."""
     explanation = (
-        f"{citations_text}"
+        f"{_variant_citations(variants)}"
         f"The patient is classified as a {phenotype} for {interaction.gene}. "
         f"{interaction.mechanism} "
         f"Based on CPIC guidelines (evidence level {interaction.cpic_level}): "
@@ -340,24 +433,125 @@ def _build_clinical_explanation(
 # LLM explanation generation (optional)
 # ---------------------------------------------------------------------------
 
+# Per-drug explanations run on one process-wide pool, so at most
+# LLM_MAX_CONCURRENCY calls are in flight across all requests; an analysis
+# waits LLM_DEADLINE_S for its calls and keeps the template for the rest
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_DEADLINE_S = float(os.environ.get("LLM_DEADLINE_S", "20"))
+_LLM_TIMEOUT_S = 30.0
+
+_llm_pool: Optional[ThreadPoolExecutor] = None
+_llm_pool_lock = threading.Lock()
+
+
+def _llm_api_key() -> Optional[str]:
+    return (
+        os.environ.get("GROQ_API_KEY")
+        or os.environ.get("OPENAI_API_KEY")
+        or os.environ.get("LLM_API_KEY")
+    )
+
+
+def llm_enabled() -> bool:
+    """Whether per-drug explanations are requested from an LLM."""
+    return bool(_llm_api_key())
+
+
+def _llm_executor() -> ThreadPoolExecutor:
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            _llm_pool = ThreadPoolExecutor(max(1, LLM_MAX_CONCURRENCY), thread_name_prefix="llm")
+        return _llm_pool
+
+
+def _generate_llm_explanations(jobs: List[tuple], deadline: float = LLM_DEADLINE_S) -> List[Optional[str]]:
+    """
+    :func:`_generate_llm_explanation` for each argument tuple in *jobs*.
+    Returns the explanations in order, None for a call that failed or was
+    not back within *deadline* seconds (see :func:`_iter_llm_explanations`).
+    """
+    results: List[Optional[str]] = [None] * len(jobs)
+    for i, text in _iter_llm_explanations(jobs, deadline):
+        results[i] = text
+    return results
+
+
+def _iter_llm_explanations(jobs: List[tuple], deadline: float = LLM_DEADLINE_S) -> Iterator[Tuple[int, str]]:
+    """
+    Yield ``(index into jobs, explanation)`` as each explanation becomes
+    available: cached ones straight away, the rest as their concurrent
+    calls on the shared pool return.  Calls that fail are skipped; after
+    *deadline* seconds (or when the iterator is closed) queued calls are
+    cancelled and running ones are left to time out.
+    """
+    api_key = _llm_api_key()
+    if not jobs or not api_key:
+        return
+    timeout = min(_LLM_TIMEOUT_S, deadline)
+    pool = _llm_executor()
+
+    futures = {}
+    try:
+        for i, job in enumerate(jobs):
+            url, body = _explanation_request(*job)
+            key = llm_cache.cache_key("explanation", url, body)
+            cached = llm_cache.get(key)
+            if cached is not None:
+                yield i, cached
+            else:
+                futures[pool.submit(_post_explanation, job[0], url, body, key, api_key, timeout)] = i
+        if not futures:
+            return
+
+        for f in as_completed(futures, timeout=deadline):
+            try:
+                text = f.result()
+            except Exception as e:
+                print(f"[LLM] Explanation for {jobs[futures[f]][0]} failed: {type(e).__name__}: {e}")
+                continue
+            if text is not None:
+                yield futures[f], text
+    except TimeoutError:
+        pending = sum(not f.done() for f in futures)
+        print(f"[LLM] {pending} of {len(futures)} explanation(s) missed the {deadline:g}s deadline — using templates")
+    finally:
+        for f in futures:
+            f.cancel()
+
+
 def _generate_llm_explanation(
     drug: str,
     interaction: DrugGeneInteraction,
     phenotype: str,
     variants: List[DetectedVariant],
+    *,
+    timeout: float = _LLM_TIMEOUT_S,
 ) -> Optional[str]:
     """
-    Call an OpenAI-compatible API to generate a rich clinical explanation.
+    Call an OpenAI-compatible API to generate a rich clinical explanation,
+    unless the same request is in :mod:`llm_cache`.
     Returns None if no API key is set or the call fails.
     """
-    api_key = (
-        os.environ.get("GROQ_API_KEY")
-        or os.environ.get("OPENAI_API_KEY")
-        or os.environ.get("LLM_API_KEY")
-    )
+    api_key = _llm_api_key()
     if not api_key:
         return None
 
+    url, body = _explanation_request(drug, interaction, phenotype, variants)
+    key = llm_cache.cache_key("explanation", url, body)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    return _post_explanation(drug, url, body, key, api_key, timeout)
+
+
+def _explanation_request(
+    drug: str,
+    interaction: DrugGeneInteraction,
+    phenotype: str,
+    variants: List[DetectedVariant],
+) -> Tuple[str, bytes]:
+    """(URL, JSON body) of the chat completion request for one explanation."""
     base_url = os.environ.get("LLM_BASE_URL", "https://api.groq.com/openai/v1")
     model = os.environ.get("LLM_MODEL", "llama-3.3-70b-versatile")
 
@@ -393,47 +587,42 @@ def _generate_llm_explanation(
         f"citations and biological mechanisms for this drug-gene interaction."
     )
 
-    try:
-        import urllib.request
-        import urllib.error
-
-        request_body = json.dumps({
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            "temperature": 0.3,
-            "max_tokens": 500,
-        }).encode("utf-8")
-
-        req = urllib.request.Request(
-            f"{base_url}/chat/completions",
-            data=request_body,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-                "User-Agent": "Pharmaguard/1.0",
-            },
-            method="POST",
-        )
+    request_body = json.dumps({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": 0.3,
+        "max_tokens": 500,
+    }).encode("utf-8")
+    return f"{base_url}/chat/completions", request_body
 
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-            content = data["choices"][0]["message"]["content"].strip()
-            print(f"[LLM] ✓ Generated explanation for {drug} ({model}, {len(content)} chars)")
-            return content
 
-    except Exception as e:
+def _post_explanation(drug: str, url: str, body: bytes, key: str, api_key: str, timeout: float) -> Optional[str]:
+    """Send one explanation request and cache the reply under *key*; None on failure."""
+    try:
+        content = llm_client.complete(url, body, api_key, kind="explanation", timeout=timeout)
+    except llm_client.LLMError as e:
         print(f"[LLM] Explanation generation failed: {e}")
         return None
 
+    print(f"[LLM] ✓ Generated explanation for {drug} ({len(content)} chars)")
+    llm_cache.put(key, content)
+    return content
+
 
 # ---------------------------------------------------------------------------
 # Main analysis function
 # ---------------------------------------------------------------------------
 
-def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> AnalysisResult:
+def analyze(
+    vcf: VCFFile,
+    drugs: List[str],
+    sample: Optional[str] = None,
+    *,
+    kb: Optional[KnowledgeBase] = None,
+) -> AnalysisResult:
     """
     Run pharmacogenomic analysis.
 
@@ -445,6 +634,11 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
         Drug names to assess (e.g. ["codeine", "warfarin", "simvastatin"]).
     sample : str, optional
         Sample/patient ID to analyze. Defaults to first sample in VCF.
+    kb : KnowledgeBase, optional
+        Knowledge base to use throughout (default: the current one).  Its
+        version is reported as ``knowledgeBaseVersion`` in the summary.
+        Only the genes of *drugs* are screened, and only their tables are
+        loaded (every known gene when *drugs* is empty).
 
     Returns
     -------
@@ -452,18 +646,415 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
         Complete analysis with gene phenotypes, drug risks, and explanations.
     """
     t_analysis_start = time.perf_counter()
+    kb = (kb or current()).for_drugs(drugs)
     patient_id = sample or (vcf.samples[0] if vcf.samples else "UNKNOWN")
 
     # Step 1: Extract all pharmacogenomic variants
-    all_variants = _extract_pharmacogenomic_variants(vcf, sample)
-    gene_variants = _group_by_gene(all_variants)
+    gene_variants = _extract_pharmacogenomic_variants(vcf, sample, kb)
+
+    return _assess(
+        patient_id, gene_variants, drugs, kb,
+        t_analysis_start=t_analysis_start,
+        vcf_variant_count=len(vcf.variants),
+    )
+
+
+def analyze_stream(
+    source: VCFSource,
+    drugs: List[str],
+    sample: Optional[str] = None,
+    *,
+    targeted: bool = True,
+    workers: int = 0,
+    kb: Optional[KnowledgeBase] = None,
+) -> AnalysisResult:
+    """
+    Run pharmacogenomic analysis directly from a VCF path, bytes or handle.
+
+    Rows are streamed through :class:`parser.VCFReader` and only the
+    pharmacogenomic hits are kept, so peak memory depends on the number of
+    PGx variants rather than on the size of the upload.  With *targeted*
+    (the default) rows outside the PGx target sites are skipped before
+    field parsing.  With *workers* > 1 a path or bytes source is scanned in
+    a process pool (see :mod:`parallel_parser`).  Other parameters and the
+    result are as for :func:`analyze`.
+    """
+    kb = (kb or current()).for_drugs(drugs)
+    sample, gene_variants, row_count, parse_time_ms = _read_sample(source, sample, kb, targeted, workers)
+    result = _assess(
+        sample or "UNKNOWN", gene_variants, drugs, kb,
+        t_analysis_start=time.perf_counter(),
+        vcf_variant_count=row_count,
+    )
+    result._parse_time_ms = parse_time_ms
+    return result
+
+
+def analyze_events(
+    source: VCFSource,
+    drugs: List[str],
+    sample: Optional[str] = None,
+    *,
+    targeted: bool = True,
+    workers: int = 0,
+    kb: Optional[KnowledgeBase] = None,
+) -> Iterator[Tuple[str, dict]]:
+    """
+    :func:`analyze_stream`, reported piece by piece as it completes.
+
+    The file is read before this returns (so parse errors are raised
+    here).  The returned iterator yields ``(event, payload)`` pairs; the
+    payloads are the parts of :meth:`AnalysisResult.to_dict`:
+
+      - ``("genes", {"patient_id", "timestamp", "genes", "_parse_time_ms"})``
+        once phenotypes are inferred
+      - ``("result", {"index", ...})`` for each element of ``results``,
+        with the template explanation
+      - ``("explanation", {"index", ...})`` for an element whose LLM
+        explanation arrived (replaces the earlier ``result`` entry)
+      - ``("summary", summary)`` last, plus ``_llm_fallbacks``: how many
+        LLM explanations fell back to the template
+    """
+    kb = (kb or current()).for_drugs(drugs)
+    sample, gene_variants, row_count, parse_time_ms = _read_sample(source, sample, kb, targeted, workers)
+    return _iter_events(sample or "UNKNOWN", gene_variants, drugs, kb, row_count, parse_time_ms)
+
+
+def _iter_events(
+    patient_id: str,
+    gene_variants: Dict[str, List[DetectedVariant]],
+    drugs: List[str],
+    kb: KnowledgeBase,
+    row_count: int,
+    parse_time_ms: float,
+) -> Iterator[Tuple[str, dict]]:
+    t_start = time.perf_counter()
+    timestamp = datetime.now(timezone.utc).isoformat()
+    gene_phenotypes, phenotype_map, diplotype_map = _assess_genes(gene_variants, kb)
+    yield "genes", {
+        "patient_id": patient_id,
+        "timestamp": timestamp,
+        "genes": [g.to_dict() for g in gene_phenotypes],
+        "_parse_time_ms": parse_time_ms,
+    }
+
+    drug_results, llm_jobs = _assess_drugs(
+        gene_variants, drugs, kb, phenotype_map, diplotype_map, use_llm=True,
+    )
+    result = AnalysisResult(
+        patient_id=patient_id,
+        genes=gene_phenotypes,
+        drug_results=drug_results,
+        kb_version=kb.version,
+        _parse_time_ms=parse_time_ms,
+        _analysis_time_ms=(time.perf_counter() - t_start) * 1000,
+        _vcf_variant_count=row_count,
+    )
+    for i, dr in enumerate(drug_results):
+        yield "result", {"index": i, **result.drug_entry(dr, timestamp)}
+
+    generated = 0
+    for j, text in _iter_llm_explanations([job for _, job in llm_jobs]):
+        i = llm_jobs[j][0]
+        drug_results[i].clinical_explanation = text
+        drug_results[i].llm_used = True
+        generated += 1
+        yield "explanation", {"index": i, **result.drug_entry(drug_results[i], timestamp)}
+
+    summary = _summarize(patient_id, drugs, gene_phenotypes, drug_results, kb)
+    yield "summary", {**summary, "_llm_fallbacks": len(llm_jobs) - generated}
+
+
+def _read_sample(
+    source: VCFSource,
+    sample: Optional[str],
+    kb: KnowledgeBase,
+    targeted: bool,
+    workers: int,
+) -> Tuple[Optional[str], Dict[str, List[DetectedVariant]], int, float]:
+    """
+    Step 1 for one sample: (sample, PGx rows by gene, rows read, parse ms).
+    *sample* defaults to the file's first.
+    """
+    t_parse_start = time.perf_counter()
+    targets = kb.target_sites if targeted else None
+    if workers > 1:
+        reader = ParallelVCFReader(source, targets=targets, workers=workers)
+    else:
+        reader = VCFReader(source, targets=targets)
+    with reader:
+        if sample is None and reader.samples:
+            sample = reader.samples[0]
+        extractor = _VariantExtractor(kb, reader.samples, sample)
+        for v in reader:
+            extractor.add(v)
+        row_count = reader.rows_read
+    return sample, extractor.by_gene, row_count, (time.perf_counter() - t_parse_start) * 1000
+
+
+def analyze_regions(
+    path: str,
+    drugs: List[str],
+    sample: Optional[str] = None,
+    *,
+    build_index: bool = True,
+    kb: Optional[KnowledgeBase] = None,
+) -> AnalysisResult:
+    """
+    Run pharmacogenomic analysis on a bgzipped VCF stored on disk, reading
+    only the pharmacogene loci through its tabix/CSI index.
+
+    The gene regions are GRCh38 coordinates (see
+    :attr:`KnowledgeBase.gene_regions`), so this is only valid for
+    GRCh38-aligned files; use :func:`analyze_stream` otherwise.  When the
+    file has no index and *build_index* is True one is built and saved next
+    to it.  Other parameters and the result are as for :func:`analyze`.
+    """
+    t_parse_start = time.perf_counter()
+    kb = (kb or current()).for_drugs(drugs)
+
+    with IndexedVCFReader(path, build_index=build_index, targets=kb.target_sites) as reader:
+        if sample is None and reader.samples:
+            sample = reader.samples[0]
+        extractor = _VariantExtractor(kb, reader.samples, sample)
+        for chrom, start, end in _merge_regions(reader, kb.gene_regions.values()):
+            for v in reader.fetch(chrom, start, end):
+                extractor.add(v)
+        row_count = reader.record_count
+        if row_count is None:
+            row_count = reader.rows_read
+
+    t_parse_end = time.perf_counter()
+    result = _assess(
+        sample or "UNKNOWN", extractor.by_gene, drugs, kb,
+        t_analysis_start=t_parse_end,
+        vcf_variant_count=row_count,
+    )
+    result._parse_time_ms = (t_parse_end - t_parse_start) * 1000
+    return result
+
+
+def analyze_cohort(
+    source: VCFSource,
+    drugs: List[str],
+    samples: Optional[Iterable[str]] = None,
+    *,
+    targeted: bool = True,
+    use_llm: bool = False,
+    kb: Optional[KnowledgeBase] = None,
+) -> Iterator[AnalysisResult]:
+    """
+    Analyse every sample of a multi-sample VCF from a single pass.
+
+    The file is read once (before this returns, so parse errors are raised
+    here): pharmacogenomic rows are classified once and their calls are
+    packed into a :class:`genotype_matrix.GenotypeMatrix`.  The returned
+    iterator then yields one :class:`AnalysisResult` per sample, in file
+    order, building each lazily from that sample's matrix column.
+
+    Parameters
+    ----------
+    source : str | bytes | file handle
+        As for :func:`analyze_stream`.
+    drugs : list of str
+        Drug names evaluated for every sample.
+    samples : list of str, optional
+        Restrict to these samples (default: all).
+    targeted : bool
+        Skip non-PGx rows before parsing (see :func:`analyze_stream`).
+    use_llm : bool
+        Request per-drug LLM explanations.  Off by default — one call per
+        sample per drug does not scale to cohorts.
+    kb : KnowledgeBase, optional
+        As for :func:`analyze`; every sample is assessed with the same one.
+    """
+    t_parse_start = time.perf_counter()
+    kb = (kb or current()).for_drugs(drugs)
+    rows: List[Variant] = []
+    sites: List[Tuple[str, str, str, str]] = []
+
+    targets = kb.target_sites if targeted else None
+    with VCFReader(source, targets=targets, samples=samples) as reader:
+        for v in reader:
+            site = _classify_row(v, kb)
+            if site is not None:
+                rows.append(v)
+                sites.append(site)
+        row_count = reader.rows_read
+        matrix = GenotypeMatrix.from_variants(rows, reader.samples)
+
+    for v in rows:
+        v.genotypes = []                  # the matrix holds the calls now
+    parse_time_ms = (time.perf_counter() - t_parse_start) * 1000
+
+    return _iter_cohort(matrix, rows, sites, drugs, kb, row_count, parse_time_ms, use_llm)
+
+
+def _iter_cohort(
+    matrix: GenotypeMatrix,
+    rows: List[Variant],
+    sites: List[Tuple[str, str, str, str]],
+    drugs: List[str],
+    kb: KnowledgeBase,
+    row_count: int,
+    parse_time_ms: float,
+    use_llm: bool,
+) -> Iterator[AnalysisResult]:
+    is_variant = matrix.is_variant()
+    star_calls = _call_cohort(matrix, rows, sites, is_variant, kb)
+    gene_rows: Dict[str, List[int]] = {}
+    for i, site in enumerate(sites):
+        gene_rows.setdefault(site[0], []).append(i)
+    for col, sample in enumerate(matrix.samples):
+        t_start = time.perf_counter()
+        calls = matrix.gt_strings(sample)
+        sample_is_variant = is_variant[:, col].tolist()
+        gene_variants = {
+            gene: [_make_detected(rows[i], sites[i], calls[i], sample_is_variant[i]) for i in idx]
+            for gene, idx in gene_rows.items()
+        }
+        result = _assess(
+            sample, gene_variants, drugs, kb,
+            t_analysis_start=t_start,
+            vcf_variant_count=row_count,
+            use_llm=use_llm,
+            star_calls={gene: calls[col] for gene, calls in star_calls.items()},
+        )
+        result._parse_time_ms = parse_time_ms
+        yield result
+
+
+def _call_cohort(
+    matrix: GenotypeMatrix,
+    rows: List[Variant],
+    sites: List[Tuple[str, str, str, str]],
+    is_variant,
+    kb: KnowledgeBase,
+) -> Dict[str, List[Optional[StarCall]]]:
+    """
+    Gene → per-sample multi-site calls, each gene's samples scored in one
+    vectorized pass; None where :func:`_call_star_alleles` would give None.
+    """
+    phased = matrix.phased
+    out: Dict[str, List[Optional[StarCall]]] = {}
+    for gene, caller in kb.star_callers.items():
+        idx = [i for i, site in enumerate(sites) if site[0] == gene]
+        gene_rows = [rows[i] for i in idx]
+        placed, defer = _deferring_rows(
+            caller, gene_rows, [sites[i][1] for i in idx], [bool(v.star_allele) for v in gene_rows],
+        )
+        calls: List[Optional[StarCall]] = list(caller.call_many(
+            [(v.chrom, v.pos, v.ref, v.alt, v.rsid or "") for v in gene_rows],
+            matrix.alleles[idx], phased[idx], placed,
+        ))
+        deferring = [i for i, d in zip(idx, defer) if d]
+        if deferring:
+            for col in is_variant[deferring].any(axis=0).nonzero()[0].tolist():
+                calls[col] = None
+        out[gene] = calls
+    return out
+
+
+def _merge_regions(reader: IndexedVCFReader, regions) -> List[tuple]:
+    """Sort regions into file order and merge overlaps so no row is read twice."""
+    keyed = []
+    for chrom, start, end in regions:
+        tid = reader.index.tid(chrom)
+        if tid is not None:
+            keyed.append((tid, start, end, reader.index.names[tid]))
+    merged: List[list] = []
+    for tid, start, end, name in sorted(keyed):
+        if merged and merged[-1][0] == tid and start <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([tid, start, end, name])
+    return [(name, start, end) for _, start, end, name in merged]
+
+
+def _outcome_result(outcome: InteractionOutcome, **patient: Any) -> DrugResult:
+    """A :class:`DrugResult` from a plan outcome plus the patient-specific fields."""
+    patient.setdefault("clinical_explanation", outcome.explanation)
+    return DrugResult(
+        drug=outcome.drug,
+        risk=outcome.risk,
+        gene=outcome.gene,
+        phenotype=outcome.phenotype,
+        recommendation=outcome.recommendation,
+        mechanism=outcome.mechanism,
+        cpic_level=outcome.cpic_level,
+        guidelines_url=outcome.guidelines_url,
+        **patient,
+    )
+
+
+def _assess(
+    patient_id: str,
+    gene_variants: Dict[str, List[DetectedVariant]],
+    drugs: List[str],
+    kb: KnowledgeBase,
+    *,
+    t_analysis_start: float,
+    vcf_variant_count: int,
+    use_llm: bool = True,
+    star_calls: Optional[Dict[str, Optional[StarCall]]] = None,
+) -> AnalysisResult:
+    """
+    Steps 2-4 of the analysis: phenotypes, drug risks and summary, from
+    the sample's pharmacogenomic rows grouped by gene.
+    With *use_llm* True, per-drug LLM explanations are requested
+    concurrently (see :func:`_generate_llm_explanations`); otherwise, and
+    for any call that fails or misses the deadline, the template is used.
+    *star_calls* holds multi-site calls already made (cohort mode); genes
+    missing from it are called here.
+    """
+    gene_phenotypes, phenotype_map, diplotype_map = _assess_genes(gene_variants, kb, star_calls)
+    drug_results, llm_jobs = _assess_drugs(
+        gene_variants, drugs, kb, phenotype_map, diplotype_map, use_llm=use_llm,
+    )
+
+    # LLM explanations replace the templates, fetched concurrently
+    fallbacks = 0
+    if llm_jobs:
+        explanations = _generate_llm_explanations([job for _, job in llm_jobs])
+        for (i, _), text in zip(llm_jobs, explanations):
+            if text is not None:
+                drug_results[i].clinical_explanation = text
+                drug_results[i].llm_used = True
+            else:
+                fallbacks += 1
+
+    t_analysis_end = time.perf_counter()
+
+    return AnalysisResult(
+        patient_id=patient_id,
+        genes=gene_phenotypes,
+        drug_results=drug_results,
+        summary=_summarize(patient_id, drugs, gene_phenotypes, drug_results, kb),
+        kb_version=kb.version,
+        _analysis_time_ms=(t_analysis_end - t_analysis_start) * 1000,
+        _vcf_variant_count=vcf_variant_count,
+        _llm_fallbacks=fallbacks,
+    )
+
+
+def _assess_genes(
+    gene_variants: Dict[str, List[DetectedVariant]],
+    kb: KnowledgeBase,
+    star_calls: Optional[Dict[str, Optional[StarCall]]] = None,
+) -> Tuple[List[GenePhenotype], Dict[str, str], Dict[str, str]]:
+    """Step 2: gene phenotypes, plus phenotype and diplotype by gene."""
+    star_calls = dict(star_calls or {})
 
     # Step 2: Infer phenotype for each gene
     gene_phenotypes: List[GenePhenotype] = []
     phenotype_map: Dict[str, str] = {}
+    diplotype_map: Dict[str, str] = {}
 
-    for gene in KNOWN_GENES:
+    for gene in kb.known_genes:
         variants = gene_variants.get(gene, [])
+        if gene not in star_calls:
+            star_calls[gene] = _call_star_alleles(gene, variants, kb)
+        call = star_calls[gene]
         # Build allele info for phenotype inference
         allele_info = []
         for v in variants:
@@ -473,15 +1064,25 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
                     "genotype": v.genotype,
                 })
 
-        phenotype = infer_phenotype(gene, allele_info)
+        if call is not None:
+            phenotype = kb.phenotype_for_pair(gene, call.allele1, call.allele2)
+            diplotype_map[gene] = call.diplotype
+        else:
+            phenotype = kb.infer_phenotype(gene, allele_info)
         phenotype_map[gene] = phenotype
 
         # Activity description
         if allele_info:
             allele_descs = [f"{a['star_allele']} ({a['genotype']})" for a in allele_info]
             activity_desc = f"Detected: {', '.join(allele_descs)}"
-        else:
+        elif call is None or call.diplotype == "*1/*1":
             activity_desc = "No actionable variants detected — assumed wild-type (*1/*1)"
+        else:
+            activity_desc = "No actionable variants detected"
+        if call is not None and call.diplotype != "*1/*1":
+            activity_desc += f" — called {call.diplotype} from all defining sites"
+        if call is not None and call.mismatches:
+            activity_desc += f" ({call.mismatches} site genotype(s) not explained)"
 
         gene_phenotypes.append(GenePhenotype(
             gene=gene,
@@ -490,78 +1091,74 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
             activity_score_description=activity_desc,
         ))
 
-    # Step 3: Assess each drug
-    drug_results: List[DrugResult] = []
+    return gene_phenotypes, phenotype_map, diplotype_map
 
-    for drug in drugs:
-        drug_clean = drug.strip().lower()
-        if not drug_clean:
-            continue
 
-        relevant_genes = get_genes_for_drug(drug_clean)
-
-        if not relevant_genes:
-            drug_results.append(DrugResult(
-                drug=drug_clean,
-                risk=UNKNOWN,
-                gene="",
-                phenotype="",
-                recommendation=f"No pharmacogenomic data available for {drug_clean} in our knowledge base.",
-                mechanism="",
-                clinical_explanation=f"The drug '{drug_clean}' is not currently in our pharmacogenomic database. "
-                    f"This does not mean it is safe — consult standard prescribing guidelines.",
-            ))
+def _assess_drugs(
+    gene_variants: Dict[str, List[DetectedVariant]],
+    drugs: List[str],
+    kb: KnowledgeBase,
+    phenotype_map: Dict[str, str],
+    diplotype_map: Dict[str, str],
+    *,
+    use_llm: bool,
+) -> Tuple[List[DrugResult], List[Tuple[int, tuple]]]:
+    """
+    Step 3: one :class:`DrugResult` per drug-gene pair, with template
+    explanations, and the LLM explanation jobs to run for them (with
+    *use_llm*).  Genes without a multi-site call get their diplotype
+    added to *diplotype_map*.
+    """
+    # Step 3: Assess each drug through the knowledge base's compiled plan
+    drug_results: List[DrugResult] = []
+    cited: Dict[str, Tuple[List[DetectedVariant], str]] = {}
+    llm_jobs: List[Tuple[int, tuple]] = []    # (drug_results index, explanation args)
+
+    for plan in kb.interaction_plan.compile(drugs):
+        if plan.unknown is not None:
+            drug_results.append(_outcome_result(plan.unknown))
             continue
 
-        for gene in relevant_genes:
+        for i, gene in enumerate(plan.genes):
             phenotype = phenotype_map.get(gene, "Normal Metabolizer")
+            outcome = plan.outcome(i, phenotype)
+            if outcome.interaction is None:
+                drug_results.append(_outcome_result(outcome))
+                continue
+
+            # Per-gene parts, shared by every drug of the gene
             gene_vars = gene_variants.get(gene, [])
+            if gene not in cited:
+                variants = [v for v in gene_vars if v.is_variant]
+                cited[gene] = (variants, _variant_citations(variants))
+            variants, citations = cited[gene]
+            if gene not in diplotype_map:
+                # No multi-site call: built from the per-site alleles
+                diplotype_map[gene] = kb.build_diplotype(gene, [
+                    {"star_allele": v.star_allele, "genotype": v.genotype}
+                    for v in variants if v.star_allele
+                ])
+
+            if use_llm:
+                llm_jobs.append((len(drug_results), (plan.drug, outcome.interaction, phenotype, gene_vars)))
+            drug_results.append(_outcome_result(
+                outcome,
+                clinical_explanation=citations + outcome.explanation,
+                variants_cited=list(variants),
+                diplotype=diplotype_map[gene],
+            ))
+
+    return drug_results, llm_jobs
 
-            interaction = lookup_interaction(drug_clean, gene, phenotype)
-
-            # Build diplotype string using the knowledge base function
-            allele_info_for_diplo = [
-                {"star_allele": v.star_allele, "genotype": v.genotype}
-                for v in gene_vars if v.is_variant and v.star_allele
-            ]
-            diplotype = build_diplotype(gene, allele_info_for_diplo)
-
-            if interaction:
-                # Try LLM explanation first, fall back to template
-                llm_explanation = _generate_llm_explanation(
-                    drug_clean, interaction, phenotype, gene_vars
-                )
-                used_llm = llm_explanation is not None
-                clinical_explanation = llm_explanation or _build_clinical_explanation(
-                    drug_clean, interaction, phenotype, gene_vars
-                )
-
-                drug_results.append(DrugResult(
-                    drug=drug_clean,
-                    risk=interaction.risk,
-                    gene=gene,
-                    phenotype=phenotype,
-                    recommendation=interaction.recommendation,
-                    mechanism=interaction.mechanism,
-                    clinical_explanation=clinical_explanation,
-                    cpic_level=interaction.cpic_level,
-                    guidelines_url=interaction.guidelines_url,
-                    variants_cited=[v for v in gene_vars if v.is_variant],
-                    diplotype=diplotype,
-                    llm_used=used_llm,
-                ))
-            else:
-                drug_results.append(DrugResult(
-                    drug=drug_clean,
-                    risk=UNKNOWN,
-                    gene=gene,
-                    phenotype=phenotype,
-                    recommendation=f"No specific CPIC guideline found for {drug_clean} with {phenotype} {gene}.",
-                    mechanism="",
-                    clinical_explanation=f"The patient is classified as a {phenotype} for {gene}, "
-                        f"but no specific interaction data is available for {drug_clean} with this phenotype.",
-                ))
 
+def _summarize(
+    patient_id: str,
+    drugs: List[str],
+    gene_phenotypes: List[GenePhenotype],
+    drug_results: List[DrugResult],
+    kb: KnowledgeBase,
+) -> dict:
+    """Step 4: the ``summary`` block of the report."""
     # Step 4: Build summary
     risk_counts = {}
     for dr in drug_results:
@@ -571,7 +1168,7 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
         dr for dr in drug_results if dr.risk in (TOXIC, INEFFECTIVE)
     ]
 
-    summary = {
+    return {
         "patientId": patient_id,
         "drugsAnalyzed": len(drugs),
         "totalInteractions": len(drug_results),
@@ -582,15 +1179,5 @@ def analyze(vcf: VCFFile, drugs: List[str], sample: Optional[str] = None) -> Ana
             for a in critical_alerts
         ],
         "genesScreened": len(gene_phenotypes),
+        "knowledgeBaseVersion": kb.version,
     }
-
-    t_analysis_end = time.perf_counter()
-
-    return AnalysisResult(
-        patient_id=patient_id,
-        genes=gene_phenotypes,
-        drug_results=drug_results,
-        summary=summary,
-        _analysis_time_ms=(t_analysis_end - t_analysis_start) * 1000,
-        _vcf_variant_count=len(vcf.variants),
-    )
@@ -8,13 +8,17 @@ and returns pharmacogenomic risk assessments.
 from __future__ import annotations
 
 import base64
+import hmac
 import io
 import json
 import os
+import shutil
 import tempfile
+import threading
 import time
 import traceback
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
 # Load .env before anything else
@@ -30,7 +34,7 @@ try:
 except ImportError:
     HAS_TESSERACT = False
 
-from analyzer import analyze
+from analyzer import LLM_DEADLINE_S, analyze_cohort, analyze_events, analyze_stream, llm_enabled
 from bson import ObjectId
 
 # Import mock models helper logic if needed, but we mostly use raw dicts with Mongo
@@ -40,13 +44,16 @@ from compatibility import calculate_inheritance, generate_compatibility_summary
 
 # ── Database Init ──
 from database import db, init_db
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from groq import Groq
 from matcher import find_matches
-from parser import parse_vcf, parse_vcf_bytes
-from pgx_knowledgebase import KNOWN_GENES, get_all_drugs
+import jobs
+import llm_cache
+import llm_client
+import pgx_knowledgebase
+from pgx_knowledgebase import get_all_drugs
 from PIL import Image, ImageFilter, ImageOps
+from result_cache import DiskTier, MongoTier, ResultCache, cache_key, vcf_digest
 
 app = Flask(__name__)
 CORS(app)
@@ -54,15 +61,130 @@ CORS(app)
 # Max upload size: 50 MB
 app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024
 
+# Opt-in process-pool parsing for large uploads (0 = always serial)
+PARSE_WORKERS = int(os.environ.get("VCF_PARSE_WORKERS", "0"))
+PARALLEL_MIN_BYTES = int(os.environ.get("VCF_PARALLEL_MIN_BYTES", str(16 * 1024 * 1024)))
+
+
+def _build_result_cache() -> ResultCache:
+    """
+    In-memory LRU of /analyze responses (RESULT_CACHE_SIZE entries, 0 = off),
+    written through to RESULT_CACHE_DIR (at most RESULT_CACHE_MAX_FILES
+    files) or, with RESULT_CACHE_MONGO=1, to the ``analysis_cache``
+    collection.  Entries expire after RESULT_CACHE_TTL_S (default 1 day,
+    0 = never) in every tier.
+    """
+    ttl = float(os.environ.get("RESULT_CACHE_TTL_S", str(24 * 3600))) or None
+    tier = None
+    cache_dir = os.environ.get("RESULT_CACHE_DIR", "")
+    if cache_dir:
+        tier = DiskTier(cache_dir, ttl=ttl,
+                        max_entries=int(os.environ.get("RESULT_CACHE_MAX_FILES", "10000")) or None)
+    elif os.environ.get("RESULT_CACHE_MONGO", "") == "1" and db is not None:
+        tier = MongoTier(db.analysis_cache, ttl=ttl)
+    return ResultCache(int(os.environ.get("RESULT_CACHE_SIZE", "256")), tier=tier, ttl=ttl)
+
+
+result_cache = _build_result_cache()
+
+
+def _job_store_kind() -> str:
+    """
+    Where job records live, from JOB_STORE: ``memory`` (default, single
+    process), ``sqlite`` (JOB_STORE_PATH) or ``mongo`` (the
+    ``analysis_jobs`` collection).
+    """
+    kind = os.environ.get("JOB_STORE", "memory")
+    if kind == "sqlite" or (kind == "mongo" and db is not None):
+        return kind
+    if kind != "memory":
+        print(f"[jobs] JOB_STORE={kind!r} unavailable, keeping jobs in memory")
+    return "memory"
+
+
+JOB_STORE_KIND = _job_store_kind()
+
+# A poll can land on any worker, so with several of them (WEB_CONCURRENCY,
+# which gunicorn also reads as its --workers default) async jobs need a
+# shared store; with the memory store ``async=true`` is refused
+WEB_WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+ASYNC_JOBS = JOB_STORE_KIND != "memory" or WEB_WORKERS <= 1
+if not ASYNC_JOBS:
+    print(f"[jobs] WARNING: {WEB_WORKERS} workers share no job store — async=true is disabled; "
+          f"set JOB_STORE=sqlite or JOB_STORE=mongo to enable it")
+
+
+def _build_job_store():
+    if JOB_STORE_KIND == "sqlite":
+        return jobs.SqliteJobStore(os.environ.get(
+            "JOB_STORE_PATH", str(Path(__file__).resolve().parent / "data" / "jobs.sqlite")))
+    if JOB_STORE_KIND == "mongo":
+        return jobs.MongoJobStore(db.analysis_jobs)
+    return jobs.MemoryJobStore()
+
+
+def _build_job_runner(store) -> jobs.JobRunner:
+    """Background runner for ``/analyze?async=true``, over *store*."""
+    return jobs.JobRunner(
+        store,
+        workers=int(os.environ.get("JOB_WORKERS", "2")),
+        max_queue=int(os.environ.get("JOB_QUEUE_SIZE", "32")),
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "3")),
+        retention=float(os.environ.get("JOB_RETENTION_S", "3600")),
+    )
+
+
+# Worker threads start on the first async request, not at import (so a
+# pre-forking server doesn't start them in its master process); polls
+# read the store and never start them
+_job_store = None
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+def job_store():
+    global _job_store
+    with _job_runner_lock:
+        if _job_store is None:
+            _job_store = _build_job_store()
+        return _job_store
+
+
+def job_runner() -> jobs.JobRunner:
+    global _job_runner
+    store = job_store()
+    with _job_runner_lock:
+        if _job_runner is None:
+            _job_runner = _build_job_runner(store)
+        return _job_runner
+
+# Knowledge-base hot reload: POST /admin/kb/reload needs ADMIN_TOKEN set,
+# KB_WATCH_INTERVAL > 0 polls data/tables/ and pgx_definitions.py for changes
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+KB_WATCH_INTERVAL = float(os.environ.get("KB_WATCH_INTERVAL", "0"))
+if KB_WATCH_INTERVAL > 0:
+    pgx_knowledgebase.start_watcher(KB_WATCH_INTERVAL)
+
+# KB_PREWARM=1 loads every CPIC table and fills the phenotype memo in a
+# background thread at import.  Off by default: each gunicorn worker
+# imports this module, and a request only loads the tables of the genes
+# its drugs need anyway
+if os.environ.get("KB_PREWARM", "0") == "1":
+    threading.Thread(target=pgx_knowledgebase.current().warm, name="kb-prewarm", daemon=True).start()
+
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
+# Patient summaries always go to Groq's OpenAI-compatible endpoint
+GROQ_CHAT_URL = os.environ.get("GROQ_BASE_URL", "https://api.groq.com").rstrip("/") + "/openai/v1/chat/completions"
+
 
 def summarize_results(results_dict):
     """
-    Use Groq (using Llama 3) to generate a simple-English summary for patients.
+    Use Groq (using Llama 3) to generate a simple-English summary for patients,
+    through the shared :mod:`llm_client`.
     """
     api_key = os.environ.get("GROQ_API_KEY")
     if not api_key:
@@ -70,10 +192,6 @@ def summarize_results(results_dict):
         return None
 
     try:
-        from groq import Groq
-
-        client = Groq(api_key=api_key)
-
         # Phenotype abbreviation map for the prompt
         pheno_map = {
             "URM": "Ultra-rapid Metabolizer",
@@ -134,19 +252,56 @@ RULES:
 - End with: "Always talk to your doctor before changing any medication."
 """
 
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=200,
-            temperature=0.5,
-        )
-        return response.choices[0].message.content.strip()
+        request = {
+            "model": "llama-3.3-70b-versatile",
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": 200,
+            "temperature": 0.5,
+        }
+        # Same findings, same summary: reuse a cached completion
+        body = json.dumps(request).encode("utf-8")
+        key = llm_cache.cache_key("summary", GROQ_CHAT_URL, body)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Bounded like the per-drug explanations, so a slow call can't stall the response
+        content = llm_client.complete(GROQ_CHAT_URL, body, api_key, kind="summary", timeout=LLM_DEADLINE_S)
+        llm_cache.put(key, content)
+        return content
 
     except Exception as e:
         print(f"LLM Summary failed: {e}")
         return None
 
 
+def _upload_stream(file_storage):
+    """
+    Return the binary stream of an uploaded file, or None if it is empty.
+    The parser reads from it directly, so the upload is never copied.
+    """
+    stream = file_storage.stream
+    if not stream.read(1):
+        return None
+    stream.seek(0)
+    return stream
+
+
+def _wants_async() -> bool:
+    """Whether the client asked for a background job (``async=true``)."""
+    value = request.args.get("async") or request.form.get("async") or ""
+    return value.lower() in ("1", "true", "yes")
+
+
+def _stream_size(stream) -> int:
+    """Size in bytes of a seekable upload stream (position is preserved)."""
+    pos = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(pos)
+    return size
+
+
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
@@ -160,9 +315,14 @@ def index():
             "version": "1.0.0",
             "endpoints": {
                 "/analyze": "POST — Upload VCF + drugs for pharmacogenomic analysis",
+                "/analyze/stream": "POST — /analyze as server-sent events, one per drug result as it completes",
+                "/jobs/<id>": "GET  — Status and result of an async /analyze job (async=true)",
+                "/analyze/cohort": "POST — Analyze every sample of a multi-sample VCF (NDJSON)",
                 "/drugs": "GET  — List all supported drugs",
                 "/genes": "GET  — List all screened genes",
                 "/health": "GET  — Health check",
+                "/admin/kb": "GET  — Knowledge-base version and reload status",
+                "/admin/kb/reload": "POST — Rebuild the knowledge base and swap it in (X-Admin-Token)",
             },
         }
     )
@@ -172,7 +332,51 @@ def index():
 def health():
     # Optional: Check DB status
     db_status = "connected" if db is not None else "disconnected"
-    return jsonify({"status": "ok", "db": db_status})
+    return jsonify(
+        {
+            "status": "ok",
+            "db": db_status,
+            "resultCache": result_cache.stats(),
+            "llmCache": llm_cache.stats(),
+            "llmClient": llm_client.stats(),
+            "jobs": _job_runner.stats() if _job_runner is not None else None,
+            "knowledgeBase": pgx_knowledgebase.current().version,
+            "phenotypeMemo": pgx_knowledgebase.current().phenotype_memo.stats(),
+        }
+    )
+
+
+# ---------------------------------------------------------------------------
+# Knowledge-base administration
+# ---------------------------------------------------------------------------
+
+
+def _admin_authorized() -> bool:
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@app.route("/admin/kb", methods=["GET"])
+def kb_status():
+    """Current knowledge-base version and the state of the last reload."""
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({**pgx_knowledgebase.reload_status(), "changed": pgx_knowledgebase.changed()})
+
+
+@app.route("/admin/kb/reload", methods=["POST"])
+def kb_reload():
+    """
+    Rebuild the knowledge base from data/tables/ and pgx_definitions.py
+    in the background, then swap it in.  Requests already running finish
+    on the version they started with.  ``?force=1`` swaps even when the
+    content is unchanged.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    started = pgx_knowledgebase.reload_async(force=request.args.get("force") == "1")
+    status = pgx_knowledgebase.reload_status()
+    return jsonify({**status, "started": started}), 202
 
 
 # ---------------------------------------------------------------------------
@@ -427,7 +631,167 @@ def list_drugs():
 @app.route("/genes", methods=["GET"])
 def list_genes():
     """Return all genes screened."""
-    return jsonify({"genes": KNOWN_GENES})
+    return jsonify({"genes": pgx_knowledgebase.current().known_genes})
+
+
+def _run_analysis(source, drugs, sample, kb, key) -> dict:
+    """
+    Analyze *source* (the upload stream, or the path of its spooled copy
+    for a background job), add the patient summary and store the report
+    under *key*.
+    Parse errors propagate as ValueError / OSError / EOFError.
+    """
+    with _parse_source(source) as (source, workers):
+        # Read straight from the upload; gzip/bgzip is detected and inflated on the fly
+        analysis_result = analyze_stream(source, drugs, sample=sample, workers=workers, kb=kb)
+
+    # Convert to dict
+    final_json = analysis_result.to_dict()
+    final_json["_parse_time_ms"] = analysis_result._parse_time_ms
+
+    summary_from_llm = _add_patient_summary(final_json)
+    if _complete_report(analysis_result._llm_fallbacks, summary_from_llm):
+        result_cache.put(key, final_json)
+    return final_json
+
+
+def _report_key(stream, sample, drugs, kb) -> str:
+    """
+    Result-cache key for analysing upload *stream*: synonyms resolve to
+    the drug they name and the request order is kept, as in the report.
+    """
+    names = [plan.drug for plan in kb.interaction_plan.compile(drugs)]
+    return cache_key(vcf_digest(stream), sample, names, kb.version, _explanation_mode())
+
+
+def _explanation_mode() -> str:
+    """Where a fresh report's explanations come from; part of the result-cache key."""
+    return "llm" if llm_enabled() or os.environ.get("GROQ_API_KEY") else "template"
+
+
+def _complete_report(llm_fallbacks: int, summary_from_llm: bool) -> bool:
+    """
+    Whether a report may be cached: not when a configured LLM failed and
+    template text stood in for it (an outage), or the stale fallbacks
+    would be served after the LLM recovers.
+    """
+    if llm_fallbacks and llm_enabled():
+        return False
+    return summary_from_llm or not os.environ.get("GROQ_API_KEY")
+
+
+def _fresh(report: dict) -> dict:
+    """A cached report, re-stamped with the time it is served."""
+    timestamp = datetime.now(timezone.utc).isoformat()
+    return {
+        **report,
+        "timestamp": timestamp,
+        "results": [{**entry, "timestamp": timestamp} for entry in report["results"]],
+        "_cached": True,
+    }
+
+
+@contextmanager
+def _parse_source(source):
+    """
+    ``(source, parse workers)`` for an upload stream or a file path.  Large
+    uploads are spooled to a temporary file (removed on exit) that the
+    worker processes read by path, so the body is never held in memory.
+    """
+    if isinstance(source, str):
+        # Already on disk (a background job's spooled upload)
+        parallel = PARSE_WORKERS > 1 and os.path.getsize(source) >= PARALLEL_MIN_BYTES
+        yield source, PARSE_WORKERS if parallel else 0
+        return
+
+    if PARSE_WORKERS <= 1 or _stream_size(source) < PARALLEL_MIN_BYTES:
+        yield source, 0
+        return
+
+    fd, path = tempfile.mkstemp(prefix="pharmaguard-", suffix=".vcf")
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            shutil.copyfileobj(source, spool, 1024 * 1024)
+        yield path, PARSE_WORKERS
+    finally:
+        os.unlink(path)
+
+
+def _add_patient_summary(final_json: dict) -> bool:
+    """
+    Set ``summary.llm_explanation`` on a report, from the LLM or a
+    template; True if the LLM wrote it.
+    """
+    # Add LLM Summary
+    try:
+        summary_text = summarize_results(final_json)
+        if summary_text:
+            final_json["summary"]["llm_explanation"] = summary_text
+            return True
+        else:
+            print("[LLM] summarize_results returned None — check GROQ_API_KEY")
+    except Exception as e:
+        print(f"[LLM] Summary generation error: {e}")
+        traceback.print_exc()
+
+    # Fallback: generate a basic summary if LLM didn't produce one
+    if "llm_explanation" not in final_json.get("summary", {}):
+        critical = final_json.get("summary", {}).get("criticalDrugs", [])
+        total = final_json.get("summary", {}).get("drugsAnalyzed", 0)
+        if critical:
+            drug_names = ", ".join(c["drug"] if isinstance(c, dict) else str(c) for c in critical)
+            final_json["summary"]["llm_explanation"] = (
+                f"Based on your DNA, {len(critical)} out of {total} medications tested may not work "
+                f"normally for you: {drug_names}. Your body processes these drugs differently, "
+                f"which means your doctor may need to adjust the dose or choose an alternative. "
+                f"Always talk to your doctor before changing any medication."
+            )
+        elif total > 0:
+            final_json["summary"]["llm_explanation"] = (
+                f"Based on your DNA, all {total} medications tested appear to work normally with your "
+                f"genetic profile. No dosage changes are needed. Always talk to your doctor before "
+                f"changing any medication."
+            )
+    return False
+
+
+def _submit_analysis(stream, drugs, sample, kb, key):
+    """
+    Queue the analysis of upload *stream* as a background job (202 + job
+    ID).  The upload is gone once this request returns, so it is spooled
+    to a temporary file that the job reads and removes when it ends.
+    """
+    fd, path = tempfile.mkstemp(prefix="pharmaguard-job-", suffix=".vcf")
+    with os.fdopen(fd, "wb") as spool:
+        shutil.copyfileobj(stream, spool, 1024 * 1024)
+
+    def run() -> dict:
+        try:
+            return _run_analysis(path, drugs, sample, kb, key)
+        except (ValueError, OSError, EOFError) as e:
+            # A malformed file fails the same way on every attempt
+            traceback.print_exc()
+            raise jobs.JobFailed(f"Failed to parse VCF file: {str(e)}") from e
+
+    def discard() -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    try:
+        job_id = job_runner().submit("analyze", run, cleanup=discard)
+    except jobs.QueueFull:
+        resp = jsonify({"error": "Too many analyses queued, try again shortly"})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    return _job_accepted(job_id)
+
+
+def _job_accepted(job_id: str):
+    resp = jsonify({"jobId": job_id, "status": jobs.QUEUED, "statusUrl": f"/jobs/{job_id}"})
+    resp.headers["Location"] = f"/jobs/{job_id}"
+    return resp, 202
 
 
 @app.route("/analyze", methods=["POST"])
@@ -439,6 +803,9 @@ def analyze_endpoint():
       - vcf_file: the VCF file (.vcf, .vcf.gz, .vcf.bgz)
       - drugs: comma-separated drug names (e.g. "codeine,warfarin,simvastatin")
       - sample: (optional) sample/patient ID to analyze (defaults to first)
+      - async: (optional) "true" to run in the background; the response is
+        202 with a job ID to poll at GET /jobs/<id> (503 when several
+        workers share no job store, see ASYNC_JOBS)
     """
     # ── Validate inputs ──
     if "vcf_file" not in request.files:
@@ -457,31 +824,37 @@ def analyze_endpoint():
     drugs = [d.strip() for d in drugs_raw.split(",") if d.strip()]
     sample = request.form.get("sample", None)
 
-    # ── Parse VCF ──
-    tmp_path = None
-    try:
-        filename = vcf_file.filename.lower()
-        file_data = vcf_file.read()
+    if _wants_async() and not ASYNC_JOBS:
+        return jsonify({
+            "error": "Async analysis is disabled: the server runs several workers without a "
+                     "shared job store (JOB_STORE=sqlite or mongo)",
+        }), 503
 
-        if not file_data:
+    # Pin one knowledge-base version for the whole request
+    kb = pgx_knowledgebase.current()
+
+    # ── Parse + analyze (rows are streamed, only PGx hits are kept) ──
+    try:
+        stream = _upload_stream(vcf_file)
+        if stream is None:
             return jsonify({"error": "Uploaded VCF file is empty"}), 400
 
-        t_parse_start = time.perf_counter()
+        # Same file, sample, drugs and knowledge base → reuse the stored report
+        key = _report_key(stream, sample, drugs, kb)
+        cached = result_cache.get(key)
+        if cached is not None:
+            if _wants_async():
+                return _job_accepted(job_runner().record("analyze", _fresh(cached)))
+            return jsonify(_fresh(cached)), 200
 
-        # For compressed files, save to temp file; for plain text, use bytes parser
-        if filename.endswith(".gz") or filename.endswith(".bgz"):
-            suffix = ".vcf.bgz" if filename.endswith(".bgz") else ".vcf.gz"
-            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-                tmp.write(file_data)
-                tmp_path = tmp.name
-            vcf = parse_vcf(tmp_path)
-        else:
-            vcf = parse_vcf_bytes(file_data, filename=filename)
+        if _wants_async():
+            return _submit_analysis(stream, drugs, sample, kb, key)
 
-        t_parse_end = time.perf_counter()
-        parse_time_ms = (t_parse_end - t_parse_start) * 1000
+        final_json = _run_analysis(stream, drugs, sample, kb, key)
+        return jsonify(final_json), 200
 
-    except Exception as e:
+    except (ValueError, OSError, EOFError) as e:
+        # Malformed rows, bad encodings and corrupt gzip streams
         traceback.print_exc()
         return jsonify(
             {
@@ -489,67 +862,222 @@ def analyze_endpoint():
                 "detail": "Ensure the file is a valid VCF (v4.x) file.",
             }
         ), 400
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except OSError:
-                pass
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
-    # ── Run analysis ──
-    try:
-        from analyzer import analyze
 
-        # Parse the VCF
-        if not tmp_path:
-            # If temporary file not used (was parsing bytes directly)
-            # we might need to recreate logic or handle above better.
-            pass
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _report_events(report: dict):
+    """The events of :func:`analyzer.analyze_events` for a finished report."""
+    yield "genes", {
+        "patient_id": report["patient_id"],
+        "timestamp": report["timestamp"],
+        "genes": report["genes"],
+        "_parse_time_ms": report.get("_parse_time_ms", 0.0),
+        "_cached": True,
+    }
+    for i, entry in enumerate(report["results"]):
+        yield "result", {"index": i, **entry}
+    yield "summary", report["summary"]
+
+
+@app.route("/analyze/stream", methods=["POST"])
+def analyze_stream_endpoint():
+    """
+    /analyze as a server-sent-event stream, so clients can render results
+    before the slowest LLM explanation is back.
+
+    Takes the same form fields as /analyze.  Events, in order (``data`` is
+    JSON, the matching part of the /analyze response):
+
+      - ``genes``: {patient_id, timestamp, genes, _parse_time_ms}, as soon
+        as phenotypes are inferred
+      - ``result``: one element of ``results`` plus its ``index``, for
+        every drug, with the template explanation
+      - ``explanation``: an updated ``result`` (same ``index``) for each
+        LLM explanation as it arrives
+      - ``summary``: the summary, including ``llm_explanation``; last
+      - ``error``: {error} if the analysis fails after streaming started
+
+    The assembled report is cached like an /analyze response, and a cached
+    report is replayed as genes / result / summary events.
+    """
+    if "vcf_file" not in request.files:
+        return jsonify({"error": "Missing 'vcf_file' in form data"}), 400
+
+    vcf_file = request.files["vcf_file"]
+    if not vcf_file.filename:
+        return jsonify({"error": "Empty VCF file"}), 400
 
-        # Call the analysis engine
-        # Since 'vcf' object is already parsed above
-        analysis_result = analyze(vcf, drugs, sample=sample)
+    drugs_raw = request.form.get("drugs", "")
+    if not drugs_raw.strip():
+        return jsonify(
+            {"error": "Missing 'drugs' parameter (comma-separated drug names)"}
+        ), 400
+
+    drugs = [d.strip() for d in drugs_raw.split(",") if d.strip()]
+    sample = request.form.get("sample", None)
+    kb = pgx_knowledgebase.current()
+
+    # ── Parse up front, so a bad file is still a 400 ──
+    try:
+        stream = _upload_stream(vcf_file)
+        if stream is None:
+            return jsonify({"error": "Uploaded VCF file is empty"}), 400
 
-        # Convert to dict
-        final_json = analysis_result.to_dict()
-        final_json["_parse_time_ms"] = parse_time_ms
+        key = _report_key(stream, sample, drugs, kb)
+        cached = result_cache.get(key)
+        if cached is not None:
+            return _event_stream(_sse(e, d) for e, d in _report_events(_fresh(cached)))
 
-        # Add LLM Summary
+        with _parse_source(stream) as (source, workers):
+            # Parsed before this returns, so the spooled file can go
+            events = analyze_events(source, drugs, sample=sample, workers=workers, kb=kb)
+    except (ValueError, OSError, EOFError) as e:
+        traceback.print_exc()
+        return jsonify(
+            {
+                "error": f"Failed to parse VCF file: {str(e)}",
+                "detail": "Ensure the file is a valid VCF (v4.x) file.",
+            }
+        ), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+
+    # ── Stream events, assembling the /analyze report alongside ──
+    def generate():
+        report: dict = {}
         try:
-            summary_text = summarize_results(final_json)
-            if summary_text:
-                final_json["summary"]["llm_explanation"] = summary_text
-            else:
-                print("[LLM] summarize_results returned None — check GROQ_API_KEY")
+            for event, data in events:
+                if event == "genes":
+                    report = {
+                        "patient_id": data["patient_id"],
+                        "timestamp": data["timestamp"],
+                        "results": [],
+                        "genes": data["genes"],
+                        "summary": {},
+                        "_parse_time_ms": data["_parse_time_ms"],
+                    }
+                elif event in ("result", "explanation"):
+                    entry = {k: v for k, v in data.items() if k != "index"}
+                    if data["index"] < len(report["results"]):
+                        report["results"][data["index"]] = entry
+                    else:
+                        report["results"].append(entry)
+                elif event == "summary":
+                    llm_fallbacks = data.pop("_llm_fallbacks", 0)
+                    report["summary"] = data
+                    if _complete_report(llm_fallbacks, _add_patient_summary(report)):
+                        result_cache.put(key, report)
+                    data = report["summary"]
+                yield _sse(event, data)
         except Exception as e:
-            print(f"[LLM] Summary generation error: {e}")
             traceback.print_exc()
+            yield _sse("error", {"error": f"Analysis failed: {str(e)}"})
 
-        # Fallback: generate a basic summary if LLM didn't produce one
-        if "llm_explanation" not in final_json.get("summary", {}):
-            critical = final_json.get("summary", {}).get("criticalDrugs", [])
-            total = final_json.get("summary", {}).get("drugsAnalyzed", 0)
-            if critical:
-                drug_names = ", ".join(c["drug"] if isinstance(c, dict) else str(c) for c in critical)
-                final_json["summary"]["llm_explanation"] = (
-                    f"Based on your DNA, {len(critical)} out of {total} medications tested may not work "
-                    f"normally for you: {drug_names}. Your body processes these drugs differently, "
-                    f"which means your doctor may need to adjust the dose or choose an alternative. "
-                    f"Always talk to your doctor before changing any medication."
-                )
-            elif total > 0:
-                final_json["summary"]["llm_explanation"] = (
-                    f"Based on your DNA, all {total} medications tested appear to work normally with your "
-                    f"genetic profile. No dosage changes are needed. Always talk to your doctor before "
-                    f"changing any medication."
-                )
+    return _event_stream(generate())
 
-        return jsonify(final_json), 200
 
+def _event_stream(chunks):
+    return Response(
+        stream_with_context(chunks),
+        mimetype="text/event-stream",
+        # No caching, and no buffering in nginx-style proxies
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Status of a background job; ``result`` holds the report once it is done."""
+    job = job_store().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job ID (it may have expired)"}), 404
+    resp = jsonify(job)
+    if job["status"] in (jobs.QUEUED, jobs.RUNNING):
+        resp.headers["Retry-After"] = "1"
+    return resp, 200
+
+
+@app.route("/analyze/cohort", methods=["POST"])
+def analyze_cohort_endpoint():
+    """
+    Analyze every sample of a multi-sample VCF in one pass.
+
+    Expects multipart/form-data with:
+      - vcf_file: the VCF file (.vcf, .vcf.gz, .vcf.bgz)
+      - drugs: comma-separated drug names
+      - samples: (optional) comma-separated sample IDs (defaults to all)
+
+    The file is parsed once; the response is NDJSON with one line per
+    sample (the same object /analyze returns), streamed as each sample
+    is assessed.  If assessing a sample fails, the last line is
+    ``{"error": ...}``.  Per-drug LLM explanations are not generated.
+    """
+    if "vcf_file" not in request.files:
+        return jsonify({"error": "Missing 'vcf_file' in form data"}), 400
+
+    vcf_file = request.files["vcf_file"]
+    if not vcf_file.filename:
+        return jsonify({"error": "Empty VCF file"}), 400
+
+    drugs_raw = request.form.get("drugs", "")
+    if not drugs_raw.strip():
+        return jsonify(
+            {"error": "Missing 'drugs' parameter (comma-separated drug names)"}
+        ), 400
+
+    drugs = [d.strip() for d in drugs_raw.split(",") if d.strip()]
+    samples_raw = request.form.get("samples", "")
+    samples = [s.strip() for s in samples_raw.split(",") if s.strip()] or None
+
+    # ── Parse once (must finish before the request stream goes away) ──
+    try:
+        stream = _upload_stream(vcf_file)
+        if stream is None:
+            return jsonify({"error": "Uploaded VCF file is empty"}), 400
+        results = analyze_cohort(stream, drugs, samples, kb=pgx_knowledgebase.current())
+    except (ValueError, OSError, EOFError) as e:
+        traceback.print_exc()
+        return jsonify(
+            {
+                "error": f"Failed to parse VCF file: {str(e)}",
+                "detail": "Ensure the file is a valid VCF (v4.x) file.",
+            }
+        ), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
+    # ── Stream one JSON line per sample ──
+    def generate():
+        while True:
+            # Samples are assessed inside next(): a failure there ends the
+            # iterator, so report it as the last line instead of cutting
+            # the stream short
+            try:
+                result = next(results)
+            except StopIteration:
+                return
+            except Exception as e:
+                traceback.print_exc()
+                yield json.dumps({"error": f"Analysis failed: {str(e)}"}) + "\n"
+                return
+            try:
+                line = result.to_dict()
+                line["_parse_time_ms"] = result._parse_time_ms
+            except Exception as e:
+                traceback.print_exc()
+                line = {"patient_id": result.patient_id, "error": f"Analysis failed: {str(e)}"}
+            yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 
 # Initialize DB indexes
 # In production, use migrations or startup script
@@ -581,32 +1109,12 @@ def couple_analysis():
         return jsonify({"error": "Missing 'partner_vcf'"}), 400
 
     partner_file = request.files["partner_vcf"]
+    kb = pgx_knowledgebase.current()
 
-    # Parse Partner
+    # Parse + analyze Partner straight from the upload stream
     try:
-        filename = (
-            partner_file.filename.lower()
-            if partner_file.filename
-            else "partner_upload.vcf"
-        )
-        file_data = partner_file.read()
-
-        if filename.endswith(".gz") or filename.endswith(".bgz"):
-            # Handle compressed (save temp)
-            suffix = ".vcf.bgz" if filename.endswith(".bgz") else ".vcf.gz"
-            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-                tmp.write(file_data)
-                tmp_path = tmp.name
-            partner_vcf_obj = parse_vcf(tmp_path)
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
-        else:
-            partner_vcf_obj = parse_vcf_bytes(file_data, filename=filename)
-
-        # Analyze Partner (we don't need drugs, just genes)
-        partner_result = analyze(partner_vcf_obj, [])
+        # We don't need drugs, just genes
+        partner_result = analyze_stream(partner_file.stream, [], kb=kb)
         partner_genes = [g.to_dict() for g in partner_result.genes]
 
     except Exception as e:
@@ -620,23 +1128,7 @@ def couple_analysis():
         # Process User VCF Upload
         u_file = request.files["user_vcf"]
         try:
-            filename = u_file.filename.lower()
-            file_data = u_file.read()
-
-            if filename.endswith(".gz") or filename.endswith(".bgz"):
-                suffix = ".vcf.bgz" if filename.endswith(".bgz") else ".vcf.gz"
-                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-                    tmp.write(file_data)
-                    tmp_path = tmp.name
-                user_vcf_obj = parse_vcf(tmp_path)
-                try:
-                    os.unlink(tmp_path)
-                except:
-                    pass
-            else:
-                user_vcf_obj = parse_vcf_bytes(file_data, filename=filename)
-
-            user_result = analyze(user_vcf_obj, [])
+            user_result = analyze_stream(u_file.stream, [], kb=kb)
             user_genes = [g.to_dict() for g in user_result.genes]
 
         except Exception as e:
@@ -673,7 +1165,7 @@ def couple_analysis():
 
     # 3. Calculate Inheritance
     try:
-        compatibility_report = calculate_inheritance(user_genes, partner_genes)
+        compatibility_report = calculate_inheritance(user_genes, partner_genes, kb=kb)
 
         # Generate AI patient-friendly summary
         ai_summary = generate_compatibility_summary(compatibility_report)
@@ -760,8 +1252,6 @@ def report_chat():
     )
 
     try:
-        import urllib.request as urlreq
-
         request_body = json.dumps(
             {
                 "model": model,
@@ -774,20 +1264,10 @@ def report_chat():
             }
         ).encode("utf-8")
 
-        req = urlreq.Request(
-            f"{base_url}/chat/completions",
-            data=request_body,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-                "User-Agent": "Pharmaguard/1.0",
-            },
-            method="POST",
+        reply = llm_client.complete(
+            f"{base_url}/chat/completions", request_body, api_key, kind="chat", timeout=20
         )
-        with urlreq.urlopen(req, timeout=20) as resp:
-            result = json.loads(resp.read().decode("utf-8"))
-            reply = result["choices"][0]["message"]["content"].strip()
-            return jsonify({"reply": reply})
+        return jsonify({"reply": reply})
 
     except Exception as e:
         print(f"[LLM] Chat error: {e}")
@@ -1140,5 +1620,5 @@ if __name__ == "__main__":
         print(f"   Database: Disconnected")
 
     print(f"   Supported drugs: {', '.join(get_all_drugs())}")
-    print(f"   Screened genes:  {', '.join(KNOWN_GENES)}")
+    print(f"   Screened genes:  {', '.join(pgx_knowledgebase.current().known_genes)}")
     app.run(host="0.0.0.0", port=port, debug=debug, use_reloader=False)
@@ -0,0 +1,145 @@
+"""
+Benchmark: pharmacogenomic row extraction
+=========================================
+Times the extraction step of :func:`analyzer.analyze` (classify each row,
+pick the sample's genotype, group by gene) in rows/sec, against the
+per-row implementation it replaced: a fresh upper-cased gene list per row,
+a search of the row's genotypes for the sample, then a separate
+group-by-gene pass.
+
+    python bench_extract.py --rows 1000000 --samples 10
+
+Inputs are ``data/pharmcat.example.vcf`` and a synthetic VCF of *--rows*
+rows (kept at ``--out`` so repeated runs skip the build), about a third of
+them at known pharmacogenomic rsIDs.  Rows are parsed untargeted, so every
+row is classified, and only extraction is timed.
+"""
+
+import argparse
+import os
+import random
+import time
+
+import analyzer
+import pgx_knowledgebase
+from parser import VCFReader
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PHARMCAT = os.path.join(HERE, "data", "pharmcat.example.vcf")
+_CHUNK = 100_000
+
+
+def legacy_extract(rows, sample, kb):
+    """The extraction loop as it was: per-row gene list, genotype search, then grouping."""
+    detected = []
+    for v in rows:
+        gene, star, rsid = v.gene, v.star_allele, v.rsid or ""
+        if (not gene or not star) and rsid:
+            for rs_part in rsid.split(";"):
+                rs_part = rs_part.strip()
+                if rs_part in kb.rsid_to_allele:
+                    gene, star = kb.rsid_to_allele[rs_part]
+                    break
+        if not gene or not star:
+            hit = kb.lookup_position(v.chrom, v.pos, v.ref, v.alt)
+            if hit:
+                gene, star, _ = hit
+        if not gene or gene.upper() not in [g.upper() for g in kb.known_genes]:
+            continue
+        func = kb.allele_function.get(gene.upper(), {}).get(star, "normal") if star else "normal"
+        site = (gene.upper(), star or "", rsid, func)
+
+        gt_raw, is_variant = "0/0", False
+        for g in v.genotypes:
+            if g.sample == sample:
+                gt_raw, is_variant = g.raw, g.is_variant
+                break
+        detected.append(analyzer._make_detected(v, site, gt_raw, is_variant))
+
+    grouped = {}
+    for d in detected:
+        grouped.setdefault(d.gene, []).append(d)
+    return grouped
+
+
+def extract(rows, sample, samples, kb):
+    extractor = analyzer._VariantExtractor(kb, samples, sample)
+    for v in rows:
+        extractor.add(v)
+    return extractor.by_gene
+
+
+def build_input(path: str, rows: int, samples: int, seed: int) -> None:
+    """Write a VCF of *rows* rows over *samples* samples."""
+    rng = random.Random(seed)
+    kb = pgx_knowledgebase.current()
+    known = sorted(r for r in kb.rsid_to_allele if r.startswith("rs"))
+    names = [f"S{i + 1}" for i in range(samples)]
+    gts = ["0/0"] * 6 + ["0/1"] * 3 + ["1/1"]
+    with open(path, "w") as out:
+        out.write("##fileformat=VCFv4.2\n")
+        out.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + "\t".join(names) + "\n")
+        pos = 0
+        for _ in range(rows):
+            pos += rng.randint(1, 500)
+            rsid = rng.choice(known) if rng.random() < 0.3 else f"rs{rng.randint(10**8, 10**9)}"
+            ref, alt = rng.sample("ACGT", 2)
+            calls = "\t".join(rng.choice(gts) for _ in names)
+            out.write(f"1\t{pos}\t{rsid}\t{ref}\t{alt}\t.\tPASS\t.\tGT\t{calls}\n")
+
+
+def run(path: str, fn) -> tuple:
+    """(extraction seconds, rows, hits) with *fn* over the file's rows, chunk by chunk."""
+    kb = pgx_knowledgebase.current()
+    secs = rows = hits = 0
+    with VCFReader(path) as reader:
+        samples = reader.samples
+        sample = samples[-1] if samples else None
+        chunk = []
+        for v in reader:
+            chunk.append(v)
+            if len(chunk) == _CHUNK:
+                secs, hits = _time(fn, chunk, sample, samples, kb, secs, hits)
+                rows += len(chunk)
+                chunk = []
+        if chunk:
+            secs, hits = _time(fn, chunk, sample, samples, kb, secs, hits)
+            rows += len(chunk)
+    return secs, rows, hits
+
+
+def _time(fn, chunk, sample, samples, kb, secs, hits):
+    t0 = time.perf_counter()
+    grouped = fn(chunk, sample, samples, kb)
+    return secs + time.perf_counter() - t0, hits + sum(len(v) for v in grouped.values())
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000, help="rows in the synthetic VCF")
+    ap.add_argument("--samples", type=int, default=10, help="samples in the synthetic VCF")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=os.path.join(HERE, "data", "bench_extract.vcf"))
+    args = ap.parse_args()
+
+    if not os.path.exists(args.out):
+        print(f"Building {args.out} ({args.rows:,} rows × {args.samples} samples)...")
+        build_input(args.out, args.rows, args.samples, args.seed)
+
+    approaches = [
+        ("before", lambda rows, sample, samples, kb: legacy_extract(rows, sample, kb)),
+        ("after", extract),
+    ]
+    for path in (PHARMCAT, args.out):
+        print(os.path.basename(path))
+        baseline = None
+        for label, fn in approaches:
+            secs, rows, hits = run(path, fn)
+            rate = rows / secs if secs else float("inf")
+            baseline = baseline or rate
+            print(f"  {label:<7} {secs:8.3f}s  rows={rows:,}  hits={hits:,}  "
+                  f"{rate:12,.0f} rows/s  speedup={rate / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: serial vs process-pool VCF parsing
+=============================================
+Replicates the body of ``data/100samples.vcf.bgz`` into a large BGZF file
+and times a targeted (PGx-only) scan with 1, 2, 4, … worker processes.
+
+    python bench_parallel_parse.py --size-mb 1024 --workers 1 2 4 8
+
+The generated file is kept (``--out``) so repeated runs skip the build.
+"""
+
+import argparse
+import gzip
+import os
+import time
+
+from bgzf import BgzfWriter
+from parallel_parser import ParallelVCFReader
+from parser import VCFReader
+from pgx_knowledgebase import PGX_TARGET_SITES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, "data", "100samples.vcf.bgz")
+
+
+def build_input(path: str, size_mb: int) -> None:
+    """Write a BGZF file of roughly *size_mb* uncompressed MB."""
+    with open(SOURCE, "rb") as fh:
+        text = gzip.decompress(fh.read())
+    lines = text.splitlines(keepends=True)
+    header = b"".join(l for l in lines if l.startswith(b"#"))
+    body = b"".join(l for l in lines if not l.startswith(b"#"))
+
+    target = size_mb * 1024 * 1024
+    written = len(header)
+    with BgzfWriter(path) as out:
+        out.write(header)
+        while written < target:
+            out.write(body)
+            written += len(body)
+
+
+def run(path: str, workers: int) -> tuple:
+    t0 = time.perf_counter()
+    if workers > 1:
+        reader = ParallelVCFReader(path, targets=PGX_TARGET_SITES, workers=workers)
+    else:
+        reader = VCFReader(path, targets=PGX_TARGET_SITES)
+    with reader:
+        hits = sum(1 for _ in reader)
+        rows = reader.rows_read
+    return time.perf_counter() - t0, rows, hits
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size-mb", type=int, default=1024, help="uncompressed size of the generated VCF")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--out", default=os.path.join(HERE, "data", "bench_replicated.vcf.bgz"))
+    args = ap.parse_args()
+
+    if not os.path.exists(args.out):
+        print(f"Building {args.out} (~{args.size_mb} MB uncompressed)...")
+        build_input(args.out, args.size_mb)
+    print(f"Input: {args.out} ({os.path.getsize(args.out) / 1e6:.0f} MB on disk), {os.cpu_count()} CPUs")
+
+    baseline = None
+    for w in args.workers:
+        secs, rows, hits = run(args.out, w)
+        baseline = baseline or secs
+        print(f"workers={w:<3} {secs:8.2f}s  rows={rows:,}  hits={hits:,}  speedup={baseline / secs:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,750 @@
+"""
+BGZF + Tabix / CSI Random Access (stdlib only)
+===============================================
+Reads and writes BGZF (the blocked gzip format produced by ``bgzip``) and
+the two index formats used for position-sorted VCFs:
+
+  - ``.tbi``  tabix index  (fixed 16 kb linear index, min_shift 14, depth 5)
+  - ``.csi``  coordinate-sorted index  (configurable min_shift / depth)
+
+With an index a region query decompresses only the few 64 kb blocks that
+can contain the region, instead of inflating the whole file.  Large
+bgzipped files that arrive without an index can be indexed in one pass
+with :func:`build_index` and the result saved as a ``.tbi`` (or, for
+contigs beyond 512 Mb, a ``.csi``).
+
+Coordinates in the public API are 1-based and inclusive, like
+``tabix file.vcf.gz chr22:42126000-42131000``.
+
+Format reference: SAMtools/HTSlib "SAMv1" specification, sections 4.1
+(BGZF) and 5 (indexing), plus the tabix and CSI format notes.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+# ---------------------------------------------------------------------------
+# BGZF constants
+# ---------------------------------------------------------------------------
+
+# gzip header with FEXTRA set; the "BC" extra subfield carries the block size
+_BGZF_MAGIC = b"\x1f\x8b\x08\x04"
+_HEADER = struct.Struct("<4sIBBH")               # magic, mtime, xfl, os, xlen
+_BLOCK_TAIL = struct.Struct("<II")               # crc32, isize
+
+# 28-byte empty block that terminates every BGZF file
+_EOF_BLOCK = bytes.fromhex(
+    "1f8b08040000000000ff0600424302001b0003000000000000000000"
+)
+
+# Keep blocks a little under 64 kb so the compressed form always fits
+_MAX_BLOCK_DATA = 0xFF00
+
+# Tabix defaults
+_TBI_MIN_SHIFT = 14
+_TBI_DEPTH = 5
+_TBI_FORMAT_VCF = 2
+
+PathLike = Union[str, os.PathLike]
+
+
+def make_voffset(coffset: int, uoffset: int) -> int:
+    """Pack a compressed block offset and in-block offset into a virtual offset."""
+    return (coffset << 16) | uoffset
+
+
+def split_voffset(voffset: int) -> Tuple[int, int]:
+    return voffset >> 16, voffset & 0xFFFF
+
+
+def is_bgzf(path: PathLike) -> bool:
+    """True if *path* starts with a BGZF block header."""
+    with open(path, "rb") as fh:
+        return is_bgzf_header(fh.read(16))
+
+
+def is_bgzf_header(head: bytes) -> bool:
+    """True if the first 16 bytes *head* are a BGZF block header."""
+    return len(head) >= 16 and head[:4] == _BGZF_MAGIC and head[12:14] == b"BC"
+
+
+# ---------------------------------------------------------------------------
+# Block-level reading
+# ---------------------------------------------------------------------------
+
+def _read_block(fh: BinaryIO, coffset: int) -> Optional[Tuple[bytes, int]]:
+    """
+    Decompress the block at *coffset*.
+    Returns ``(data, block_size)`` or None at end of file.
+    """
+    fh.seek(coffset)
+    header = fh.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ValueError(f"Truncated BGZF block header at offset {coffset}")
+    magic, _mtime, _xfl, _os, xlen = _HEADER.unpack(header)
+    if magic != _BGZF_MAGIC:
+        raise ValueError(f"Not a BGZF block at offset {coffset}")
+
+    extra = fh.read(xlen)
+    bsize = None
+    i = 0
+    while i + 4 <= len(extra):
+        si1, si2, slen = extra[i], extra[i + 1], struct.unpack_from("<H", extra, i + 2)[0]
+        if si1 == 66 and si2 == 67 and slen == 2:      # 'B', 'C'
+            bsize = struct.unpack_from("<H", extra, i + 4)[0]
+        i += 4 + slen
+    if bsize is None:
+        raise ValueError(f"BGZF block at offset {coffset} has no BC subfield")
+
+    block_size = bsize + 1
+    cdata_len = block_size - _HEADER.size - xlen - _BLOCK_TAIL.size
+    cdata = fh.read(cdata_len)
+    crc, isize = _BLOCK_TAIL.unpack(fh.read(_BLOCK_TAIL.size))
+    data = zlib.decompress(cdata, -15) if isize else b""
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise ValueError(f"Corrupt BGZF block at offset {coffset}")
+    return data, block_size
+
+
+def iter_blocks(fh: BinaryIO, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """Yield ``(coffset, data)`` for every block from *start* onwards."""
+    coffset = start
+    while True:
+        block = _read_block(fh, coffset)
+        if block is None:
+            return
+        data, size = block
+        yield coffset, data
+        coffset += size
+
+
+def block_offsets(fh: BinaryIO) -> List[int]:
+    """
+    Return the compressed offset of every non-empty block, reading only the
+    block headers.  Used to split a file on block boundaries.
+    """
+    offsets: List[int] = []
+    coffset = 0
+    fh.seek(0, io.SEEK_END)
+    end = fh.tell()
+    while coffset < end:
+        fh.seek(coffset)
+        header = fh.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            break
+        magic, _mtime, _xfl, _os, xlen = _HEADER.unpack(header)
+        if magic != _BGZF_MAGIC:
+            raise ValueError(f"Not a BGZF block at offset {coffset}")
+        extra = fh.read(xlen)
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = struct.unpack_from("<H", extra, i + 2)[0]
+            if extra[i] == 66 and extra[i + 1] == 67 and slen == 2:
+                bsize = struct.unpack_from("<H", extra, i + 4)[0]
+            i += 4 + slen
+        if bsize is None:
+            raise ValueError(f"BGZF block at offset {coffset} has no BC subfield")
+        fh.seek(coffset + bsize + 1 - 4)
+        isize = struct.unpack("<I", fh.read(4))[0]
+        if isize:
+            offsets.append(coffset)
+        coffset += bsize + 1
+    return offsets
+
+
+class BgzfReader:
+    """
+    Random-access line reader over a BGZF file.
+
+    ``seek()`` and ``tell()`` work in virtual offsets, so positions taken
+    from a tabix/CSI index can be used directly.  Recently used blocks are
+    cached because neighbouring region queries often share a block.
+    """
+
+    def __init__(self, source: Union[PathLike, BinaryIO], *, cache_blocks: int = 16):
+        if isinstance(source, (str, os.PathLike)):
+            self._fh: BinaryIO = open(source, "rb")
+            self._owned = True
+        else:
+            self._fh = source
+            self._owned = False
+        self._cache: "OrderedDict[int, Tuple[bytes, int]]" = OrderedDict()
+        self._cache_size = cache_blocks
+        self._coffset = 0
+        self._data = b""
+        self._next_coffset = 0
+        self._pos = 0
+        self._load(0)
+
+    def _load(self, coffset: int) -> bool:
+        block = self._cache.get(coffset)
+        if block is None:
+            block = _read_block(self._fh, coffset)
+            if block is None:
+                self._coffset, self._data, self._next_coffset, self._pos = coffset, b"", coffset, 0
+                return False
+            self._cache[coffset] = block
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(coffset)
+        self._coffset = coffset
+        self._data, size = block
+        self._next_coffset = coffset + size
+        self._pos = 0
+        return True
+
+    def _advance(self) -> bool:
+        """Move to the next block that holds data.  False at end of file."""
+        while True:
+            if not self._load(self._next_coffset):
+                return False
+            if self._data:
+                return True
+
+    def seek(self, voffset: int) -> None:
+        coffset, uoffset = split_voffset(voffset)
+        if coffset != self._coffset or not self._data:
+            self._load(coffset)
+        self._pos = uoffset
+
+    def tell(self) -> int:
+        return make_voffset(self._coffset, self._pos)
+
+    def readline(self) -> bytes:
+        """Read one line (including its newline); b"" at end of file."""
+        parts: List[bytes] = []
+        while True:
+            if self._pos >= len(self._data) and not self._advance():
+                return b"".join(parts)
+            nl = self._data.find(b"\n", self._pos)
+            if nl >= 0:
+                parts.append(self._data[self._pos:nl + 1])
+                self._pos = nl + 1
+                return b"".join(parts)
+            parts.append(self._data[self._pos:])
+            self._pos = len(self._data)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self) -> None:
+        if self._owned:
+            self._fh.close()
+
+    def __enter__(self) -> "BgzfReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class BgzfWriter(io.RawIOBase):
+    """Minimal BGZF writer: buffers data into ≤64 kb deflate blocks."""
+
+    def __init__(self, path: PathLike, *, level: int = 6):
+        super().__init__()
+        self._fh = open(path, "wb")
+        self._buf = bytearray()
+        self._level = level
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buf += data
+        while len(self._buf) >= _MAX_BLOCK_DATA:
+            self._flush_block(bytes(self._buf[:_MAX_BLOCK_DATA]))
+            del self._buf[:_MAX_BLOCK_DATA]
+        return len(data)
+
+    def _flush_block(self, data: bytes) -> None:
+        comp = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        cdata = comp.compress(data) + comp.flush()
+        bsize = _HEADER.size + 6 + len(cdata) + _BLOCK_TAIL.size - 1
+        self._fh.write(_HEADER.pack(_BGZF_MAGIC, 0, 0, 0xFF, 6))
+        self._fh.write(struct.pack("<BBHH", 66, 67, 2, bsize))
+        self._fh.write(cdata)
+        self._fh.write(_BLOCK_TAIL.pack(zlib.crc32(data), len(data)))
+
+    def close(self) -> None:
+        if not self.closed:
+            if self._buf:
+                self._flush_block(bytes(self._buf))
+                self._buf.clear()
+            self._fh.write(_EOF_BLOCK)
+            self._fh.close()
+        super().close()
+
+
+# ---------------------------------------------------------------------------
+# Binning scheme (shared by tabix and CSI)
+# ---------------------------------------------------------------------------
+
+def _reg2bin(beg: int, end: int, min_shift: int, depth: int) -> int:
+    """Smallest bin fully containing 0-based half-open [beg, end)."""
+    end -= 1
+    s = min_shift
+    t = ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> s == end >> s:
+            return t + (beg >> s)
+        s += 3
+        t -= 1 << ((level - 1) * 3)
+    return 0
+
+
+def _reg2bins(beg: int, end: int, min_shift: int, depth: int) -> List[int]:
+    """All bins that may overlap 0-based half-open [beg, end)."""
+    bins: List[int] = []
+    end -= 1
+    s = min_shift + depth * 3
+    t = 0
+    for level in range(depth + 1):
+        b = t + (beg >> s)
+        e = t + (end >> s)
+        bins.extend(range(b, e + 1))
+        s -= 3
+        t += 1 << (level * 3)
+    return bins
+
+
+def _bin_beg(bin_no: int, min_shift: int, depth: int) -> int:
+    """0-based first position covered by *bin_no*."""
+    t = 0
+    for level in range(depth + 1):
+        size = 1 << (level * 3)
+        if bin_no < t + size:
+            return (bin_no - t) << (min_shift + (depth - level) * 3)
+        t += size
+    raise ValueError(f"bin {bin_no} is out of range for depth {depth}")
+
+
+def _pseudo_bin(depth: int) -> int:
+    return ((1 << (depth + 1) * 3) - 1) // 7 + 1
+
+
+# ---------------------------------------------------------------------------
+# Index model
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _RefIndex:
+    bins: Dict[int, List[Tuple[int, int]]] = field(default_factory=dict)
+    loffsets: Dict[int, int] = field(default_factory=dict)     # CSI per-bin
+    linear: List[int] = field(default_factory=list)            # TBI 16 kb windows
+    n_mapped: Optional[int] = None
+    meta_chunk: Optional[Tuple[int, int]] = None               # span of this ref
+
+
+@dataclass
+class TabixIndex:
+    """A parsed .tbi or .csi index."""
+    names: List[str]
+    refs: List[_RefIndex]
+    min_shift: int = _TBI_MIN_SHIFT
+    depth: int = _TBI_DEPTH
+    fmt: int = _TBI_FORMAT_VCF
+    col_seq: int = 1
+    col_beg: int = 2
+    col_end: int = 0
+    meta_char: str = "#"
+    skip: int = 0
+    is_csi: bool = False
+
+    def tid(self, chrom: str) -> Optional[int]:
+        """Index of *chrom*, tolerating a missing / extra ``chr`` prefix."""
+        for name in (chrom, chrom[3:] if chrom.startswith("chr") else "chr" + chrom):
+            if name in self._name_map:
+                return self._name_map[name]
+        return None
+
+    @property
+    def _name_map(self) -> Dict[str, int]:
+        cached = self.__dict__.get("_names_cache")
+        if cached is None:
+            cached = {n: i for i, n in enumerate(self.names)}
+            self.__dict__["_names_cache"] = cached
+        return cached
+
+    @property
+    def record_count(self) -> Optional[int]:
+        """Total records, if the index carries the htslib metadata pseudo-bins."""
+        counts = [r.n_mapped for r in self.refs]
+        if not counts or any(c is None for c in counts):
+            return None
+        return sum(counts)  # type: ignore[arg-type]
+
+    def chunks(self, chrom: str, beg: int, end: int) -> List[Tuple[int, int]]:
+        """
+        Merged ``(start_voffset, end_voffset)`` chunks that may hold records
+        overlapping 0-based half-open [beg, end) on *chrom*.
+        """
+        tid = self.tid(chrom)
+        if tid is None:
+            return []
+        ref = self.refs[tid]
+
+        # Records ending before this offset cannot overlap the region
+        min_off = 0
+        if ref.linear:
+            w = min(beg >> _TBI_MIN_SHIFT, len(ref.linear) - 1)
+            min_off = ref.linear[w]
+        elif ref.loffsets:
+            b = _reg2bin(beg, beg + 1, self.min_shift, self.depth)
+            while b > 0 and b not in ref.loffsets:
+                b = (b - 1) >> 3
+            min_off = ref.loffsets.get(b, 0)
+
+        found: List[Tuple[int, int]] = []
+        for b in _reg2bins(beg, end, self.min_shift, self.depth):
+            for cs, ce in ref.bins.get(b, ()):
+                if ce > min_off:
+                    found.append((cs, ce))
+
+        found.sort()
+        merged: List[Tuple[int, int]] = []
+        for cs, ce in found:
+            if merged and cs <= merged[-1][1]:
+                if ce > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], ce)
+            else:
+                merged.append((cs, ce))
+        return merged
+
+
+# ---------------------------------------------------------------------------
+# Index reading / writing
+# ---------------------------------------------------------------------------
+
+def _read_aux(buf: bytes, off: int) -> Tuple[Dict[str, object], int]:
+    fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from("<7i", buf, off)
+    off += 28
+    names = [n.decode() for n in buf[off:off + l_nm].split(b"\0") if n]
+    off += l_nm
+    return {
+        "fmt": fmt, "col_seq": col_seq, "col_beg": col_beg, "col_end": col_end,
+        "meta_char": chr(meta), "skip": skip, "names": names,
+    }, off
+
+
+def _read_bins(buf: bytes, off: int, *, csi: bool, pseudo: int) -> Tuple[_RefIndex, int]:
+    ref = _RefIndex()
+    (n_bin,) = struct.unpack_from("<i", buf, off)
+    off += 4
+    for _ in range(n_bin):
+        (bin_no,) = struct.unpack_from("<I", buf, off)
+        off += 4
+        if csi:
+            (loffset,) = struct.unpack_from("<Q", buf, off)
+            off += 8
+        (n_chunk,) = struct.unpack_from("<i", buf, off)
+        off += 4
+        chunks = list(struct.iter_unpack("<QQ", buf[off:off + 16 * n_chunk]))
+        off += 16 * n_chunk
+        if bin_no == pseudo:
+            if len(chunks) >= 2:
+                ref.meta_chunk = chunks[0]
+                ref.n_mapped = chunks[1][0]
+            continue
+        ref.bins[bin_no] = chunks
+        if csi:
+            ref.loffsets[bin_no] = loffset
+    return ref, off
+
+
+def read_index(path: PathLike) -> TabixIndex:
+    """Parse a .tbi or .csi file (both are BGZF-compressed)."""
+    with open(path, "rb") as fh:
+        buf = b"".join(data for _, data in iter_blocks(fh))
+
+    magic = buf[:4]
+    if magic == b"TBI\x01":
+        (n_ref,) = struct.unpack_from("<i", buf, 4)
+        aux, off = _read_aux(buf, 8)
+        pseudo = _pseudo_bin(_TBI_DEPTH)
+        refs: List[_RefIndex] = []
+        for _ in range(n_ref):
+            ref, off = _read_bins(buf, off, csi=False, pseudo=pseudo)
+            (n_intv,) = struct.unpack_from("<i", buf, off)
+            off += 4
+            ref.linear = list(struct.unpack_from(f"<{n_intv}Q", buf, off))
+            off += 8 * n_intv
+            refs.append(ref)
+        return TabixIndex(refs=refs, **aux)  # type: ignore[arg-type]
+
+    if magic == b"CSI\x01":
+        min_shift, depth, l_aux = struct.unpack_from("<3i", buf, 4)
+        off = 16
+        aux: Dict[str, object] = {"names": []}
+        if l_aux >= 28:
+            aux, _ = _read_aux(buf, off)
+        off += l_aux
+        (n_ref,) = struct.unpack_from("<i", buf, off)
+        off += 4
+        pseudo = _pseudo_bin(depth)
+        refs = []
+        for _ in range(n_ref):
+            ref, off = _read_bins(buf, off, csi=True, pseudo=pseudo)
+            refs.append(ref)
+        return TabixIndex(refs=refs, min_shift=min_shift, depth=depth,
+                          is_csi=True, **aux)  # type: ignore[arg-type]
+
+    raise ValueError(f"{path} is not a tabix (.tbi) or CSI (.csi) index")
+
+
+def write_tbi(index: TabixIndex, path: PathLike) -> None:
+    """Write *index* in tabix (.tbi) format."""
+    names = b"".join(n.encode() + b"\0" for n in index.names)
+    out = io.BytesIO()
+    out.write(b"TBI\x01")
+    out.write(struct.pack("<8i", len(index.refs), index.fmt, index.col_seq,
+                          index.col_beg, index.col_end, ord(index.meta_char),
+                          index.skip, len(names)))
+    out.write(names)
+    pseudo = _pseudo_bin(_TBI_DEPTH)
+    for ref in index.refs:
+        meta = ref.meta_chunk
+        out.write(struct.pack("<i", len(ref.bins) + (1 if meta else 0)))
+        for bin_no in sorted(ref.bins):
+            chunks = ref.bins[bin_no]
+            out.write(struct.pack("<Ii", bin_no, len(chunks)))
+            for cs, ce in chunks:
+                out.write(struct.pack("<QQ", cs, ce))
+        if meta:
+            out.write(struct.pack("<Ii", pseudo, 2))
+            out.write(struct.pack("<QQQQ", meta[0], meta[1], ref.n_mapped or 0, 0))
+        out.write(struct.pack("<i", len(ref.linear)))
+        out.write(struct.pack(f"<{len(ref.linear)}Q", *ref.linear))
+
+    writer = BgzfWriter(path)
+    try:
+        writer.write(out.getvalue())
+    finally:
+        writer.close()
+
+
+def write_csi(index: TabixIndex, path: PathLike) -> None:
+    """Write *index* (built with ``csi=True``) in CSI (.csi) format."""
+    names = b"".join(n.encode() + b"\0" for n in index.names)
+    aux = struct.pack("<7i", index.fmt, index.col_seq, index.col_beg, index.col_end,
+                      ord(index.meta_char), index.skip, len(names)) + names
+    out = io.BytesIO()
+    out.write(b"CSI\x01")
+    out.write(struct.pack("<3i", index.min_shift, index.depth, len(aux)))
+    out.write(aux)
+    out.write(struct.pack("<i", len(index.refs)))
+    pseudo = _pseudo_bin(index.depth)
+    for ref in index.refs:
+        meta = ref.meta_chunk
+        out.write(struct.pack("<i", len(ref.bins) + (1 if meta else 0)))
+        for bin_no in sorted(ref.bins):
+            chunks = ref.bins[bin_no]
+            out.write(struct.pack("<IQi", bin_no, ref.loffsets.get(bin_no, 0), len(chunks)))
+            for cs, ce in chunks:
+                out.write(struct.pack("<QQ", cs, ce))
+        if meta:
+            out.write(struct.pack("<IQi", pseudo, 0, 2))
+            out.write(struct.pack("<QQQQ", meta[0], meta[1], ref.n_mapped or 0, 0))
+
+    writer = BgzfWriter(path)
+    try:
+        writer.write(out.getvalue())
+    finally:
+        writer.close()
+
+
+def find_index(path: PathLike) -> Optional[str]:
+    """Return the path of an existing .tbi / .csi index for *path*, if any."""
+    base = os.fspath(path)
+    for cand in (base + ".tbi", base + ".csi"):
+        if os.path.exists(cand):
+            return cand
+    return None
+
+
+def build_index(
+    path: PathLike,
+    *,
+    csi: bool = False,
+    min_shift: int = _TBI_MIN_SHIFT,
+    depth: int = _TBI_DEPTH,
+) -> TabixIndex:
+    """
+    Build a tabix index for a position-sorted, bgzipped VCF in one pass.
+    With *csi* the index is a CSI one with the given *min_shift* and
+    *depth* (save it with :func:`write_csi`); tabix fixes them at 14 / 5.
+    Raises ValueError if the file is not BGZF or not sorted.
+    """
+    if not csi and (min_shift, depth) != (_TBI_MIN_SHIFT, _TBI_DEPTH):
+        raise ValueError("tabix indexes use min_shift 14 and depth 5 — pass csi=True")
+    if not is_bgzf(path):
+        raise ValueError(f"{path} is not BGZF-compressed — recompress with bgzip to index it")
+
+    names: List[str] = []
+    refs: List[_RefIndex] = []
+    tid = -1
+    last_beg = -1
+    ref_start = 0
+
+    def add(line: bytes, start: int, end_v: int) -> None:
+        nonlocal tid, last_beg, ref_start
+        if not line or line[:1] == b"#":
+            return
+        cols = line.split(b"\t", 5)
+        if len(cols) < 4:
+            return
+        chrom = cols[0].decode()
+        beg = int(cols[1]) - 1
+        end = beg + max(len(cols[3]), 1)
+        if tid < 0 or names[tid] != chrom:
+            if chrom in names:
+                raise ValueError(f"{path} is not sorted: {chrom} appears in two blocks")
+            if tid >= 0:
+                refs[tid].meta_chunk = (ref_start, start)
+            names.append(chrom)
+            refs.append(_RefIndex(n_mapped=0))
+            tid = len(names) - 1
+            last_beg = -1
+            ref_start = start
+        if beg < last_beg:
+            raise ValueError(f"{path} is not position-sorted at {chrom}:{beg + 1}")
+        last_beg = beg
+
+        ref = refs[tid]
+        ref.n_mapped = (ref.n_mapped or 0) + 1
+        chunks = ref.bins.setdefault(_reg2bin(beg, end, min_shift, depth), [])
+        if chunks and chunks[-1][1] == start:
+            chunks[-1] = (chunks[-1][0], end_v)
+        else:
+            chunks.append((start, end_v))
+        w_end = (end - 1) >> min_shift
+        if len(ref.linear) <= w_end:
+            ref.linear.extend([0] * (w_end + 1 - len(ref.linear)))
+        for w in range(beg >> min_shift, w_end + 1):
+            if ref.linear[w] == 0:
+                ref.linear[w] = start
+
+    carry: Optional[bytearray] = None
+    carry_start = 0
+    last_end = 0
+    with open(path, "rb") as fh:
+        for coffset, data in iter_blocks(fh):
+            pos = 0
+            n = len(data)
+            while pos < n:
+                nl = data.find(b"\n", pos)
+                if nl < 0:
+                    if carry is None:
+                        carry, carry_start = bytearray(), make_voffset(coffset, pos)
+                    carry += data[pos:]
+                    break
+                end_v = make_voffset(coffset, nl + 1)
+                if carry is not None:
+                    carry += data[pos:nl]
+                    add(bytes(carry), carry_start, end_v)
+                    carry = None
+                else:
+                    add(data[pos:nl], make_voffset(coffset, pos), end_v)
+                last_end = end_v
+                pos = nl + 1
+    if carry:
+        add(bytes(carry), carry_start, last_end)
+    if tid >= 0:
+        refs[tid].meta_chunk = (ref_start, last_end)
+
+    # Empty linear windows inherit the previous window's offset
+    for ref in refs:
+        prev = 0
+        for i, off in enumerate(ref.linear):
+            if off == 0:
+                ref.linear[i] = prev
+            else:
+                prev = off
+
+    if csi:
+        # CSI keeps one offset per bin instead: the linear entry of the
+        # bin's first window, before which no overlapping record starts
+        for ref in refs:
+            ref.loffsets = {
+                b: ref.linear[min(_bin_beg(b, min_shift, depth) >> min_shift, len(ref.linear) - 1)]
+                for b in ref.bins
+            }
+            ref.linear = []
+        return TabixIndex(names=names, refs=refs, min_shift=min_shift, depth=depth, is_csi=True)
+    return TabixIndex(names=names, refs=refs)
+
+
+def load_index(path: PathLike, *, build: bool = False, save: bool = True) -> TabixIndex:
+    """
+    Load the .tbi / .csi index next to *path*.
+
+    When none exists and *build* is True, index the file on the fly and (if
+    *save*) write ``<path>.tbi`` so later queries skip the scan.
+    """
+    existing = find_index(path)
+    if existing:
+        return read_index(existing)
+    if not build:
+        raise FileNotFoundError(f"No .tbi/.csi index found for {path}")
+    index = build_index(path)
+    if save:
+        try:
+            write_tbi(index, os.fspath(path) + ".tbi")
+        except OSError as e:
+            print(f"[bgzf] Could not save index for {path}: {e}")
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Region queries
+# ---------------------------------------------------------------------------
+
+def fetch_lines(
+    reader: BgzfReader,
+    index: TabixIndex,
+    chrom: str,
+    start: int,
+    end: int,
+) -> Iterator[bytes]:
+    """
+    Yield the raw lines (without newline) of records overlapping
+    *chrom*:*start*-*end* (1-based, inclusive).
+    """
+    beg0, end0 = start - 1, end
+    tid = index.tid(chrom)
+    if tid is None:
+        return
+    name = index.names[tid].encode()
+
+    for cs, ce in index.chunks(chrom, beg0, end0):
+        reader.seek(cs)
+        while reader.tell() < ce:
+            line = reader.readline()
+            if not line:
+                break
+            line = line.rstrip(b"\r\n")
+            if not line or line[:1] == b"#":
+                continue
+            cols = line.split(b"\t", 5)
+            if len(cols) < 4 or cols[0] != name:
+                break
+            rbeg = int(cols[1]) - 1
+            if rbeg >= end0:
+                break
+            if rbeg + max(len(cols[3]), 1) > beg0:
+                yield line
@@ -9,7 +9,10 @@ import json
 import os
 from typing import Dict, List, Optional, Tuple
 from collections import Counter
-from pgx_knowledgebase import ALLELE_FUNCTION, KNOWN_GENES, _function_score, infer_phenotype, EXTENSIVE, INTERMEDIATE, POOR, ULTRA_RAPID, INDETERMINATE
+
+import llm_cache
+import llm_client
+from pgx_knowledgebase import KnowledgeBase, current, infer_phenotype, EXTENSIVE, INTERMEDIATE, POOR, ULTRA_RAPID, INDETERMINATE
 
 
 def generate_compatibility_summary(report: Dict[str, dict]) -> Optional[str]:
@@ -55,40 +58,35 @@ def generate_compatibility_summary(report: Dict[str, dict]) -> Optional[str]:
         + "\n\nPlease generate a patient-friendly summary of these results."
     )
 
-    try:
-        import urllib.request
-
-        request_body = json.dumps({
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            "temperature": 0.5,
-            "max_tokens": 400,
-        }).encode("utf-8")
+    request_body = json.dumps({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": 0.5,
+        "max_tokens": 400,
+    }).encode("utf-8")
+
+    # Same findings, same summary: reuse a cached completion
+    key = llm_cache.cache_key("compatibility", f"{base_url}/chat/completions", request_body)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
 
-        req = urllib.request.Request(
-            f"{base_url}/chat/completions",
-            data=request_body,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {api_key}",
-                "User-Agent": "Pharmaguard/1.0",
-            },
-            method="POST",
+    try:
+        content = llm_client.complete(
+            f"{base_url}/chat/completions", request_body, api_key,
+            kind="compatibility", timeout=30,
         )
-
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode("utf-8"))
-            content = data["choices"][0]["message"]["content"].strip()
-            print(f"[LLM] ✓ Generated compatibility summary ({len(content)} chars)")
-            return content
-
-    except Exception as e:
+    except llm_client.LLMError as e:
         print(f"[LLM] Compatibility summary generation failed: {e}")
         return None
 
+    print(f"[LLM] ✓ Generated compatibility summary ({len(content)} chars)")
+    llm_cache.put(key, content)
+    return content
+
 
 def extract_alleles(gene_data) -> List[str]:
     """
@@ -143,35 +141,16 @@ def extract_alleles(gene_data) -> List[str]:
     return alleles[:2]
 
 
-def get_phenotype_for_diplotype(gene: str, allele1: str, allele2: str) -> str:
+def get_phenotype_for_diplotype(gene: str, allele1: str, allele2: str,
+                                kb: Optional[KnowledgeBase] = None) -> str:
     """
     Calculate phenotype for a specific pair of alleles using KB logic.
+    Shares the knowledge base's phenotype memo with the analysis path.
     """
-    # Re-use infer_phenotype logic but adapting input format
-    # infer_phenotype expects list of detected allele dicts
-    
-    # We can manually calculate score to avoid reconstructing complex dicts
-    gene_funcs = ALLELE_FUNCTION.get(gene, {})
-    
-    # Get function for each allele
-    func1 = gene_funcs.get(allele1, "normal")
-    func2 = gene_funcs.get(allele2, "normal")
-    
-    score1 = _function_score(func1)
-    score2 = _function_score(func2)
-    
-    total = score1 + score2
-    
-    if total >= 2.5:
-        return ULTRA_RAPID
-    elif total >= 1.5:
-        return EXTENSIVE
-    elif total >= 1.0:
-        return INTERMEDIATE
-    else:
-        return POOR
+    return (kb or current()).phenotype_for_pair(gene, allele1, allele2)
 
-def calculate_inheritance(parent1_genes: List[dict], parent2_genes: List[dict]) -> Dict[str, dict]:
+def calculate_inheritance(parent1_genes: List[dict], parent2_genes: List[dict],
+                          kb: Optional[KnowledgeBase] = None) -> Dict[str, dict]:
     """
     Calculate inheritance probabilities for all known genes.
     
@@ -182,8 +161,9 @@ def calculate_inheritance(parent1_genes: List[dict], parent2_genes: List[dict])
     p2_map = {g.get("gene"): g.get("detectedAlleles", g.get("detected_alleles", [])) for g in parent2_genes}
     
     results = {}
+    kb = kb or current()
     
-    for gene in KNOWN_GENES:
+    for gene in kb.known_genes:
         # Get alleles for both parents
         # If gene not in analysis, assume *1/*1 (User might not have data, but we proceed with WT assumption for now)
         p1_alleles = extract_alleles(p1_map.get(gene, []))
@@ -210,7 +190,7 @@ def calculate_inheritance(parent1_genes: List[dict], parent2_genes: List[dict])
         outcome_stats = []
         
         for a1, a2 in offspring_genotypes:
-             phenotype = get_phenotype_for_diplotype(gene, a1, a2)
+             phenotype = get_phenotype_for_diplotype(gene, a1, a2, kb)
              outcome_stats.append({
                  "diplotype": f"{a1}/{a2}",
                  "phenotype": phenotype,
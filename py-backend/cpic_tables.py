@@ -11,36 +11,80 @@ automatically for **every gene** found.  Expected file-naming convention::
 Not every gene needs all three files.  If only two are present the
 loader will still pick up what it can.
 
-All data is loaded once at import time and stored in per-gene registries
-(plain dicts) so the rest of the codebase can call gene-agnostic helpers
-like ``get_activity_value("CYP2D6", "*4")``.
+Files are discovered at import time, but each table is only loaded on
+first use — through ``has_gene``, ``lookup_diplotype_phenotype`` and the
+other accessors — into the per-gene registries of a :class:`CpicTables`,
+so the rest of the codebase can call gene-agnostic helpers like
+``get_activity_value("CYP2D6", "*4")``.  A request that only touches
+CYP2C9 never loads the CYP2D6 diplotype table.  A knowledge-base reload
+discovers a fresh :class:`CpicTables` and installs it (:func:`install`); the
+module-level helpers always use the installed one.
+
+Parsing the workbooks is slow, so each parsed table is also written to a
+snapshot in ``data/tables/.snapshot/``, keyed by the size, mtime and
+SHA-256 of its source file.  Later loads use the snapshot and only
+re-read the ``.xlsx`` file when it changed.  Diplotype tables are
+snapshotted as memory-mapped :mod:`kb_store` files, so pre-forked
+workers share one read-only copy instead of each holding its own dict.
+Build or refresh every snapshot ahead of time with::
+
+    python cpic_tables.py --compile
 """
 
 from __future__ import annotations
 
+import hashlib
+import os
+import pickle
 import re
+import sys
+import threading
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-import openpyxl
+import kb_store
 
 # ---------------------------------------------------------------------------
 # Base path
 # ---------------------------------------------------------------------------
 _DATA_DIR = Path(__file__).resolve().parent / "data" / "tables"
+_SNAPSHOT_DIR = _DATA_DIR / ".snapshot"
+
+# Bump when the snapshot layout or any table parser changes
+_SNAPSHOT_FORMAT = 6
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _allele_sort_key(allele: str) -> float:
-    """Best-effort numeric sort for star-allele names (*1 < *2 < *10 …)."""
-    a = allele.lstrip("*").split("x")[0].split("+")[0]
-    a = a.replace("A", ".1").replace("B", ".2").replace("C", ".3")
-    try:
-        return float(a)
-    except ValueError:
-        return 999.0
+def _load_workbook(filepath: Path):
+    """Open an .xlsx read-only (openpyxl is only imported when needed)."""
+    import openpyxl
+    return openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+
+
+# "*2", "*2.001", "*3A", "*2xN", "*1x≥3", "*36+*10"
+_STAR_NAME_RE = re.compile(r"^\*(\d+)(?:\.(\d+))?([A-Z]*)(.*)$")
+
+
+def allele_sort_key(allele: str) -> Tuple[int, int, int, str, str]:
+    """
+    Natural sort key for allele names: star alleles by number, sub-allele,
+    letter suffix, then the rest (*1 < *1x2 < *2 < *2A < *3 < *10 < *36+*10),
+    then every other name (``c.2846A>T``, ``Reference``) alphabetically.
+    """
+    m = _STAR_NAME_RE.match(allele)
+    if m:
+        return (0, int(m.group(1)), int(m.group(2) or 0), m.group(3), m.group(4))
+    return (1, 0, 0, "", allele)
+
+
+def canonical_pair(allele1: str, allele2: str) -> Tuple[str, str]:
+    """The two alleles of a diplotype in canonical (:func:`allele_sort_key`) order."""
+    if allele_sort_key(allele2) < allele_sort_key(allele1):
+        return allele2, allele1
+    return allele1, allele2
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -105,38 +149,157 @@ class DiplotypePhenotype:
         return f"DiplotypePhenotype({self.diplotype}, AS={self.activity_score}, {self.phenotype})"
 
 
-# ═══════════════════════════════════════════════════════════════════════════
-# Per-gene registries — populated by _discover_and_load()
-# ═══════════════════════════════════════════════════════════════════════════
-
-# { gene: { rsid: (gene, star_allele) } }
-GENE_RSID_TO_ALLELE: Dict[str, Dict[str, Tuple[str, str]]] = {}
+class AlleleIndex:
+    """
+    Interned allele IDs for one gene, numbered in :func:`allele_sort_key`
+    order, so a diplotype becomes the integer pair ``(low, high)`` and
+    putting two alleles in canonical order is one integer comparison.
+    Names the index does not know fall back to :func:`canonical_pair`,
+    which orders them the same way.
+    """
+    __slots__ = ("names", "ids")
 
-# { gene: { star_allele: [rsids] } }
-GENE_ALLELE_TO_RSIDS: Dict[str, Dict[str, List[str]]] = {}
+    def __init__(self, names: Iterable[str]):
+        self.names: Tuple[str, ...] = tuple(sorted(set(names), key=allele_sort_key))
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
 
-# { gene: { star_allele: AlleleFunction } }
-GENE_ALLELE_FUNCTION: Dict[str, Dict[str, AlleleFunction]] = {}
+    def pair(self, allele1: str, allele2: str) -> Optional[Tuple[int, int]]:
+        """Canonical ID pair, or None if either allele is unknown."""
+        i = self.ids.get(allele1)
+        j = self.ids.get(allele2)
+        if i is None or j is None:
+            return None
+        return (i, j) if i <= j else (j, i)
 
-# { gene: { diplotype_str: DiplotypePhenotype } }  (includes reverse keys)
-GENE_DIPLOTYPE_PHENOTYPE: Dict[str, Dict[str, DiplotypePhenotype]] = {}
+    def canonical(self, allele1: str, allele2: str) -> Tuple[str, str]:
+        i = self.ids.get(allele1)
+        j = self.ids.get(allele2)
+        if i is None or j is None:
+            return canonical_pair(allele1, allele2)
+        return (allele2, allele1) if j < i else (allele1, allele2)
 
-# Set of genes that were successfully loaded from CPIC tables
-LOADED_GENES: Set[str] = set()
+    def __len__(self) -> int:
+        return len(self.names)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
 # 1.  Allele Definition Table loader (gene-agnostic)
 # ═══════════════════════════════════════════════════════════════════════════
 
+# "Position at NC_000010.11 (Homo sapiens chromosome 10, GRCh38.p2)"
+_CHROM_RE = re.compile(r"chromosome\s+(\w+)", re.IGNORECASE)
+# "g.94761900C>T", "g.94942213_94942222del", "g.42128199TCAG[1]"
+_GPOS_RE = re.compile(r"g\.(\d+)")
+_SNV_RE = re.compile(r"^g\.\d+[ACGT]>[ACGT]$")
+_SNV_PARTS_RE = re.compile(r"^g\.(\d+)([ACGT])>([ACGT])$")
+# IUPAC codes used in allele rows for sites with more than one defining base
+_IUPAC = {"R": "AG", "Y": "CT", "M": "AC", "K": "GT", "S": "CG", "W": "AT"}
+
+# Position-index key: (chrom, pos, ref, alt).  Non-SNV sites use "" for
+# ref and alt and are keyed at both the site and its VCF anchor base, since
+# the table gives no anchor base and indel spellings vary between callers.
+PositionKey = Tuple[str, int, str, str]
+
+# (variants, alleles): every defining variant of a gene as (chrom, pos,
+# ref, alt, hgvs_site, rsid), numbered by list index, and each star allele's
+# (definite, ambiguous) variant numbers.  Same "" convention for non-SNVs.
+AlleleDefinitions = Tuple[
+    List[Tuple[str, int, str, str, str, str]],
+    Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]],
+]
+
+
+def _parse_definition_sites(rows: List[tuple]) -> List[Tuple[str, int]]:
+    """
+    Read the GRCh38 position row (row 3) into sorted ``(chrom, pos)`` pairs.
+    Chromosomes are given without the ``chr`` prefix.  Indels are anchored
+    on the preceding base in VCF, so both positions are kept for them.
+    """
+    header = str(rows[3][0] or "")
+    m = _CHROM_RE.search(header)
+    if not m:
+        return []
+    chrom = m.group(1)
+
+    sites: Set[Tuple[str, int]] = set()
+    for val in rows[3][1:]:
+        if val is None:
+            continue
+        for part in str(val).split(";"):
+            part = part.strip()
+            pm = _GPOS_RE.match(part)
+            if not pm:
+                continue
+            pos = int(pm.group(1))
+            sites.add((chrom, pos))
+            if not _SNV_RE.match(part):
+                sites.add((chrom, pos - 1))
+    return sorted(sites, key=lambda s: s[1])
+
+
+def _parse_definition_columns(rows: List[tuple]) -> Dict[int, Tuple[str, int, str, str]]:
+    """
+    Map each column of the GRCh38 position row to ``(chrom, pos, ref,
+    label)``, where *label* is the HGVS text (e.g. ``g.94761900C>T``) and
+    *ref* is the reference base, or "" when the site is not an SNV.
+    """
+    m = _CHROM_RE.search(str(rows[3][0] or ""))
+    if not m:
+        return {}
+    chrom = m.group(1)
+
+    columns: Dict[int, Tuple[str, int, str, str]] = {}
+    for ci, val in enumerate(rows[3]):
+        if ci == 0 or val is None:
+            continue
+        label = str(val).strip()
+        parts = [p.strip() for p in label.split(";") if p.strip()]
+        pm = _GPOS_RE.match(parts[0]) if parts else None
+        if not pm:
+            continue
+        snvs = [_SNV_PARTS_RE.match(p) for p in parts]
+        ref = snvs[0].group(2) if all(snvs) else ""
+        columns[ci] = (chrom, int(pm.group(1)), ref, label)
+    return columns
+
+
+def _position_keys(site: Tuple[str, int, str, str], cell: str) -> List[PositionKey]:
+    """Index keys for an allele-row *cell* at definition column *site*."""
+    chrom, pos, ref, _ = site
+    if not ref:
+        return [(chrom, pos - 1, "", ""), (chrom, pos, "", "")]
+    return [(chrom, pos, ref, b) for b in _IUPAC.get(cell, cell) if b in "ACGT" and b != ref]
+
+
+def _defining_variants(
+    site: Tuple[str, int, str, str], cell: str, ref_cell: str,
+) -> Tuple[List[str], List[str]]:
+    """
+    The variants an allele-row *cell* defines at column *site*, as
+    ``(definite, ambiguous)`` lists of ALT bases ("" for a non-SNV site).
+    An IUPAC code makes each of its non-reference bases ambiguous.
+    """
+    ref = site[2]
+    if not ref:
+        return ([""] if cell and cell != ref_cell else []), []
+    if cell in ("A", "C", "G", "T"):
+        return ([cell] if cell != ref else []), []
+    return [], [b for b in _IUPAC.get(cell, "") if b != ref]
+
+
 def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
     Dict[str, Tuple[str, str]],
     Dict[str, List[str]],
+    List[Tuple[str, int]],
+    Dict[PositionKey, List[Tuple[str, str]]],
+    AlleleDefinitions,
 ]:
     rsid_to_allele: Dict[str, Tuple[str, str]] = {}
     allele_to_rsids: Dict[str, List[str]] = {}
+    position_alleles: Dict[PositionKey, List[Tuple[str, str]]] = {}
+    definitions: AlleleDefinitions = ([], {})
 
-    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    wb = _load_workbook(filepath)
     # Try common sheet names
     ws = None
     for name in ("Alleles", "Sheet1", wb.sheetnames[0]):
@@ -145,13 +308,16 @@ def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
             break
     if ws is None:
         wb.close()
-        return rsid_to_allele, allele_to_rsids
+        return rsid_to_allele, allele_to_rsids, [], position_alleles, definitions
 
     rows = list(ws.iter_rows(values_only=True))
     wb.close()
 
     if len(rows) < 7:
-        return rsid_to_allele, allele_to_rsids
+        return rsid_to_allele, allele_to_rsids, [], position_alleles, definitions
+
+    sites = _parse_definition_sites(rows)
+    columns = _parse_definition_columns(rows)
 
     # Row 5 (0-indexed) = rsIDs across columns
     rsid_row = rows[5]
@@ -179,6 +345,11 @@ def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
     # Build a label to skip (e.g. "CYP2D6 Allele", "CYP2C19 Allele")
     allele_header_label = f"{gene} Allele"
 
+    # Full definition of every star allele (the reference row and *1
+    # included) as (column, ALT) variants, for the multi-site caller
+    ref_cells: Optional[tuple] = None
+    allele_cells: Dict[str, Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]] = {}
+
     for ri in range(6, len(rows)):
         row = rows[ri]
         allele_name = row[0]
@@ -186,11 +357,26 @@ def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
             continue
         allele_name = str(allele_name).strip()
 
-        if allele_name in ("*1", allele_header_label):
+        if allele_name == allele_header_label:
             continue
+        if ref_cells is None:
+            ref_cells = row                # first allele row = reference sequence
         if not allele_name.startswith("*"):
             continue
 
+        definite: List[Tuple[int, str]] = []
+        ambiguous: List[Tuple[int, str]] = []
+        for ci, site in columns.items():
+            cell = str(row[ci]).strip() if ci < len(row) and row[ci] is not None else ""
+            ref_cell = ref_cells[ci] if ci < len(ref_cells) else None
+            alts, maybe = _defining_variants(site, cell, str(ref_cell or "").strip())
+            definite.extend((ci, alt) for alt in alts)
+            ambiguous.extend((ci, alt) for alt in maybe)
+        allele_cells[allele_name] = (definite, ambiguous)
+
+        if allele_name == "*1":
+            continue
+
         allele_rsids_list: List[str] = []
         for ci, rsid in col_rsids.items():
             if ci < len(row) and row[ci] is not None:
@@ -202,14 +388,37 @@ def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
             _allele_defining[allele_name] = allele_rsids_list
             allele_to_rsids[allele_name] = allele_rsids_list
 
+        # Same alleles by position, so rows without an rsID can match too
+        for ci, site in columns.items():
+            if ci < len(row) and row[ci] is not None:
+                cell_val = str(row[ci]).strip()
+                for key in _position_keys(site, cell_val):
+                    position_alleles.setdefault(key, []).append((allele_name, site[3]))
+
     # Build rsid→allele preferring lowest-numbered allele
-    sorted_alleles = sorted(_allele_defining.keys(), key=_allele_sort_key)
+    sorted_alleles = sorted(_allele_defining.keys(), key=allele_sort_key)
     for allele in sorted_alleles:
         for rsid in _allele_defining[allele]:
             if rsid not in rsid_to_allele:
                 rsid_to_allele[rsid] = (gene, allele)
 
-    return rsid_to_allele, allele_to_rsids
+    # ... and list the alleles at each position in the same order
+    for hits in position_alleles.values():
+        hits.sort(key=lambda h: allele_sort_key(h[0]))
+
+    # Number the defining variants in column order
+    variant_keys = sorted({v for d, a in allele_cells.values() for v in d + a})
+    variant_ids = {v: i for i, v in enumerate(variant_keys)}
+    for ci, alt in variant_keys:
+        chrom, pos, ref, label = columns[ci]
+        definitions[0].append((chrom, pos, ref, alt, label, col_rsids.get(ci, "")))
+    for allele, (definite, ambiguous) in allele_cells.items():
+        definitions[1][allele] = (
+            tuple(variant_ids[v] for v in definite),
+            tuple(variant_ids[v] for v in ambiguous),
+        )
+
+    return rsid_to_allele, allele_to_rsids, sites, position_alleles, definitions
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -219,7 +428,7 @@ def _load_allele_definitions(filepath: Path, gene: str) -> Tuple[
 def _load_allele_functionality(filepath: Path) -> Dict[str, AlleleFunction]:
     result: Dict[str, AlleleFunction] = {}
 
-    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    wb = _load_workbook(filepath)
     ws = None
     for name in ("Allele Function", "Sheet1", wb.sheetnames[0]):
         if name in wb.sheetnames:
@@ -264,7 +473,7 @@ def _load_allele_functionality(filepath: Path) -> Dict[str, AlleleFunction]:
 def _load_diplotype_phenotype(filepath: Path, gene: str) -> Dict[str, DiplotypePhenotype]:
     result: Dict[str, DiplotypePhenotype] = {}
 
-    wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    wb = _load_workbook(filepath)
     ws = None
     for name in ("Diplotypes", "Sheet1", wb.sheetnames[0]):
         if name in wb.sheetnames:
@@ -296,19 +505,18 @@ def _load_diplotype_phenotype(filepath: Path, gene: str) -> Dict[str, DiplotypeP
         phenotype = str(row[2]).strip() if row[2] else f"{gene} Indeterminate"
         ehr_priority = str(row[3]).strip() if len(row) > 3 and row[3] else ""
 
+        # One entry per unordered pair, keyed in canonical order;
+        # _DiplotypeTable answers the reverse order too
+        parts = diplotype.split("/")
+        if len(parts) == 2:
+            diplotype = "/".join(canonical_pair(*parts))
+        if diplotype in result:
+            continue
+
         result[diplotype] = DiplotypePhenotype(
             diplotype, activity_score, phenotype, ehr_priority, gene
         )
 
-        # Store reverse order too
-        parts = diplotype.split("/")
-        if len(parts) == 2:
-            reverse_key = f"{parts[1]}/{parts[0]}"
-            if reverse_key not in result:
-                result[reverse_key] = DiplotypePhenotype(
-                    reverse_key, activity_score, phenotype, ehr_priority, gene
-                )
-
     return result
 
 
@@ -322,14 +530,9 @@ _PAT_ALLELE_FUNC = re.compile(r"^(.+?)_allele_functionality_reference\.xlsx$", r
 _PAT_DIPLO_PHENO = re.compile(r"^(.+?)_Diplotype_Phenotype_Table\.xlsx$", re.IGNORECASE)
 
 
-def _discover_and_load() -> None:
-    """Scan _DATA_DIR for CPIC Excel files and load them into the registries."""
-    if not _DATA_DIR.exists():
-        print(f"[cpic_tables] WARNING: {_DATA_DIR} does not exist — no CPIC tables loaded")
-        return
-
-    # Group files by gene
-    gene_files: Dict[str, Dict[str, Path]] = {}  # gene → {"def"|"func"|"diplo": path}
+def _discover_files() -> Dict[str, Dict[str, Path]]:
+    """Group the CPIC workbooks in _DATA_DIR by gene → {"def"|"func"|"diplo": path}."""
+    gene_files: Dict[str, Dict[str, Path]] = {}
 
     for f in sorted(_DATA_DIR.iterdir()):
         if not f.is_file() or not f.suffix.lower() == ".xlsx":
@@ -352,52 +555,443 @@ def _discover_and_load() -> None:
             gene = m.group(1).upper()
             gene_files.setdefault(gene, {})["diplo"] = f
 
-    if not gene_files:
-        print("[cpic_tables] No CPIC Excel tables found in", _DATA_DIR)
-        return
+    return gene_files
 
-    print(f"[cpic_tables] Discovered CPIC tables for {len(gene_files)} gene(s): "
-          f"{', '.join(sorted(gene_files.keys()))}")
 
-    for gene in sorted(gene_files.keys()):
-        files = gene_files[gene]
-        print(f"\n  ── {gene} ──")
+def _parse_table(gene: str, kind: str, path: Path) -> Any:
+    """Read one workbook into plain, picklable data."""
+    if kind == "def":
+        return _load_allele_definitions(path, gene)
+    if kind == "func":
+        return [
+            (af.allele, af.activity_value, af.clinical_function, af.evidence)
+            for af in _load_allele_functionality(path).values()
+        ]
+    return {
+        key: (dp.activity_score, dp.phenotype, dp.ehr_priority)
+        for key, dp in _load_diplotype_phenotype(path, gene).items()
+    }
 
-        # 1. Allele definitions
-        if "def" in files:
-            rsid_map, allele_map = _load_allele_definitions(files["def"], gene)
-            GENE_RSID_TO_ALLELE[gene] = rsid_map
-            GENE_ALLELE_TO_RSIDS[gene] = allele_map
-            print(f"    Allele Definition:   {len(rsid_map)} rsID mappings, "
-                  f"{len(allele_map)} alleles")
 
-        # 2. Allele functionality
-        if "func" in files:
-            func_map = _load_allele_functionality(files["func"])
-            GENE_ALLELE_FUNCTION[gene] = func_map
-            print(f"    Allele Functionality: {len(func_map)} entries")
+class _DiplotypeTable(Mapping):
+    """
+    ``{diplotype: DiplotypePhenotype}`` view over a table of
+    ``diplotype → (activity_score, phenotype, ehr_priority)`` rows — normally
+    a memory-mapped :class:`kb_store.MappedTable` shared by every worker.
+    Rows are stored once per pair in canonical order; a reversed key is
+    answered from the same row.  Entries are built on access and not kept.
+    """
 
-        # 3. Diplotype-phenotype
-        if "diplo" in files:
-            diplo_map = _load_diplotype_phenotype(files["diplo"], gene)
-            raw_count = sum(1 for k, v in diplo_map.items() if k == v.diplotype)
-            GENE_DIPLOTYPE_PHENOTYPE[gene] = diplo_map
-            print(f"    Diplotype-Phenotype:  {raw_count} diplotypes "
-                  f"({len(diplo_map)} incl. reverse)")
+    __slots__ = ("_rows", "_gene")
 
-        LOADED_GENES.add(gene)
+    def __init__(self, rows: Mapping, gene: str):
+        self._rows = rows
+        self._gene = gene
 
-    print(f"\n[cpic_tables] Done — {len(LOADED_GENES)} gene(s) loaded.\n")
+    def _row(self, diplotype: str) -> tuple:
+        try:
+            return self._rows[diplotype]
+        except KeyError:
+            first, sep, second = diplotype.partition("/")
+            if not sep:
+                raise
+            return self._rows[f"{second}/{first}"]
 
+    def __getitem__(self, diplotype: str) -> DiplotypePhenotype:
+        return DiplotypePhenotype(diplotype, *self._row(diplotype), self._gene)
 
-# Run auto-discovery at import time
-_discover_and_load()
+    def __contains__(self, diplotype: object) -> bool:
+        if not isinstance(diplotype, str):
+            return False
+        try:
+            self._row(diplotype)
+        except KeyError:
+            return False
+        return True
 
-# Legacy aliases for backward compat (point to CYP2D6 if available)
-CYP2D6_RSID_TO_ALLELE  = GENE_RSID_TO_ALLELE.get("CYP2D6", {})
-CYP2D6_ALLELE_TO_RSIDS = GENE_ALLELE_TO_RSIDS.get("CYP2D6", {})
-CYP2D6_ALLELE_FUNCTION = GENE_ALLELE_FUNCTION.get("CYP2D6", {})
-CYP2D6_DIPLOTYPE_PHENOTYPE = GENE_DIPLOTYPE_PHENOTYPE.get("CYP2D6", {})
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+
+# ---------------------------------------------------------------------------
+# Snapshots
+# ---------------------------------------------------------------------------
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _source_info(path: Path, sha256: Optional[str] = None) -> Dict[str, Any]:
+    st = path.stat()
+    return {
+        "name": path.name,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256 or _content_hash(path),
+    }
+
+
+# Diplotype tables are by far the largest, so they are stored as
+# memory-mapped kb_store tables that all worker processes share; the
+# small definition/function tables are pickled.
+_MAPPED_KINDS = ("diplo",)
+
+
+def _snapshot_path(gene: str, kind: str) -> Path:
+    suffix = "kb" if kind in _MAPPED_KINDS else "pickle"
+    return _SNAPSHOT_DIR / f"{gene}.{kind}.{suffix}"
+
+
+def _open_snapshot(gene: str, kind: str) -> Optional[Dict[str, Any]]:
+    if kind in _MAPPED_KINDS:
+        table = kb_store.open_table(str(_snapshot_path(gene, kind)))
+        return None if table is None else {**table.meta, "table": table}
+    with open(_snapshot_path(gene, kind), "rb") as fh:
+        return pickle.load(fh)
+
+
+def _read_snapshot(gene: str, kind: str, path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return the snapshot of *gene*'s *kind* table if it was built from
+    *path* as it is now.  A file whose size/mtime changed is re-hashed, so
+    a touched but unchanged workbook does not force a re-parse.
+    """
+    try:
+        snap = _open_snapshot(gene, kind)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[cpic_tables] Ignoring unreadable snapshot for {gene} {kind}: {e}")
+        return None
+
+    if not isinstance(snap, dict) or snap.get("format") != _SNAPSHOT_FORMAT:
+        return None
+    src = snap["source"]
+    if src["name"] != path.name:
+        return None
+    st = path.stat()
+    if (src["size"], src["mtime_ns"]) != (st.st_size, st.st_mtime_ns):
+        sha = _content_hash(path)
+        if sha != src["sha256"]:
+            return None
+        snap["source"] = _source_info(path, sha)
+        _write_snapshot(gene, kind, snap)
+    return snap
+
+
+def _write_snapshot(gene: str, kind: str, snap: Dict[str, Any]) -> None:
+    """Atomically write *snap*; a read-only data dir only costs a warning."""
+    path = _snapshot_path(gene, kind)
+    try:
+        _SNAPSHOT_DIR.mkdir(exist_ok=True)
+        if kind in _MAPPED_KINDS:
+            meta = {k: v for k, v in snap.items() if k != "table"}
+            kb_store.write_table(str(path), snap["table"].items(), meta=meta)
+            return
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump(snap, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[cpic_tables] Could not write snapshot for {gene} {kind}: {e}")
+
+
+def _load_table(gene: str, kind: str, path: Path, *, rebuild: bool = False) -> Any:
+    """Load one table from its snapshot, or from the workbook if that is stale."""
+    snap = None if rebuild else _read_snapshot(gene, kind, path)
+    if snap is None:
+        print(f"[cpic_tables] Parsing {path.name}")
+        snap = {
+            "format": _SNAPSHOT_FORMAT,
+            "gene": gene,
+            "kind": kind,
+            "source": _source_info(path),
+            "table": _parse_table(gene, kind, path),
+        }
+        _write_snapshot(gene, kind, snap)
+        if kind in _MAPPED_KINDS:
+            # Serve from the shared mapping when the write succeeded
+            snap = _read_snapshot(gene, kind, path) or snap
+    return snap["table"]
+
+
+# ---------------------------------------------------------------------------
+# Lazy loading
+# ---------------------------------------------------------------------------
+
+_ALL_KINDS = ("def", "func", "diplo")
+
+
+# { path: ((size, mtime_ns), sha256) } so polling re-hashes only changed files
+_content_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+_content_hashes_lock = threading.Lock()
+
+
+def _content_hash(path: Path) -> str:
+    """SHA-256 of *path*, re-read only when its size or mtime changed."""
+    st = path.stat()
+    stamp = (st.st_size, st.st_mtime_ns)
+    key = str(path)
+    with _content_hashes_lock:
+        known = _content_hashes.get(key)
+    if known is not None and known[0] == stamp:
+        return known[1]
+    sha = _sha256(path)
+    with _content_hashes_lock:
+        _content_hashes[key] = (stamp, sha)
+    return sha
+
+
+def _discover_signature(gene_files: Dict[str, Dict[str, Path]]) -> str:
+    """
+    Hash of the workbooks' names and contents.  It is the same on every
+    host and checkout, and a touched but unchanged workbook leaves it as is.
+    """
+    digest = hashlib.sha256()
+    for gene in sorted(gene_files):
+        for kind in sorted(gene_files[gene]):
+            path = gene_files[gene][kind]
+            digest.update(f"{path.name}:{_content_hash(path)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def tables_signature() -> str:
+    """Signature of the tables currently in _DATA_DIR (compare with ``version``)."""
+    if not _DATA_DIR.exists():
+        return ""
+    return _discover_signature(_discover_files())
+
+
+class CpicTables:
+    """
+    One immutable generation of the CPIC tables: the workbooks discovered
+    in _DATA_DIR when it was created, loaded per (gene, table) on first
+    use.  Loading is thread-safe and each table loads at most once.
+
+    The module-level accessors below delegate to the :func:`current`
+    generation; a knowledge-base reload builds a new one and
+    :func:`install`\\ s it, while code holding the old one keeps using it.
+    """
+
+    def __init__(self, gene_files: Dict[str, Dict[str, Path]], version: str = ""):
+        self.gene_files = gene_files
+        # Hash (hex, truncated) of the discovered table files' names and
+        # contents; changes whenever a table does
+        self.version = version
+
+        # { gene: { rsid: (gene, star_allele) } }
+        self.rsid_to_allele: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        # { gene: { star_allele: [rsids] } }
+        self.allele_to_rsids: Dict[str, Dict[str, List[str]]] = {}
+        # { gene: { star_allele: AlleleFunction } }
+        self.allele_function: Dict[str, Dict[str, AlleleFunction]] = {}
+        # { gene: [(chrom, pos)] }  GRCh38 VCF positions of the allele-defining sites
+        self.definition_sites: Dict[str, List[Tuple[str, int]]] = {}
+        # { gene: { (chrom, pos, ref, alt): [(star_allele, hgvs_site)] } }  lowest allele first
+        self.position_alleles: Dict[str, Dict[PositionKey, List[Tuple[str, str]]]] = {}
+        # { gene: AlleleDefinitions }  full per-allele definitions (see star_caller)
+        self.allele_definitions: Dict[str, AlleleDefinitions] = {}
+        # { gene: { diplotype_str: DiplotypePhenotype } }  (canonical keys; reverse answered)
+        self.diplotype_phenotype: Dict[str, Mapping] = {}
+        # { gene: AlleleIndex }  built on first use from the def + func tables
+        self.allele_indexes: Dict[str, AlleleIndex] = {}
+        # Genes with at least one table loaded so far
+        self.loaded: Set[str] = set()
+
+        self._loaded_tables: Set[Tuple[str, str]] = set()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def discover(cls) -> "CpicTables":
+        """Register the CPIC workbooks in _DATA_DIR without loading them."""
+        if not _DATA_DIR.exists():
+            print(f"[cpic_tables] WARNING: {_DATA_DIR} does not exist — no CPIC tables loaded")
+            return cls({})
+
+        gene_files = _discover_files()
+        if not gene_files:
+            print("[cpic_tables] No CPIC Excel tables found in", _DATA_DIR)
+            return cls({})
+
+        print(f"[cpic_tables] Discovered CPIC tables for {len(gene_files)} gene(s): "
+              f"{', '.join(sorted(gene_files.keys()))}")
+        return cls(gene_files, _discover_signature(gene_files))
+
+    # ── loading ──
+
+    def _install(self, gene: str, kind: str, table: Any) -> None:
+        """Populate the registries for one table (see _parse_table)."""
+        if kind == "def":
+            rsid_map, allele_map, sites, positions, definitions = table
+            self.rsid_to_allele[gene] = rsid_map
+            self.allele_to_rsids[gene] = allele_map
+            self.definition_sites[gene] = sites
+            self.position_alleles[gene] = positions
+            self.allele_definitions[gene] = definitions
+            print(f"[cpic_tables] {gene} Allele Definition:   {len(rsid_map)} rsID mappings, "
+                  f"{len(allele_map)} alleles, {len(sites)} sites, "
+                  f"{len(positions)} position keys")
+        elif kind == "func":
+            func_map = {row[0]: AlleleFunction(*row) for row in table}
+            self.allele_function[gene] = func_map
+            print(f"[cpic_tables] {gene} Allele Functionality: {len(func_map)} entries")
+        else:
+            diplo_map = _DiplotypeTable(table, gene)
+            self.diplotype_phenotype[gene] = diplo_map
+            mapped = "memory-mapped" if isinstance(table, kb_store.MappedTable) else "in memory"
+            print(f"[cpic_tables] {gene} Diplotype-Phenotype:  {len(diplo_map)} diplotypes "
+                  f"({mapped})")
+        self.loaded.add(gene)
+
+    def ensure_loaded(self, gene: str, *kinds: str) -> None:
+        """Make sure the *kinds* tables (default: all) of *gene* are loaded."""
+        files = self.gene_files.get(gene)
+        if not files:
+            return
+        wanted = [k for k in (kinds or _ALL_KINDS) if k in files and (gene, k) not in self._loaded_tables]
+        if not wanted:
+            return
+        with self._lock:
+            for kind in wanted:
+                if (gene, kind) not in self._loaded_tables:
+                    self._install(gene, kind, _load_table(gene, kind, files[kind]))
+                    self._loaded_tables.add((gene, kind))
+
+    def load_all(self) -> None:
+        """Load every table now (e.g. before swapping this generation in)."""
+        for gene in sorted(self.gene_files):
+            self.ensure_loaded(gene)
+
+    def compile(self) -> None:
+        """Re-parse every discovered workbook and rewrite its snapshot."""
+        with self._lock:
+            for gene in sorted(self.gene_files):
+                for kind, path in sorted(self.gene_files[gene].items()):
+                    self._install(gene, kind, _load_table(gene, kind, path, rebuild=True))
+                    self._loaded_tables.add((gene, kind))
+        print(f"[cpic_tables] Done — {len(self.loaded)} gene(s) compiled.")
+
+    # ── gene-agnostic accessors ──
+
+    def has_gene(self, gene: str) -> bool:
+        return gene.upper() in self.gene_files
+
+    def genes(self) -> List[str]:
+        return sorted(self.gene_files)
+
+    def lookup_rsid(self, rsid: str, gene: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        if gene:
+            g = gene.upper()
+            self.ensure_loaded(g, "def")
+            return self.rsid_to_allele.get(g, {}).get(rsid)
+        # Search all genes in deterministic order
+        for g in sorted(self.gene_files):
+            self.ensure_loaded(g, "def")
+            hit = self.rsid_to_allele.get(g, {}).get(rsid)
+            if hit:
+                return hit
+        return None
+
+    def get_allele_function(self, gene: str, allele: str) -> Optional[AlleleFunction]:
+        g = gene.upper()
+        self.ensure_loaded(g, "func")
+        return self.allele_function.get(g, {}).get(allele)
+
+    def lookup_diplotype_phenotype(self, gene: str, diplotype: str) -> Optional[DiplotypePhenotype]:
+        g = gene.upper()
+        self.ensure_loaded(g, "diplo")
+        return self.diplotype_phenotype.get(g, {}).get(diplotype)
+
+    def allele_index(self, gene: str) -> AlleleIndex:
+        g = gene.upper()
+        index = self.allele_indexes.get(g)
+        if index is None:
+            self.ensure_loaded(g, "def", "func")
+            names = set(self.allele_function.get(g, {})) | set(self.allele_to_rsids.get(g, {}))
+            index = self.allele_indexes[g] = AlleleIndex(names)
+        return index
+
+    def get_rsids_for_allele(self, gene: str, allele: str) -> List[str]:
+        g = gene.upper()
+        self.ensure_loaded(g, "def")
+        return self.allele_to_rsids.get(g, {}).get(allele, [])
+
+    def get_definition_sites(self, gene: str) -> List[Tuple[str, int]]:
+        g = gene.upper()
+        self.ensure_loaded(g, "def")
+        return self.definition_sites.get(g, [])
+
+    def get_position_alleles(self, gene: str) -> Dict[PositionKey, List[Tuple[str, str]]]:
+        g = gene.upper()
+        self.ensure_loaded(g, "def")
+        return self.position_alleles.get(g, {})
+
+    def get_allele_definitions(self, gene: str) -> AlleleDefinitions:
+        g = gene.upper()
+        self.ensure_loaded(g, "def")
+        return self.allele_definitions.get(g, ([], {}))
+
+    def allele_functions(self, gene: str) -> Dict[str, AlleleFunction]:
+        g = gene.upper()
+        self.ensure_loaded(g, "func")
+        return self.allele_function.get(g, {})
+
+    def alleles_to_rsids(self, gene: str) -> Dict[str, List[str]]:
+        g = gene.upper()
+        self.ensure_loaded(g, "def")
+        return self.allele_to_rsids.get(g, {})
+
+
+_current = CpicTables.discover()
+
+
+def current() -> CpicTables:
+    """The CPIC table generation the module-level accessors use."""
+    return _current
+
+
+def install(tables: CpicTables) -> None:
+    """Make *tables* the current generation (a single atomic rebind)."""
+    global _current
+    _current = tables
+
+
+def compile_snapshots() -> None:
+    """Re-parse every discovered workbook and rewrite its snapshot."""
+    _current.compile()
+
+
+# Module attributes kept for backward compat, resolved against the current
+# generation; the CYP2D6_* aliases load only the table they name
+_REGISTRY_ATTRS = {
+    "GENE_RSID_TO_ALLELE": "rsid_to_allele",
+    "GENE_ALLELE_TO_RSIDS": "allele_to_rsids",
+    "GENE_ALLELE_FUNCTION": "allele_function",
+    "GENE_DEFINITION_SITES": "definition_sites",
+    "GENE_POSITION_ALLELES": "position_alleles",
+    "GENE_DIPLOTYPE_PHENOTYPE": "diplotype_phenotype",
+    "LOADED_GENES": "loaded",
+    "TABLES_VERSION": "version",
+}
+_LEGACY_ALIASES = {
+    "CYP2D6_RSID_TO_ALLELE": ("def", "rsid_to_allele"),
+    "CYP2D6_ALLELE_TO_RSIDS": ("def", "allele_to_rsids"),
+    "CYP2D6_ALLELE_FUNCTION": ("func", "allele_function"),
+    "CYP2D6_DIPLOTYPE_PHENOTYPE": ("diplo", "diplotype_phenotype"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _REGISTRY_ATTRS:
+        return getattr(_current, _REGISTRY_ATTRS[name])
+    if name in _LEGACY_ALIASES:
+        kind, attr = _LEGACY_ALIASES[name]
+        _current.ensure_loaded("CYP2D6", kind)
+        return getattr(_current, attr).get("CYP2D6", {})
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -405,13 +999,16 @@ CYP2D6_DIPLOTYPE_PHENOTYPE = GENE_DIPLOTYPE_PHENOTYPE.get("CYP2D6", {})
 # ═══════════════════════════════════════════════════════════════════════════
 
 def has_gene(gene: str) -> bool:
-    """Return True if CPIC tables were loaded for *gene*."""
-    return gene.upper() in LOADED_GENES
+    """
+    Return True if CPIC tables were discovered for *gene*.  Nothing is
+    loaded here; each table loads when an accessor first needs it.
+    """
+    return _current.has_gene(gene)
 
 
 def loaded_genes() -> List[str]:
-    """Return sorted list of genes with loaded CPIC tables."""
-    return sorted(LOADED_GENES)
+    """Return sorted list of genes with CPIC tables (loaded on first use)."""
+    return _current.genes()
 
 
 def lookup_rsid(rsid: str, gene: Optional[str] = None) -> Optional[Tuple[str, str]]:
@@ -422,25 +1019,17 @@ def lookup_rsid(rsid: str, gene: Optional[str] = None) -> Optional[Tuple[str, st
     Otherwise search all loaded genes (first match wins,
     deterministic order).
     """
-    if gene:
-        g = gene.upper()
-        return GENE_RSID_TO_ALLELE.get(g, {}).get(rsid)
-    # Search all genes in deterministic order
-    for g in sorted(GENE_RSID_TO_ALLELE.keys()):
-        hit = GENE_RSID_TO_ALLELE[g].get(rsid)
-        if hit:
-            return hit
-    return None
+    return _current.lookup_rsid(rsid, gene)
 
 
 def get_allele_function(gene: str, allele: str) -> Optional[AlleleFunction]:
     """Get the AlleleFunction entry for a gene + star allele."""
-    return GENE_ALLELE_FUNCTION.get(gene.upper(), {}).get(allele)
+    return _current.get_allele_function(gene, allele)
 
 
 def get_activity_value(gene: str, allele: str) -> float:
     """CPIC activity value for an allele.  Defaults to 1.0 if unknown."""
-    af = GENE_ALLELE_FUNCTION.get(gene.upper(), {}).get(allele)
+    af = _current.get_allele_function(gene, allele)
     if af and af.activity_value is not None:
         return af.activity_value
     return 1.0
@@ -448,7 +1037,7 @@ def get_activity_value(gene: str, allele: str) -> float:
 
 def get_clinical_function(gene: str, allele: str) -> str:
     """Clinical function label (e.g. 'No function') for a star allele."""
-    af = GENE_ALLELE_FUNCTION.get(gene.upper(), {}).get(allele)
+    af = _current.get_allele_function(gene, allele)
     if af:
         return af.clinical_function
     return "Unknown function"
@@ -456,7 +1045,7 @@ def get_clinical_function(gene: str, allele: str) -> str:
 
 def lookup_diplotype_phenotype(gene: str, diplotype: str) -> Optional[DiplotypePhenotype]:
     """Look up a diplotype in the official CPIC table for *gene*."""
-    return GENE_DIPLOTYPE_PHENOTYPE.get(gene.upper(), {}).get(diplotype)
+    return _current.lookup_diplotype_phenotype(gene, diplotype)
 
 
 def infer_phenotype_from_diplotype(gene: str, diplotype: str) -> Optional[str]:
@@ -464,7 +1053,7 @@ def infer_phenotype_from_diplotype(gene: str, diplotype: str) -> Optional[str]:
     Returns the metabolizer phenotype string (e.g. 'Intermediate Metabolizer')
     from the CPIC table, or None if not found.
     """
-    dp = GENE_DIPLOTYPE_PHENOTYPE.get(gene.upper(), {}).get(diplotype)
+    dp = _current.lookup_diplotype_phenotype(gene, diplotype)
     if dp:
         return dp.metabolizer_phenotype
     return None
@@ -472,27 +1061,40 @@ def infer_phenotype_from_diplotype(gene: str, diplotype: str) -> Optional[str]:
 
 def get_rsids_for_allele(gene: str, allele: str) -> List[str]:
     """Return all rsIDs that define *allele* for *gene*."""
-    return GENE_ALLELE_TO_RSIDS.get(gene.upper(), {}).get(allele, [])
+    return _current.get_rsids_for_allele(gene, allele)
+
+
+def get_definition_sites(gene: str) -> List[Tuple[str, int]]:
+    """Return the GRCh38 ``(chrom, pos)`` sites of *gene*'s allele definition table."""
+    return _current.get_definition_sites(gene)
+
+
+def get_position_alleles(gene: str) -> Dict[PositionKey, List[Tuple[str, str]]]:
+    """
+    Return *gene*'s ``(chrom, pos, ref, alt)`` → ``[(star_allele, hgvs_site)]``
+    index of the alleles each variant defines, lowest allele first.
+    """
+    return _current.get_position_alleles(gene)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
 # Legacy-compatible builders  (used by pgx_knowledgebase.py)
 # ═══════════════════════════════════════════════════════════════════════════
 
-def build_legacy_allele_function_dict(gene: str) -> Dict[str, str]:
+def build_legacy_allele_function_dict(gene: str, tables: Optional[CpicTables] = None) -> Dict[str, str]:
     """
     Build ``{ "*4": "no_function", … }`` for a gene, compatible with the
     ``ALLELE_FUNCTION[gene]`` format in pgx_knowledgebase.
     """
     result: Dict[str, str] = {}
-    for allele, af in GENE_ALLELE_FUNCTION.get(gene.upper(), {}).items():
+    for allele, af in (tables or _current).allele_functions(gene).items():
         if "x" in allele:
             continue
         result[allele] = af.to_legacy_function()
     return result
 
 
-def build_legacy_rsid_to_allele_dict(gene: str) -> Dict[str, Tuple[str, str]]:
+def build_legacy_rsid_to_allele_dict(gene: str, tables: Optional[CpicTables] = None) -> Dict[str, Tuple[str, str]]:
     """
     Build ``{ "rs3892097": ("CYP2D6", "*4"), … }`` for a gene,
     preferring the lowest-numbered allele when rsIDs are shared.
@@ -501,14 +1103,22 @@ def build_legacy_rsid_to_allele_dict(gene: str) -> Dict[str, Tuple[str, str]]:
     g = gene.upper()
     allele_rsid_pairs: List[Tuple[str, str]] = []
 
-    for allele, rsids in GENE_ALLELE_TO_RSIDS.get(g, {}).items():
+    for allele, rsids in (tables or _current).alleles_to_rsids(g).items():
         for rsid in rsids:
             allele_rsid_pairs.append((allele, rsid))
 
-    allele_rsid_pairs.sort(key=lambda x: _allele_sort_key(x[0]))
+    allele_rsid_pairs.sort(key=lambda x: allele_sort_key(x[0]))
 
     for allele, rsid in allele_rsid_pairs:
         if rsid not in result:
             result[rsid] = (g, allele)
 
     return result
+
+
+if __name__ == "__main__":
+    if "--compile" in sys.argv[1:]:
+        # Force a re-parse of every workbook and rewrite the snapshots
+        compile_snapshots()
+    else:
+        print("usage: python cpic_tables.py --compile")
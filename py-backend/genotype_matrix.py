@@ -0,0 +1,330 @@
+"""
+Columnar Genotype Matrix for Pharmaguard
+========================================
+Stores the genotype calls of a (cohort) VCF as NumPy arrays instead of one
+SampleGenotype object per sample per row:
+
+  - ``alleles``  int8 array of shape (n_sites, n_samples, ploidy)
+                 (allele index; MISSING for '.', PAD past a call's ploidy)
+  - ``phased``   per-call phase flags packed 8 per byte (np.packbits)
+  - site metadata (chrom, pos, id, ref, alt, gene, star, rsid) as parallel
+    1-D arrays indexed by site
+
+Per-sample variant counts, het / hom calls and ``is_variant`` are then
+single vectorized expressions over the whole cohort.
+
+Build one from a parsed file with ``VCFFile.to_genotype_matrix()``, or read
+straight into columns with ``read_genotype_matrix()`` — pass
+``targets=PGX_TARGET_SITES`` to keep only pharmacogenomic sites.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from parser import LazyGenotypes, TargetSites, VCFReader, VCFSource, Variant
+
+MISSING = -1          # '.' allele
+PAD = -2              # slot beyond this call's ploidy (e.g. haploid chrX)
+
+_INT8_MAX = 127
+
+
+def _object_array(values: List) -> np.ndarray:
+    """1-D object array (np.array would turn a list of lists into 2-D)."""
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _decode_call(gt: str) -> Tuple[Tuple[int, ...], bool]:
+    """Decode one GT string the way parser._parse_genotype does."""
+    phased = "|" in gt
+    if gt == ".":
+        return (MISSING,), phased
+    try:
+        alleles = tuple(
+            min(int(a), _INT8_MAX) if a != "." else MISSING
+            for a in gt.split("|" if phased else "/")
+        )
+    except ValueError:
+        return (MISSING,), phased
+    return alleles, phased
+
+
+def _fold(op, arrays: List[np.ndarray]) -> np.ndarray:
+    result = arrays[0]
+    for a in arrays[1:]:
+        result = op(result, a)
+    return result
+
+
+def _row_calls(variant: Variant, n_samples: int) -> List[str]:
+    genotypes = variant.genotypes
+    if isinstance(genotypes, LazyGenotypes):
+        calls = genotypes.calls()
+    else:
+        calls = [g.raw for g in genotypes]
+    if len(calls) < n_samples:
+        calls = calls + ["."] * (n_samples - len(calls))
+    return calls
+
+
+# ---------------------------------------------------------------------------
+# Matrix
+# ---------------------------------------------------------------------------
+
+@dataclass
+class GenotypeMatrix:
+    """Genotype calls of many samples at many sites, stored column-wise."""
+    samples: List[str]
+    alleles: np.ndarray                   # int8 (n_sites, n_samples, ploidy)
+    phased_bits: np.ndarray               # uint8 (n_sites, ceil(n_samples / 8))
+    chrom: np.ndarray                     # object (n_sites,)
+    pos: np.ndarray                       # int64 (n_sites,)
+    ids: np.ndarray                       # object (n_sites,)
+    ref: np.ndarray                       # object (n_sites,)
+    alt: np.ndarray                       # object (n_sites,) of List[str]
+    gene: np.ndarray                      # object (n_sites,), "" when absent
+    star: np.ndarray                      # object (n_sites,), "" when absent
+    rsid: np.ndarray                      # object (n_sites,), "" when absent
+
+    # ---------- construction ----------
+    @classmethod
+    def from_variants(cls, variants: Iterable[Variant], samples: List[str]) -> "GenotypeMatrix":
+        """
+        Build a matrix from Variant rows (consumed one at a time, so a
+        streaming reader can be passed directly).
+
+        Each distinct GT string is decoded once; rows are stored as codes
+        into that small table and expanded with a single fancy-index.
+        """
+        n_samples = len(samples)
+        memo: Dict[str, int] = {}
+        table: List[Tuple[Tuple[int, ...], bool]] = []
+
+        def code(gt: str) -> int:
+            c = memo.get(gt)
+            if c is None:
+                c = memo[gt] = len(table)
+                table.append(_decode_call(gt))
+            return c
+
+        code_rows: List[np.ndarray] = []
+        chrom: List[str] = []
+        pos: List[int] = []
+        ids: List[str] = []
+        ref: List[str] = []
+        alt: List[List[str]] = []
+        gene: List[str] = []
+        star: List[str] = []
+        rsid: List[str] = []
+
+        for v in variants:
+            calls = _row_calls(v, n_samples)
+            code_rows.append(np.fromiter(
+                (code(gt) for gt in calls[:n_samples]), dtype=np.int32, count=n_samples,
+            ))
+            chrom.append(v.chrom)
+            pos.append(v.pos)
+            ids.append(v.id)
+            ref.append(v.ref)
+            alt.append(v.alt)
+            gene.append((v.gene or "").upper())
+            star.append(v.star_allele or "")
+            rsid.append(v.rsid or "")
+
+        ploidy = max((len(a) for a, _ in table), default=2)
+        call_alleles = np.full((len(table), ploidy), PAD, dtype=np.int8)
+        call_phased = np.zeros(len(table), dtype=bool)
+        for i, (a, phased) in enumerate(table):
+            call_alleles[i, :len(a)] = a
+            call_phased[i] = phased
+
+        if code_rows:
+            codes = np.vstack(code_rows)
+            alleles = call_alleles[codes]
+            phased_bits = np.packbits(call_phased[codes], axis=1)
+        else:
+            alleles = np.full((0, n_samples, ploidy), PAD, dtype=np.int8)
+            phased_bits = np.zeros((0, (n_samples + 7) // 8), dtype=np.uint8)
+
+        return cls(
+            samples=list(samples),
+            alleles=alleles,
+            phased_bits=phased_bits,
+            chrom=_object_array(chrom),
+            pos=np.asarray(pos, dtype=np.int64),
+            ids=_object_array(ids),
+            ref=_object_array(ref),
+            alt=_object_array(alt),
+            gene=_object_array(gene),
+            star=_object_array(star),
+            rsid=_object_array(rsid),
+        )
+
+    # ---------- shape ----------
+    @property
+    def n_sites(self) -> int:
+        return self.alleles.shape[0]
+
+    @property
+    def n_samples(self) -> int:
+        return self.alleles.shape[1]
+
+    @property
+    def ploidy(self) -> int:
+        return self.alleles.shape[2]
+
+    def sample_index(self, sample: str) -> int:
+        """Column of *sample*; raises KeyError if absent."""
+        try:
+            return self.samples.index(sample)
+        except ValueError:
+            raise KeyError(sample) from None
+
+    # ---------- vectorized calls (all return (n_sites, n_samples)) ----------
+    @property
+    def phased(self) -> np.ndarray:
+        return np.unpackbits(self.phased_bits, axis=1, count=self.n_samples).astype(bool)
+
+    def _planes(self) -> List[np.ndarray]:
+        # Combining the (n_sites, n_samples) planes one by one is ~10x
+        # faster than reducing over the short trailing ploidy axis.
+        return [self.alleles[:, :, k] for k in range(self.ploidy)]
+
+    def is_variant(self) -> np.ndarray:
+        """At least one ALT allele (same rule as SampleGenotype.is_variant)."""
+        return _fold(np.logical_or, [p > 0 for p in self._planes()])
+
+    def is_called(self) -> np.ndarray:
+        """Every allele of the call is present (no '.')."""
+        planes = self._planes()
+        complete = _fold(np.logical_and, [(p >= 0) | (p == PAD) for p in planes])
+        return complete & _fold(np.logical_or, [p >= 0 for p in planes])
+
+    def alt_allele_count(self) -> np.ndarray:
+        """Number of ALT alleles per call (dosage), int8."""
+        return _fold(np.add, [(p > 0).astype(np.int8) for p in self._planes()])
+
+    def is_het(self) -> np.ndarray:
+        planes = self._planes()
+        hi = _fold(np.maximum, [np.where(p >= 0, p, MISSING) for p in planes])
+        lo = _fold(np.minimum, [np.where(p >= 0, p, _INT8_MAX) for p in planes])
+        return self.is_called() & (hi != lo)
+
+    def is_hom_ref(self) -> np.ndarray:
+        ref_only = _fold(np.logical_and, [(p == 0) | (p == PAD) for p in self._planes()])
+        return self.is_called() & ref_only
+
+    def is_hom_alt(self) -> np.ndarray:
+        return self.is_called() & ~self.is_het() & self.is_variant()
+
+    # ---------- per-sample summaries (n_samples,) ----------
+    def variant_counts(self) -> np.ndarray:
+        """Sites carrying at least one ALT allele, per sample."""
+        return self.is_variant().sum(axis=0)
+
+    def het_counts(self) -> np.ndarray:
+        return self.is_het().sum(axis=0)
+
+    def hom_alt_counts(self) -> np.ndarray:
+        return self.is_hom_alt().sum(axis=0)
+
+    # ---------- selection ----------
+    def gene_mask(self, gene: str) -> np.ndarray:
+        return self.gene == gene.upper()
+
+    def select_sites(self, mask) -> "GenotypeMatrix":
+        """Sub-matrix of the sites picked by a boolean mask or index array."""
+        return GenotypeMatrix(
+            samples=self.samples,
+            alleles=self.alleles[mask],
+            phased_bits=self.phased_bits[mask],
+            chrom=self.chrom[mask],
+            pos=self.pos[mask],
+            ids=self.ids[mask],
+            ref=self.ref[mask],
+            alt=self.alt[mask],
+            gene=self.gene[mask],
+            star=self.star[mask],
+            rsid=self.rsid[mask],
+        )
+
+    def select_samples(self, samples: List[str]) -> "GenotypeMatrix":
+        cols = [self.sample_index(s) for s in samples]
+        phased = self.phased[:, cols]
+        return GenotypeMatrix(
+            samples=list(samples),
+            alleles=self.alleles[:, cols],
+            phased_bits=np.packbits(phased, axis=1),
+            chrom=self.chrom,
+            pos=self.pos,
+            ids=self.ids,
+            ref=self.ref,
+            alt=self.alt,
+            gene=self.gene,
+            star=self.star,
+            rsid=self.rsid,
+        )
+
+    def gt_strings(self, sample: str) -> List[str]:
+        """VCF-style GT strings ("0|1", "./.") of one sample at every site."""
+        col = self.sample_index(sample)
+        alleles = self.alleles[:, col, :]
+        phased = self.phased[:, col]
+        out = []
+        for row, is_phased in zip(alleles.tolist(), phased.tolist()):
+            parts = ["." if a == MISSING else str(a) for a in row if a != PAD]
+            out.append(("|" if is_phased else "/").join(parts))
+        return out
+
+    def summary(self) -> dict:
+        return {
+            "sites": self.n_sites,
+            "samples": self.n_samples,
+            "ploidy": self.ploidy,
+            "genes": sorted(g for g in set(self.gene.tolist()) if g),
+            "variantCounts": dict(zip(self.samples, self.variant_counts().tolist())),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def read_genotype_matrix(
+    source: VCFSource,
+    *,
+    targets: Optional[TargetSites] = None,
+    samples: Optional[Iterable[str]] = None,
+) -> GenotypeMatrix:
+    """
+    Stream *source* straight into a :class:`GenotypeMatrix`; no per-row
+    Variant objects are kept.  *targets* and *samples* are as for
+    :class:`parser.VCFReader`.
+    """
+    with VCFReader(source, targets=targets, samples=samples) as reader:
+        return GenotypeMatrix.from_variants(reader, reader.samples)
+
+
+# ---------------------------------------------------------------------------
+# CLI quick-test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import json
+    import os
+    import sys
+
+    from pgx_knowledgebase import PGX_TARGET_SITES
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), "data", "100samples.vcf.bgz"
+    )
+    print(f"Reading: {path}")
+    matrix = read_genotype_matrix(path, targets=PGX_TARGET_SITES)
+    print(json.dumps(matrix.summary(), indent=2))
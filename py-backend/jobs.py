@@ -0,0 +1,316 @@
+"""
+Background Jobs for Pharmaguard
+===============================
+Runs long requests (``/analyze?async=true``) off the request thread:
+:meth:`JobRunner.submit` records a job, queues it and returns its ID at
+once; a fixed set of worker threads takes jobs off a bounded queue, and
+clients poll the job's record (``GET /jobs/<id>``) for its status and
+result.
+
+A job record is a plain dict::
+
+    {"id", "kind", "status", "attempts", "createdAt", "updatedAt",
+     "result", "error"}
+
+with ``status`` one of ``queued`` / ``running`` / ``done`` / ``failed``.
+A job that raises is re-queued with backoff up to *max_attempts* times,
+unless it raises :class:`JobFailed` (bad input fails on every attempt).
+
+Records live in a store: :class:`MemoryJobStore` (one process only),
+:class:`SqliteJobStore` or :class:`MongoJobStore` (shared between gunicorn
+workers, so any worker can answer a poll).  The work itself and its
+inputs stay in the process that accepted the job; a job whose process
+exits before it finishes stays ``queued``/``running`` until purged.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_PURGE_EVERY = 64
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity; the caller should retry later."""
+
+
+class JobFailed(Exception):
+    """Raised by a job to fail without retrying; the message becomes its error."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------------------------------------------------------------------------
+# Stores
+# ---------------------------------------------------------------------------
+
+class MemoryJobStore:
+    """Job records in a dict; only the process that created a job sees it."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: dict) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updatedAt=_now())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def purge(self, older_than: float) -> None:
+        """Drop finished jobs last updated more than *older_than* seconds ago."""
+        cutoff = datetime.fromtimestamp(time.time() - older_than, timezone.utc).isoformat()
+        with self._lock:
+            for job_id in [k for k, j in self._jobs.items()
+                           if j["status"] in (DONE, FAILED) and j["updatedAt"] < cutoff]:
+                del self._jobs[job_id]
+
+
+class SqliteJobStore:
+    """Job records in a SQLite file, shared between worker processes."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs "
+            "(id TEXT PRIMARY KEY, status TEXT NOT NULL, updated REAL NOT NULL, doc TEXT NOT NULL)"
+        )
+
+    def create(self, job: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, updated, doc) VALUES (?, ?, ?, ?)",
+                (job["id"], job["status"], time.time(), json.dumps(job)),
+            )
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            row = self._db.execute("SELECT doc FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields, updatedAt=_now())
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, doc = ? WHERE id = ?",
+                (job["status"], time.time(), json.dumps(job), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT doc FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def purge(self, older_than: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+
+
+class MongoJobStore:
+    """Job records as ``{_id: id, ...}`` documents in *collection*."""
+
+    name = "mongo"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def create(self, job: dict) -> None:
+        self.collection.insert_one({"_id": job["id"], **job, "updated": time.time()})
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        self.collection.update_one(
+            {"_id": job_id}, {"$set": {**fields, "updatedAt": _now(), "updated": time.time()}},
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        doc = self.collection.find_one({"_id": job_id})
+        if doc is None:
+            return None
+        doc.pop("_id", None)
+        doc.pop("updated", None)
+        return doc
+
+    def purge(self, older_than: float) -> None:
+        self.collection.delete_many(
+            {"status": {"$in": [DONE, FAILED]}, "updated": {"$lt": time.time() - older_than}},
+        )
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+class JobRunner:
+    """
+    *workers* threads running jobs from a queue of at most *max_queue*.
+    Finished jobs are purged from the store *retention* seconds after
+    they finish.
+    """
+
+    def __init__(
+        self,
+        store,
+        *,
+        workers: int = 4,
+        max_queue: int = 64,
+        max_attempts: int = 3,
+        backoff: float = 1.0,
+        retention: float = 3600.0,
+    ):
+        self.store = store
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.retention = retention
+        self._queue: "queue.Queue[Tuple[str, Callable[[], Any]]]" = queue.Queue(max_queue)
+        self._submitted = 0
+        self._cleanups: Dict[str, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, kind: str, fn: Callable[[], Any], *, cleanup: Optional[Callable[[], None]] = None) -> str:
+        """
+        Queue ``fn()`` and return the new job's ID; its return value
+        (JSON-serializable) becomes the job's ``result``.  Raises
+        :class:`QueueFull` when the queue is at capacity.  ``cleanup()``
+        runs once the job is done or has failed for good (after its last
+        attempt), or at once if it could not be queued.
+        """
+        job_id = uuid.uuid4().hex
+        now = _now()
+        job = {"id": job_id, "kind": kind, "status": QUEUED, "attempts": 0,
+               "createdAt": now, "updatedAt": now, "result": None, "error": None}
+        if cleanup is not None:
+            with self._lock:
+                self._cleanups[job_id] = cleanup
+        if self._queue.full():
+            self._finish(job_id)
+            raise QueueFull(f"{self._queue.maxsize} jobs already queued")
+        self.store.create(job)
+        try:
+            self._queue.put_nowait((job_id, fn))
+        except queue.Full:
+            self._fail(job_id, "Job queue is full")
+            raise QueueFull(f"{self._queue.maxsize} jobs already queued") from None
+
+        with self._lock:
+            self._submitted += 1
+            purge = self._submitted % _PURGE_EVERY == 0
+        if purge:
+            try:
+                self.store.purge(self.retention)
+            except Exception as e:
+                print(f"[jobs] Purge failed: {e}")
+        return job_id
+
+    def record(self, kind: str, result: Any) -> str:
+        """Store an already finished job (e.g. a cache hit) and return its ID."""
+        job_id = uuid.uuid4().hex
+        now = _now()
+        self.store.create({"id": job_id, "kind": kind, "status": DONE, "attempts": 0,
+                           "createdAt": now, "updatedAt": now, "result": result, "error": None})
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def _work(self) -> None:
+        while True:
+            job_id, fn = self._queue.get()
+            try:
+                self._run(job_id, fn)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str, fn: Callable[[], Any]) -> None:
+        job = self.store.get(job_id) or {"attempts": 0}
+        attempt = job["attempts"] + 1
+        self.store.update(job_id, status=RUNNING, attempts=attempt)
+        try:
+            result = fn()
+        except Exception as e:
+            error = str(e) if isinstance(e, JobFailed) else f"{type(e).__name__}: {e}"
+            if isinstance(e, JobFailed) or attempt >= self.max_attempts:
+                print(f"[jobs] {job_id[:8]} failed after {attempt} attempt(s): {error}")
+                self._fail(job_id, error)
+                return
+            print(f"[jobs] {job_id[:8]} attempt {attempt} failed, retrying: {error}")
+            self.store.update(job_id, status=QUEUED, error=error)
+            # Re-queue after the backoff without holding this worker
+            timer = threading.Timer(self.backoff * 2 ** (attempt - 1), self._requeue, (job_id, fn))
+            timer.daemon = True
+            timer.start()
+            return
+        try:
+            self.store.update(job_id, status=DONE, result=result, error=None)
+        finally:
+            self._finish(job_id)
+
+    def _requeue(self, job_id: str, fn: Callable[[], Any]) -> None:
+        try:
+            self._queue.put_nowait((job_id, fn))
+        except queue.Full:
+            self._fail(job_id, "Job queue is full (retry dropped)")
+
+    def _fail(self, job_id: str, error: str) -> None:
+        try:
+            self.store.update(job_id, status=FAILED, error=error)
+        finally:
+            self._finish(job_id)
+
+    def _finish(self, job_id: str) -> None:
+        """Run the job's cleanup, if it has one."""
+        with self._lock:
+            cleanup = self._cleanups.pop(job_id, None)
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception as e:
+                print(f"[jobs] Cleanup of {job_id[:8]} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "store": self.store.name,
+            "workers": len(self._threads),
+            "queued": self._queue.qsize(),
+            "maxQueue": self._queue.maxsize,
+            "submitted": self._submitted,
+        }
@@ -0,0 +1,162 @@
+"""
+Memory-Mapped Knowledge-Base Tables for Pharmaguard
+===================================================
+An immutable string-keyed hash table stored in one file and read through
+``mmap``.  Lookups hash the key, probe the slot array and decode only the
+matching record, so no Python objects are built for the table itself.
+Every gunicorn worker that maps the same file shares its pages through
+the OS page cache, and refcounting cannot break copy-on-write sharing
+because there are no per-entry objects to touch.
+
+File layout (little-endian)::
+
+    magic    8s   b"PGXKB\\x00\\x01\\x00"
+    meta_len u32  length of the JSON metadata blob that follows
+    n_items  u32
+    n_slots  u32  power of two, at least 2 × n_items
+    meta     JSON (free-form, e.g. snapshot source info)
+    slots    n_slots × u64   absolute record offset, 0 = empty
+    records  key_len u16, val_len u32, key (UTF-8), value (marshal)
+
+Values are ``marshal``-encoded builtins (tuples, strings, numbers, None).
+``marshal.version`` and the file size are recorded in the metadata;
+:func:`open_table` rejects files written by a different version and
+truncated files.
+"""
+
+from __future__ import annotations
+
+import json
+import marshal
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+_MAGIC = b"PGXKB\x00\x01\x00"
+_HEADER = struct.Struct("<8sIII")
+_SLOT = struct.Struct("<Q")
+_RECORD = struct.Struct("<HI")
+
+
+def _hash(key: bytes) -> int:
+    return zlib.crc32(key)
+
+
+def write_table(path: str, items: Iterable[Tuple[str, Any]], meta: Optional[Dict[str, Any]] = None) -> None:
+    """Write *items* (key → marshal-able value) to *path* atomically.
+
+    A repeated key keeps its last value, as in ``dict(items)``.
+    """
+    entries = [(k.encode("utf-8"), marshal.dumps(v)) for k, v in dict(items).items()]
+    n_slots = 8
+    while n_slots < 2 * len(entries):
+        n_slots *= 2
+
+    records_len = sum(_RECORD.size + len(k) + len(v) for k, v in entries)
+    meta = {**(meta or {}), "marshal": marshal.version}
+    # The file size depends on the metadata length, which includes it
+    size = 0
+    while True:
+        meta_blob = json.dumps({**meta, "file_size": size}).encode("utf-8")
+        base = _HEADER.size + len(meta_blob) + n_slots * _SLOT.size
+        if base + records_len == size:
+            break
+        size = base + records_len
+
+    slots = [0] * n_slots
+    records = bytearray()
+    mask = n_slots - 1
+    for key, value in entries:
+        offset = base + len(records)
+        records += _RECORD.pack(len(key), len(value)) + key + value
+        i = _hash(key) & mask
+        while slots[i]:
+            i = (i + 1) & mask
+        slots[i] = offset
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, len(meta_blob), len(entries), n_slots))
+        fh.write(meta_blob)
+        fh.write(struct.pack(f"<{n_slots}Q", *slots))
+        fh.write(records)
+    os.replace(tmp, path)
+
+
+class MappedTable(Mapping):
+    """Read-only ``Mapping[str, Any]`` over a file written by :func:`write_table`."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, meta_len, self._n_items, self._n_slots = _HEADER.unpack_from(self._mm, 0)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a knowledge-base table")
+            start = _HEADER.size
+            self.meta: Dict[str, Any] = json.loads(self._mm[start:start + meta_len])
+            if self.meta.get("file_size") != len(self._mm):
+                raise ValueError(f"{path} is truncated or was not fully written")
+        except BaseException:
+            self._mm.close()
+            raise
+        self._slots_at = start + meta_len
+
+    def _record(self, offset: int) -> Tuple[bytes, int, int]:
+        key_len, val_len = _RECORD.unpack_from(self._mm, offset)
+        key_at = offset + _RECORD.size
+        return self._mm[key_at:key_at + key_len], key_at + key_len, val_len
+
+    def _find(self, key: str) -> Optional[Tuple[int, int]]:
+        raw = key.encode("utf-8")
+        mask = self._n_slots - 1
+        i = _hash(raw) & mask
+        while True:
+            (offset,) = _SLOT.unpack_from(self._mm, self._slots_at + i * _SLOT.size)
+            if not offset:
+                return None
+            k, val_at, val_len = self._record(offset)
+            if k == raw:
+                return val_at, val_len
+            i = (i + 1) & mask
+
+    def __getitem__(self, key: str) -> Any:
+        if not isinstance(key, str):
+            raise KeyError(key)
+        hit = self._find(key)
+        if hit is None:
+            raise KeyError(key)
+        val_at, val_len = hit
+        return marshal.loads(self._mm[val_at:val_at + val_len])
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) is not None
+
+    def __len__(self) -> int:
+        return self._n_items
+
+    def __iter__(self) -> Iterator[str]:
+        offset = self._slots_at + self._n_slots * _SLOT.size
+        end = len(self._mm)
+        while offset < end:
+            k, val_at, val_len = self._record(offset)
+            yield k.decode("utf-8")
+            offset = val_at + val_len
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def open_table(path: str) -> Optional[MappedTable]:
+    """Map *path*, or None if it is missing, corrupt or from another marshal version."""
+    try:
+        table = MappedTable(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if table.meta.get("marshal") != marshal.version:
+        table.close()
+        return None
+    return table
@@ -0,0 +1,93 @@
+"""
+LLM Output Cache for Pharmaguard
+================================
+Two-tier cache of LLM completions: the per-drug clinical explanations
+(:mod:`analyzer`), the patient summary (``app.summarize_results``) and the
+compatibility summary (:mod:`compatibility`).
+
+A completion is keyed by :func:`cache_key` over the endpoint and the exact
+request body, so everything that shapes the output (drug, gene, phenotype,
+cited variants, model, prompt text and sampling parameters) is part of
+the key, plus :data:`PROMPT_VERSION` to retire entries when how a
+response is used changes.  Thousands of patients with the same inputs
+(every CYP2C19 \\*2/\\*2 on clopidogrel) then share one completion.
+
+Configured from the environment:
+
+  - ``LLM_CACHE_SIZE``     in-memory LRU entries (default 4096, 0 = off)
+  - ``LLM_CACHE_DB``       SQLite file for the persistent tier (default
+                           ``data/llm_cache.sqlite``, empty = memory only)
+  - ``LLM_CACHE_MAX_ROWS`` SQLite rows kept, least recently read evicted
+                           first (default 100000)
+  - ``LLM_CACHE_TTL_S``    seconds before an entry is regenerated
+                           (default 30 days, 0 = never)
+
+``warm_llm_cache.py`` pre-fills it by analyzing representative VCFs.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional, Union
+
+from result_cache import ResultCache, SqliteTier
+
+# Bump to invalidate every cached completion
+PROMPT_VERSION = 1
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cache_key(kind: str, endpoint: str, body: Union[bytes, str]) -> str:
+    """Key for the completion of request *body* (as sent) of type *kind* at *endpoint*."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    h = hashlib.sha256(f"{kind}\0{PROMPT_VERSION}\0{endpoint}\0".encode("utf-8"))
+    h.update(body)
+    return h.hexdigest()
+
+
+def _build_cache() -> ResultCache:
+    ttl = float(os.environ.get("LLM_CACHE_TTL_S", str(30 * 24 * 3600))) or None
+    tier = None
+    path = os.environ.get("LLM_CACHE_DB", os.path.join(HERE, "data", "llm_cache.sqlite"))
+    if path:
+        try:
+            tier = SqliteTier(path, table="completions", ttl=ttl,
+                              max_entries=int(os.environ.get("LLM_CACHE_MAX_ROWS", "100000")) or None)
+        except Exception as e:
+            print(f"[llm_cache] Persistent tier unavailable ({path}): {e}")
+    return ResultCache(int(os.environ.get("LLM_CACHE_SIZE", "4096")), tier=tier, ttl=ttl)
+
+
+# Built on first use, so importing this module opens no database
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = _build_cache()
+        return _cache
+
+
+def get(key: str) -> Optional[str]:
+    """Cached completion text for *key*, or None."""
+    entry = _get_cache().get(key)
+    return entry["text"] if entry is not None else None
+
+
+def put(key: str, text: str) -> None:
+    _get_cache().put(key, {"text": text})
+
+
+def clear() -> None:
+    _get_cache().clear()
+
+
+def stats() -> Dict[str, Any]:
+    return _get_cache().stats()
@@ -0,0 +1,279 @@
+"""
+Shared LLM HTTP Client for Pharmaguard
+======================================
+Every OpenAI-compatible chat completion the backend makes (per-drug
+explanations, the patient and compatibility summaries, report chat) goes
+through one process-wide :class:`LLMClient`:
+
+  - one pooled ``httpx`` client, so connections (and their TLS sessions)
+    are kept alive and reused instead of re-handshaking per call
+  - retries of connection errors, 429 and 5xx responses with jittered
+    exponential backoff, all within the call's timeout
+  - a circuit breaker: after ``LLM_BREAKER_FAILURES`` consecutive failed
+    calls it opens for ``LLM_BREAKER_COOLDOWN_S`` and calls fail at once
+    with :class:`CircuitOpenError`, so callers fall back to their
+    templates instead of waiting out timeouts; then one probe call is let
+    through and its outcome closes or re-opens it
+  - per-kind call counts and latency percentiles (:meth:`LLMClient.stats`)
+
+Other settings: ``LLM_POOL_SIZE`` (connections kept, default 16),
+``LLM_RETRIES`` (default 2) and ``LLM_BACKOFF_S`` (first backoff, default
+0.25).  ``llm_stub.py`` serves a local stand-in endpoint for tests and
+benchmarks (point ``LLM_BASE_URL`` at it).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Union
+
+import httpx
+
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+_LATENCY_WINDOW = 512
+
+
+class LLMError(Exception):
+    """A chat completion could not be obtained."""
+
+
+class CircuitOpenError(LLMError):
+    """The provider is considered down; the call was not attempted."""
+
+
+class _Rejected(LLMError):
+    """The request itself is refused (auth, bad model, bad URL): not an outage."""
+
+
+class _KindStats:
+    __slots__ = ("calls", "ok", "failed", "fast_failed", "retries", "latencies")
+
+    def __init__(self):
+        self.calls = self.ok = self.failed = self.fast_failed = self.retries = 0
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def to_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 1) if lat else None
+
+        return {
+            "calls": self.calls,
+            "ok": self.ok,
+            "failed": self.failed,
+            "fastFailed": self.fast_failed,
+            "retries": self.retries,
+            "p50Ms": pct(0.50),
+            "p95Ms": pct(0.95),
+            "maxMs": round(lat[-1] * 1000, 1) if lat else None,
+        }
+
+
+class LLMClient:
+    """
+    Pooled chat-completion client with retries and a circuit breaker.
+    Thread-safe; share one per process (see :func:`client`).
+    """
+
+    def __init__(
+        self,
+        *,
+        pool_size: int = 16,
+        retries: int = 2,
+        backoff: float = 0.25,
+        breaker_failures: int = 5,
+        breaker_cooldown: float = 30.0,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=60.0,
+            ),
+            headers={"User-Agent": "Pharmaguard/1.0"},
+            transport=transport,
+        )
+        self._lock = threading.Lock()
+        self._failures = 0                  # consecutive failed calls
+        self._open_until = 0.0              # breaker open while now < this
+        self._probing = False               # a half-open probe is in flight
+        self._stats: Dict[str, _KindStats] = {}
+
+    # ── breaker ──
+
+    def _admit(self) -> bool:
+        """Whether a call may go out now (claims the probe slot when half-open)."""
+        with self._lock:
+            if self._failures < self.breaker_failures:
+                return True
+            if time.monotonic() < self._open_until or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= self.breaker_failures:
+                if time.monotonic() >= self._open_until:
+                    print(f"[LLM] Circuit open for {self.breaker_cooldown:g}s "
+                          f"after {self._failures} consecutive failures")
+                self._open_until = time.monotonic() + self.breaker_cooldown
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._failures < self.breaker_failures:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until else "half-open"
+
+    # ── calls ──
+
+    def complete(
+        self,
+        url: str,
+        body: Union[bytes, dict],
+        api_key: str,
+        *,
+        kind: str = "chat",
+        timeout: float = 30.0,
+    ) -> str:
+        """
+        POST chat-completion *body* to *url* and return the first choice's
+        message content.  Retries stay within *timeout* seconds overall.
+        Raises :class:`CircuitOpenError` without calling while the breaker
+        is open, :class:`LLMError` when the call fails.
+        """
+        if isinstance(body, dict):
+            body = json.dumps(body).encode("utf-8")
+        with self._lock:
+            stats = self._stats.setdefault(kind, _KindStats())
+            stats.calls += 1
+        if not self._admit():
+            with self._lock:
+                stats.fast_failed += 1
+            raise CircuitOpenError(f"LLM circuit open ({kind} call skipped)")
+
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        t0 = time.monotonic()
+        ok = breaker = False
+        try:
+            content = self._post(url, body, headers, t0 + timeout, stats)
+            ok = breaker = True
+            return content
+        except _Rejected:
+            raise
+        except LLMError:
+            breaker = True
+            raise
+        except Exception as e:
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+        finally:
+            # Always settle the call, so a half-open probe never stays claimed
+            self._finish(stats, t0, ok=ok, breaker=breaker)
+
+    def _post(self, url: str, body: bytes, headers: Dict[str, str], deadline: float, stats: _KindStats) -> str:
+        """The attempts of :meth:`complete`, retrying outages until *deadline*."""
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            error: Optional[str] = None
+            retry_after: Optional[float] = None
+            try:
+                resp = self._http.post(url, content=body, headers=headers, timeout=max(remaining, 0.001))
+            except (httpx.InvalidURL, httpx.UnsupportedProtocol) as e:
+                raise _Rejected(f"{type(e).__name__}: {e}") from None
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            except httpx.HTTPError as e:
+                # Undecodable body, redirect loop: the same again on a retry
+                raise LLMError(f"{type(e).__name__}: {e}") from None
+            else:
+                if resp.status_code == 200:
+                    try:
+                        return resp.json()["choices"][0]["message"]["content"].strip()
+                    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                        raise LLMError(f"Malformed completion response: {e}") from None
+                if resp.status_code not in _RETRY_STATUS:
+                    raise _Rejected(f"HTTP {resp.status_code}: {resp.text[:200]}")
+                error = f"HTTP {resp.status_code}"
+                try:
+                    retry_after = float(resp.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+
+            delay = retry_after if retry_after is not None else random.uniform(0, self.backoff * 2 ** attempt)
+            if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                raise LLMError(error)
+            attempt += 1
+            with self._lock:
+                stats.retries += 1
+            time.sleep(delay)
+
+    def _finish(self, stats: _KindStats, t0: float, *, ok: bool, breaker: bool = True) -> None:
+        if breaker:
+            self._record(ok)
+        else:
+            with self._lock:
+                self._probing = False
+        with self._lock:
+            stats.latencies.append(time.monotonic() - t0)
+            if ok:
+                stats.ok += 1
+            else:
+                stats.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "breaker": state,
+                "consecutiveFailures": self._failures,
+                "calls": {kind: s.to_dict() for kind, s in sorted(self._stats.items())},
+            }
+
+    def close(self) -> None:
+        self._http.close()
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def client() -> LLMClient:
+    """The process-wide client, built from the environment on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                pool_size=int(os.environ.get("LLM_POOL_SIZE", "16")),
+                retries=int(os.environ.get("LLM_RETRIES", "2")),
+                backoff=float(os.environ.get("LLM_BACKOFF_S", "0.25")),
+                breaker_failures=int(os.environ.get("LLM_BREAKER_FAILURES", "5")),
+                breaker_cooldown=float(os.environ.get("LLM_BREAKER_COOLDOWN_S", "30")),
+            )
+        return _client
+
+
+def complete(url: str, body: Union[bytes, dict], api_key: str, *, kind: str = "chat", timeout: float = 30.0) -> str:
+    """:meth:`LLMClient.complete` on the shared client."""
+    return client().complete(url, body, api_key, kind=kind, timeout=timeout)
+
+
+def stats() -> Dict[str, Any]:
+    return client().stats()
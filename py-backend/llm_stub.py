@@ -0,0 +1,136 @@
+"""
+Local LLM stub server
+=====================
+A stand-in for an OpenAI-compatible ``/chat/completions`` endpoint, for
+tests and benchmarks that must not call a real provider.  Replies after
+*latency* seconds with a canned completion, fails the first *fail_first*
+requests and a *fail_rate* share of the rest with HTTP *status* (with a
+``Retry-After`` header when *retry_after* is set), and counts requests
+and TCP connections so connection reuse can be checked.
+
+    python llm_stub.py --port 8089 --latency 0.3
+    LLM_BASE_URL=http://127.0.0.1:8089/v1 LLM_API_KEY=stub python app.py
+
+or in-process::
+
+    with StubServer(latency=0.05) as stub:
+        os.environ["LLM_BASE_URL"] = stub.base_url
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubServer:
+    """OpenAI-compatible chat-completion stub on 127.0.0.1 (port 0 = any free port)."""
+
+    def __init__(self, port: int = 0, *, latency: float = 0.0, fail_rate: float = 0.0,
+                 status: int = 503, seed: Optional[int] = None, fail_first: int = 0,
+                 retry_after: Optional[float] = None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.status = status
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.requests = 0
+        self.connections = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"          # keep-alive
+            disable_nagle_algorithm = True         # headers and body go out as separate writes
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub.requests <= stub.fail_first or stub._rng.random() < stub.fail_rate
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if fail:
+                    headers = {} if stub.retry_after is None else {"Retry-After": f"{stub.retry_after:g}"}
+                    self._send(stub.status, {"error": {"message": "stub failure"}}, headers)
+                    return
+                prompt = (body.get("messages") or [{}])[-1].get("content", "")
+                self._send(200, {
+                    "model": body.get("model", "stub"),
+                    "choices": [{"message": {"role": "assistant",
+                                             "content": f"Stub completion for: {prompt[:60]}"}}],
+                })
+
+            def _send(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+                out = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with --status")
+    ap.add_argument("--status", type=int, default=503)
+    args = ap.parse_args()
+
+    stub = StubServer(args.port, latency=args.latency, fail_rate=args.fail_rate, status=args.status)
+    print(f"LLM stub listening on {stub.base_url} (Ctrl-C to stop)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Process-Pool Parallel VCF Parsing for Pharmaguard
+=================================================
+Opt-in parallel mode for large inputs.  The body is split into chunks —
+on byte ranges for plain-text VCFs, on BGZF block boundaries for
+``.vcf.bgz`` — and each chunk is scanned in a worker process against the
+targeted-parsing filter (``TargetSites``).  Workers send back only the
+raw hit lines plus a row count; the parent parses those few rows into
+Variants.
+
+Chunks do not need to start on a line: each worker returns the bytes
+before its first newline and after its last one, and the parent joins
+the tail of chunk *k* to the head of chunk *k + 1*.
+
+Plain gzip (non-BGZF) input and open file handles cannot be split and
+are read serially.  Pass large inputs as a path: workers then read their
+own byte range, whereas a bytes body is copied out to them chunk by chunk.
+
+Workers live in one pool per worker count, shared by all readers in the
+process and started on first use with the ``forkserver`` (or ``spawn``)
+method, never by forking a threaded server process.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import bgzf
+from parser import (
+    TargetSites,
+    VCFReader,
+    VCFSource,
+    Variant,
+    _SampleLayout,
+    _parse_row,
+)
+
+# Input bytes per chunk (compressed bytes for BGZF)
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# (path or data, start, end, bgzf-compressed, row filter)
+_Task = Tuple[Union[str, bytes], int, int, bool, Optional[TargetSites]]
+
+# (head, hit lines, data rows, tail, chunk contains a newline)
+_ChunkResult = Tuple[bytes, List[str], int, bytes, bool]
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+def _scan_chunk(task: _Task) -> _ChunkResult:
+    """Scan one chunk; return its partial edge lines and the matching rows."""
+    src, start, end, compressed, targets = task
+    if isinstance(src, str):
+        with open(src, "rb") as fh:
+            fh.seek(start)
+            raw = fh.read(end - start)
+    else:
+        raw = src
+    data = gzip.decompress(raw) if compressed else raw
+
+    first = data.find(b"\n")
+    if first < 0:
+        return data, [], 0, b"", False
+    last = data.rfind(b"\n")
+
+    hits: List[str] = []
+    rows = 0
+    for line in data[first + 1:last].decode("utf-8").split("\n"):
+        line = line.rstrip("\r")
+        if not line or line.startswith("#"):
+            continue
+        rows += 1
+        if targets is None or targets.matches(line):
+            hits.append(line)
+    return data[:first], hits, rows, data[last + 1:], True
+
+
+# ---------------------------------------------------------------------------
+# Chunk planning
+# ---------------------------------------------------------------------------
+
+def _boundaries(offsets: List[int], chunk_bytes: int) -> List[int]:
+    bounds = [0]
+    for off in offsets:
+        if off - bounds[-1] >= chunk_bytes:
+            bounds.append(off)
+    return bounds
+
+
+def _plan_chunks(
+    source: VCFSource, chunk_bytes: int, targets: Optional[TargetSites],
+) -> Optional[List[_Task]]:
+    """Split *source* into worker tasks, or None if it cannot be split."""
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        with open(path, "rb") as fh:
+            head = fh.read(16)
+            compressed = bgzf.is_bgzf_header(head)
+            if not compressed and head[:2] == _GZIP_MAGIC:
+                return None
+            size = os.fstat(fh.fileno()).st_size
+            offsets = bgzf.block_offsets(fh) if compressed else range(0, size, chunk_bytes)
+        bounds = _boundaries(list(offsets), chunk_bytes) + [size]
+        return [(path, a, b, compressed, targets) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        head = bytes(view[:16])
+        compressed = bgzf.is_bgzf_header(head)
+        if not compressed and head[:2] == _GZIP_MAGIC:
+            return None
+        size = len(view)
+        if compressed:
+            offsets = bgzf.block_offsets(io.BytesIO(view))
+        else:
+            offsets = range(0, size, chunk_bytes)
+        bounds = _boundaries(list(offsets), chunk_bytes) + [size]
+        return [(bytes(view[a:b]), 0, b - a, compressed, targets)
+                for a, b in zip(bounds, bounds[1:]) if b > a]
+
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Worker pools
+# ---------------------------------------------------------------------------
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    """The shared pool of *workers* processes, started on first use."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Forking a process with live threads (job workers, LLM pool,
+            # KB watcher) can copy held locks into the child
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pools[workers] = pool
+        return pool
+
+
+def _discard(workers: int, pool: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died, so the next reader starts a new one."""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    """Stop the shared worker pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ---------------------------------------------------------------------------
+# Reader
+# ---------------------------------------------------------------------------
+
+class ParallelVCFReader:
+    """
+    Drop-in for :class:`parser.VCFReader` (``metadata``, ``samples``,
+    ``rows_read``, iteration, context manager) that scans the body in a
+    process pool and yields only the rows matching *targets*.
+
+    Falls back to a serial :class:`parser.VCFReader` when *workers* ≤ 1
+    or the source cannot be split (plain gzip, file handles, one chunk).
+
+        with ParallelVCFReader("cohort.vcf.bgz", targets=PGX_TARGET_SITES, workers=8) as reader:
+            for variant in reader:
+                ...
+    """
+
+    def __init__(
+        self,
+        source: VCFSource,
+        *,
+        targets: Optional[TargetSites],
+        workers: Optional[int] = None,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    ):
+        self.targets = targets
+        self.workers = workers or os.cpu_count() or 1
+        self._serial: Optional[VCFReader] = None
+        self._tasks = _plan_chunks(source, chunk_bytes, targets) if self.workers > 1 else None
+
+        if not self._tasks or len(self._tasks) < 2:
+            self._serial = VCFReader(source, targets=targets)
+            self.metadata = self._serial.metadata
+            self.samples = self._serial.samples
+        else:
+            with VCFReader(source) as header:
+                self.metadata = header.metadata
+                self.samples = header.samples
+            self._layout = _SampleLayout(self.samples)
+        self._rows_read = 0
+
+    @property
+    def rows_read(self) -> int:
+        if self._serial is not None:
+            return self._serial.rows_read
+        return self._rows_read
+
+    def _take(self, raw: bytes) -> Iterator[Variant]:
+        """Handle one line re-assembled from two chunk edges."""
+        line = raw.decode("utf-8").rstrip("\r")
+        if not line or line.startswith("#"):
+            return
+        self._rows_read += 1
+        if self.targets is None or self.targets.matches(line):
+            variant = _parse_row(line, self._layout)
+            if variant is not None:
+                yield variant
+
+    def __iter__(self) -> Iterator[Variant]:
+        if self._serial is not None:
+            yield from self._serial
+            return
+
+        tasks, self._tasks = self._tasks, None
+        pool = _executor(self.workers)
+        try:
+            futures = [pool.submit(_scan_chunk, task) for task in tasks]
+        except BrokenProcessPool:
+            _discard(self.workers, pool)
+            raise
+        try:
+            carry = b""
+            for future in futures:
+                try:
+                    head, hits, rows, tail, has_newline = future.result()
+                except BrokenProcessPool:
+                    _discard(self.workers, pool)
+                    raise
+                if not has_newline:
+                    carry += head
+                    continue
+                yield from self._take(carry + head)
+                self._rows_read += rows
+                for line in hits:
+                    variant = _parse_row(line, self._layout)
+                    if variant is not None:
+                        yield variant
+                carry = tail
+            if carry:
+                yield from self._take(carry)
+        finally:
+            # Abandoned part-way: drop this reader's queued chunks
+            for future in futures:
+                future.cancel()
+
+    def close(self) -> None:
+        if self._serial is not None:
+            self._serial.close()
+
+    def __enter__(self) -> "ParallelVCFReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -10,6 +10,8 @@ Supports:
   - All standard VCF metadata (##) directives
   - INFO, FORMAT, and per-sample genotype fields
   - Pharmacogenomic annotations (GENE, STAR allele, rsID)
+  - Streaming, row-at-a-time reading (VCFReader / iter_vcf)
+  - Region queries on tabix/CSI-indexed bgzip files (IndexedVCFReader)
 """
 
 from __future__ import annotations
@@ -18,15 +20,21 @@ import gzip
 import io
 import os
 import re
+import sys
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple
+from typing import IO, Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import bgzf
+
+# A path, raw bytes, or an open text/binary handle
+VCFSource = Union[str, os.PathLike, bytes, bytearray, memoryview, IO]
 
 
 # ---------------------------------------------------------------------------
 # Data classes
 # ---------------------------------------------------------------------------
 
-@dataclass
+@dataclass(slots=True)
 class VCFMetadata:
     """Stores parsed ## header lines."""
     file_format: str = ""
@@ -46,16 +54,27 @@ class VCFMetadata:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class SampleGenotype:
-    """Parsed genotype data for one sample at one variant site."""
+    """
+    Parsed genotype data for one sample at one variant site.
+
+    FORMAT values are kept as a tuple aligned with *format_keys*, which is
+    shared by every genotype of the row (and every row with the same
+    FORMAT column); :attr:`format_fields` builds the dict view on demand.
+    """
     sample: str
     raw: str                              # e.g. "0/1"
-    format_fields: Dict[str, str] = field(default_factory=dict)
+    format_keys: Tuple[str, ...] = ()
+    format_values: Tuple[str, ...] = ()
     alleles: Tuple[int, ...] = ()         # numeric allele indices
     phased: bool = False
     is_variant: bool = False              # True when at least one ALT allele
 
+    @property
+    def format_fields(self) -> Dict[str, str]:
+        return dict(zip(self.format_keys, self.format_values))
+
     def to_dict(self) -> dict:
         return {
             "sample": self.sample,
@@ -67,9 +86,121 @@ class SampleGenotype:
         }
 
 
-@dataclass
+class _SampleLayout:
+    """Which sample columns a reader keeps, and where they sit in each row."""
+
+    __slots__ = ("names", "columns", "index", "selected")
+
+    def __init__(self, header_samples: List[str], selected: Optional[Iterable[str]] = None):
+        if selected is None:
+            self.names = list(header_samples)
+            self.columns = list(range(len(header_samples)))
+            self.selected = False
+        else:
+            wanted = set(selected)
+            missing = wanted.difference(header_samples)
+            if missing:
+                raise ValueError(f"Sample(s) not in VCF: {', '.join(sorted(missing))}")
+            self.columns = [i for i, name in enumerate(header_samples) if name in wanted]
+            self.names = [header_samples[i] for i in self.columns]
+            self.selected = True
+        self.index: Dict[str, int] = {}
+        for slot, name in enumerate(self.names):
+            self.index.setdefault(name, slot)
+
+
+class LazyGenotypes(Sequence):
+    """
+    The per-sample genotypes of one row, decoded on first access.
+
+    Behaves like the ``List[SampleGenotype]`` it stands in for, but keeps
+    the raw sample columns and only decodes a sample when it is read; the
+    decoded :class:`SampleGenotype` is cached.  Use :meth:`get` to fetch a
+    sample by name without touching the other columns.
+    """
+
+    __slots__ = ("_layout", "_fmt_keys", "_alt", "_tail", "_cols", "_decoded")
+
+    def __init__(
+        self,
+        layout: _SampleLayout,
+        fmt_keys: Tuple[str, ...],
+        alt: List[str],
+        tail: Optional[str] = None,
+        cols: Optional[List[str]] = None,
+    ):
+        self._layout = layout
+        self._fmt_keys = fmt_keys
+        self._alt = alt
+        self._tail = tail                 # unsplit sample columns, or None
+        self._cols = cols                 # split columns, one per kept sample
+        self._decoded: Dict[int, SampleGenotype] = {}
+
+    def _columns(self) -> List[str]:
+        cols = self._cols
+        if cols is None:
+            cols = [] if self._tail is None else self._tail.split("\t")
+            self._cols = cols
+            self._tail = None
+        return cols
+
+    def __len__(self) -> int:
+        return min(len(self._columns()), len(self._layout.names))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("genotype index out of range")
+        gt = self._decoded.get(i)
+        if gt is None:
+            gt = _parse_genotype(self._fmt_keys, self._cols[i], self._layout.names[i], self._alt)
+            self._decoded[i] = gt
+        return gt
+
+    def calls(self) -> List[str]:
+        """Raw GT string of every kept sample, without decoding other fields."""
+        cols = self._columns()[:len(self)]
+        if "GT" not in self._fmt_keys:
+            return ["."] * len(cols)
+        gi = self._fmt_keys.index("GT")
+        if gi == 0:
+            return [c.split(":", 1)[0] for c in cols]
+        calls = []
+        for c in cols:
+            values = c.split(":")
+            calls.append(values[gi] if gi < len(values) else ".")
+        return calls
+
+    def get(self, sample: str) -> Optional[SampleGenotype]:
+        """Genotype for *sample*, or None if the row has no such column."""
+        slot = self._layout.index.get(sample)
+        if slot is None or slot >= len(self):
+            return None
+        return self[slot]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, LazyGenotypes)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"LazyGenotypes({list(self)!r})"
+
+
+@dataclass(slots=True)
 class Variant:
-    """One data row in the VCF body."""
+    """
+    One data row in the VCF body.
+
+    CHROM, FILTER and FORMAT strings are interned, and *format_keys* is a
+    tuple shared by all rows with the same FORMAT column.
+    """
     chrom: str
     pos: int
     id: str
@@ -78,8 +209,8 @@ class Variant:
     qual: Optional[float]
     filter: List[str]
     info: Dict[str, Any]
-    format_keys: List[str]
-    genotypes: List[SampleGenotype] = field(default_factory=list)
+    format_keys: Tuple[str, ...]
+    genotypes: Sequence[SampleGenotype] = field(default_factory=list)
 
     # --- Pharmacogenomic convenience accessors ---
     @property
@@ -90,6 +221,15 @@ class Variant:
     def star_allele(self) -> Optional[str]:
         return self.info.get("STAR")
 
+    def genotype_for(self, sample: str) -> Optional[SampleGenotype]:
+        """This row's genotype for *sample*, decoding only that column."""
+        if isinstance(self.genotypes, LazyGenotypes):
+            return self.genotypes.get(sample)
+        for g in self.genotypes:
+            if g.sample == sample:
+                return g
+        return None
+
     @property
     def rsid(self) -> Optional[str]:
         """Return the RS value from INFO, falling back to the ID column."""
@@ -113,7 +253,7 @@ class Variant:
             "gene": self.gene,
             "starAllele": self.star_allele,
             "rsid": self.rsid,
-            "formatKeys": self.format_keys,
+            "formatKeys": list(self.format_keys),
             "genotypes": [g.to_dict() for g in self.genotypes],
         }
 
@@ -129,6 +269,11 @@ class VCFFile:
     def get_variants_by_gene(self, gene: str) -> List[Variant]:
         return [v for v in self.variants if v.gene and v.gene.upper() == gene.upper()]
 
+    def to_genotype_matrix(self) -> "GenotypeMatrix":
+        """Columnar (sites × samples × ploidy) view of every variant row."""
+        from genotype_matrix import GenotypeMatrix
+        return GenotypeMatrix.from_variants(self.variants, self.samples)
+
     def get_variant_by_rsid(self, rsid: str) -> Optional[Variant]:
         for v in self.variants:
             if v.rsid == rsid or v.id == rsid:
@@ -139,13 +284,12 @@ class VCFFile:
         """Return all variant genotypes for a given sample."""
         results = []
         for v in self.variants:
-            for g in v.genotypes:
-                if g.sample == sample:
-                    results.append({
-                        **v.to_dict(),
-                        "genotype": g.to_dict(),
-                    })
-                    break
+            g = v.genotype_for(sample)
+            if g is not None:
+                results.append({
+                    **v.to_dict(),
+                    "genotype": g.to_dict(),
+                })
         return results
 
     def summary(self) -> dict:
@@ -175,6 +319,60 @@ class VCFFile:
         }
 
 
+@dataclass(frozen=True)
+class TargetSites:
+    """
+    Row pre-filter for targeted parsing.
+
+    A row is kept when its ID column (or INFO RS) names one of *ids*, its
+    CHROM:POS is one of *positions*, or its INFO GENE/PX tag names one of
+    *genes*.  Positions use chromosome names without the ``chr`` prefix.
+    Only CHROM, POS and ID are split for the common case, so irrelevant
+    rows are dropped before any INFO, FORMAT or sample parsing.
+    """
+    ids: FrozenSet[str] = frozenset()
+    positions: FrozenSet[Tuple[str, int]] = frozenset()
+    genes: FrozenSet[str] = frozenset()
+    _pos_keys: FrozenSet[Tuple[str, str]] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # POS is compared as text so no int() call is needed per row
+        object.__setattr__(
+            self, "_pos_keys", frozenset((c, str(p)) for c, p in self.positions)
+        )
+
+    def matches(self, line: str) -> bool:
+        cols = line.split("\t", 3)
+        if len(cols) < 4:
+            return False
+        chrom, pos, var_id, rest = cols
+
+        ids = self.ids
+        if var_id in ids:
+            return True
+        if ";" in var_id and any(p.strip() in ids for p in var_id.split(";")):
+            return True
+
+        if chrom.startswith("chr"):
+            chrom = chrom[3:]
+        if (chrom, pos) in self._pos_keys:
+            return True
+
+        # Rare path: only rows that carry a gene / rsID annotation get INFO parsed
+        if "GENE=" in rest or "PX=" in rest or "RS=" in rest:
+            fields = rest.split("\t", 5)
+            if len(fields) < 5:
+                return False
+            info = _parse_info(fields[4])
+            gene = info.get("GENE") or info.get("PX")
+            if isinstance(gene, str) and gene.upper() in self.genes:
+                return True
+            rs = info.get("RS")
+            if isinstance(rs, str) and any(p.strip() in ids for p in rs.split(";")):
+                return True
+        return False
+
+
 # ---------------------------------------------------------------------------
 # Internal helpers
 # ---------------------------------------------------------------------------
@@ -220,18 +418,18 @@ def _parse_info(raw: str) -> Dict[str, Any]:
 
 
 def _parse_genotype(
-    fmt_keys: List[str],
+    fmt_keys: Tuple[str, ...],
     gt_str: str,
     sample_name: str,
     alt_alleles: List[str],
 ) -> SampleGenotype:
     """Parse a single sample's genotype column."""
-    values = gt_str.split(":")
-    fmt_dict: Dict[str, str] = {}
-    for i, key in enumerate(fmt_keys):
-        fmt_dict[key] = values[i] if i < len(values) else "."
+    values = tuple(gt_str.split(":"))
+    n_keys = len(fmt_keys)
+    if len(values) != n_keys:
+        values = (values + (".",) * n_keys)[:n_keys]
 
-    gt_raw = fmt_dict.get("GT", ".")
+    gt_raw = values[fmt_keys.index("GT")] if "GT" in fmt_keys else "."
     phased = "|" in gt_raw
     sep = "|" if phased else "/"
 
@@ -250,157 +448,428 @@ def _parse_genotype(
     return SampleGenotype(
         sample=sample_name,
         raw=gt_raw,
-        format_fields=fmt_dict,
+        format_keys=fmt_keys,
+        format_values=values,
         alleles=alleles,
         phased=phased,
         is_variant=is_variant,
     )
 
 
-def _open_vcf(path: str):
-    """Return a line iterator for .vcf, .vcf.gz, and .vcf.bgz files."""
-    if path.endswith(".gz") or path.endswith(".bgz"):
-        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
-    return open(path, "r", encoding="utf-8")
+def _parse_meta_line(line: str, metadata: VCFMetadata) -> None:
+    """Record one ## meta-information line into *metadata*."""
+    metadata.raw.append(line)
+
+    if line.startswith("##fileformat="):
+        metadata.file_format = line.split("=", 1)[1]
+        return
+
+    key, fields = _parse_structured_line(line)
+    if key and fields:
+        fid = fields.get("ID", "")
+        if key == "FILTER":
+            metadata.filters[fid] = fields.get("Description", "")
+        elif key == "INFO":
+            metadata.infos[fid] = fields
+        elif key == "FORMAT":
+            metadata.formats[fid] = fields
+        elif key == "contig":
+            metadata.contigs[fid] = fields
+
+
+def _handle_header_line(line: str, metadata: VCFMetadata, samples: List[str]) -> bool:
+    """
+    Consume a ##, #CHROM or comment line, filling *metadata* and *samples*
+    in place.  Returns False for data rows.
+    """
+    if line.startswith("##"):
+        _parse_meta_line(line, metadata)
+        return True
+    if line.startswith("#CHROM") or line.startswith("#chrom"):
+        header_cols = line.lstrip("#").split("\t")
+        # Columns after FORMAT are sample names
+        if len(header_cols) > 9:
+            samples[:] = header_cols[9:]
+        return True
+    # Any other '#' line is a free-text comment
+    return line.startswith("#")
+
+
+# FORMAT column -> shared tuple of interned keys; FILTER column -> interned codes
+_FORMAT_KEYS: Dict[str, Tuple[str, ...]] = {}
+_FILTERS: Dict[str, Tuple[str, ...]] = {}
+_NO_FORMAT: Tuple[str, ...] = ()
+_INTERN_CACHE_MAX = 4096                 # bound both caches on pathological input
+
+
+def _format_keys(raw: str) -> Tuple[str, ...]:
+    keys = _FORMAT_KEYS.get(raw)
+    if keys is None:
+        keys = tuple(sys.intern(k) for k in raw.split(":"))
+        if len(_FORMAT_KEYS) < _INTERN_CACHE_MAX:
+            _FORMAT_KEYS[raw] = keys
+    return keys
+
+
+def _filters(raw: str) -> List[str]:
+    codes = _FILTERS.get(raw)
+    if codes is None:
+        codes = ("PASS",) if raw == "." else tuple(sys.intern(f) for f in raw.split(";"))
+        if len(_FILTERS) < _INTERN_CACHE_MAX:
+            _FILTERS[raw] = codes
+    return list(codes)
+
+
+def _parse_row(line: str, layout: _SampleLayout) -> Optional[Variant]:
+    """
+    Parse one tab-delimited data row.  Returns None for malformed rows.
+
+    Sample columns are not decoded here; they are kept raw in a
+    :class:`LazyGenotypes` (only the columns in *layout*).
+    """
+    cols = line.split("\t", 9)
+    if len(cols) < 8:
+        return None                      # skip malformed lines
+
+    chrom = sys.intern(cols[0])
+    pos = int(cols[1])
+    var_id = cols[2] if cols[2] != "." else ""
+    ref = cols[3]
+    alt = cols[4].split(",") if cols[4] != "." else []
+    qual: Optional[float] = None
+    if cols[5] != ".":
+        try:
+            qual = float(cols[5])
+        except ValueError:
+            pass
+    filt = _filters(cols[6])
+    info = _parse_info(cols[7])
+
+    fmt_keys = _NO_FORMAT
+    if len(cols) > 8 and cols[8] != ".":
+        fmt_keys = _format_keys(cols[8])
+
+    tail = cols[9] if len(cols) > 9 else None
+    if layout.selected:
+        sample_cols = tail.split("\t") if tail is not None else []
+        kept = [sample_cols[c] for c in layout.columns if c < len(sample_cols)]
+        genotypes = LazyGenotypes(layout, fmt_keys, alt, cols=kept)
+    else:
+        genotypes = LazyGenotypes(layout, fmt_keys, alt, tail=tail)
+
+    return Variant(
+        chrom=chrom,
+        pos=pos,
+        id=var_id,
+        ref=ref,
+        alt=alt,
+        qual=qual,
+        filter=filt,
+        info=info,
+        format_keys=fmt_keys,
+        genotypes=genotypes,
+    )
+
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class _BufferReader(io.RawIOBase):
+    """Read-only raw stream over a bytes-like object, without copying it."""
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+def _is_gzip(fh: IO[bytes]) -> bool:
+    """Check for the gzip magic bytes without consuming them."""
+    if hasattr(fh, "peek"):
+        return fh.peek(2)[:2] == _GZIP_MAGIC
+    pos = fh.tell()
+    head = fh.read(2)
+    fh.seek(pos)
+    return head == _GZIP_MAGIC
+
+
+def _open_vcf(source: VCFSource) -> Tuple[IO[str], Callable[[], None]]:
+    """
+    Return ``(text_handle, close)`` for *source*.
+
+    *source* may be a path, a bytes-like object, or an open text or binary
+    handle (e.g. a Flask upload's ``.stream``).  gzip / bgzip content is
+    recognised by its magic bytes and decompressed incrementally, so the
+    upload is never held in memory as a second, decompressed copy.
+    *close* releases only the layers opened here; a caller's handle is
+    left open.
+    """
+    if isinstance(source, io.TextIOBase):
+        return source, lambda: None
+
+    owned = True
+    if isinstance(source, (str, os.PathLike)):
+        raw: IO[bytes] = open(source, "rb")
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        raw = io.BufferedReader(_BufferReader(source))
+    else:
+        raw = source
+        owned = False
+
+    added_buffer = False
+    if not hasattr(raw, "peek") and not raw.seekable():
+        raw = io.BufferedReader(raw)
+        added_buffer = True
+
+    # GzipFile reads multi-member streams, which is exactly what BGZF is
+    binary = gzip.GzipFile(fileobj=raw, mode="rb") if _is_gzip(raw) else raw
+    text = io.TextIOWrapper(binary, encoding="utf-8")
+
+    def close() -> None:
+        if binary is raw:
+            text.detach()
+        else:
+            text.close()               # closes the GzipFile, never its fileobj
+        if owned:
+            raw.close()
+        elif added_buffer:
+            raw.detach()
+
+    return text, close
 
 
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-def parse_vcf(source: str, *, max_variants: int = 0) -> VCFFile:
+class VCFReader:
+    """
+    Streaming VCF reader.
+
+    The header is consumed when the reader is created, so ``metadata`` and
+    ``samples`` are available immediately; variant rows are then parsed one
+    at a time as the reader is iterated.  Nothing is retained between rows,
+    so memory use is independent of file size.
+
+    With *targets*, rows that fail :meth:`TargetSites.matches` are skipped
+    before field parsing.  ``rows_read`` counts every data row either way.
+
+    Sample columns are decoded lazily (see :class:`LazyGenotypes`).  With
+    *samples*, only those columns are kept at all and ``samples`` lists
+    just them; naming a sample the header lacks raises ValueError.
+
+        with VCFReader("patient.vcf.gz") as reader:
+            for variant in reader:
+                ...
+    """
+
+    def __init__(
+        self,
+        source: VCFSource,
+        *,
+        targets: Optional[TargetSites] = None,
+        samples: Optional[Iterable[str]] = None,
+    ):
+        self.metadata = VCFMetadata()
+        self.samples: List[str] = []
+        self.targets = targets
+        self.rows_read = 0
+        self._fh, self._close = _open_vcf(source)
+        try:
+            self._pending: Optional[str] = self._read_header()
+            self._layout = _SampleLayout(self.samples, samples)
+            self.samples = self._layout.names
+        except BaseException:
+            self.close()
+            raise
+
+    def _handle_header_line(self, line: str) -> bool:
+        return _handle_header_line(line, self.metadata, self.samples)
+
+    def _read_header(self) -> Optional[str]:
+        """Read header lines; return the first data row (or None at EOF)."""
+        for raw_line in self._fh:
+            line = raw_line.rstrip("\n\r")
+            if not line:
+                continue
+            if not self._handle_header_line(line):
+                return line
+        return None
+
+    def __iter__(self) -> Iterator[Variant]:
+        line = self._pending
+        self._pending = None
+        if line is not None:
+            variant = self._parse(line)
+            if variant is not None:
+                yield variant
+
+        for raw_line in self._fh:
+            line = raw_line.rstrip("\n\r")
+            if not line or self._handle_header_line(line):
+                continue
+            variant = self._parse(line)
+            if variant is not None:
+                yield variant
+
+    def _parse(self, line: str) -> Optional[Variant]:
+        self.rows_read += 1
+        if self.targets is not None and not self.targets.matches(line):
+            return None
+        return _parse_row(line, self._layout)
+
+    def close(self) -> None:
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __enter__(self) -> "VCFReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class IndexedVCFReader:
+    """
+    Region-query reader for a bgzipped, tabix/CSI-indexed VCF on disk.
+
+    Only the BGZF blocks that overlap a requested region are decompressed,
+    so a handful of gene loci can be read from a multi-gigabyte file in
+    milliseconds.  When the file has no .tbi/.csi and *build_index* is True,
+    an index is built in one pass and saved next to the file.
+
+        with IndexedVCFReader("cohort.vcf.bgz", build_index=True) as reader:
+            for variant in reader.fetch("chr22", 42126000, 42131000):
+                ...
+    """
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        *,
+        index: Optional[bgzf.TabixIndex] = None,
+        build_index: bool = False,
+        targets: Optional[TargetSites] = None,
+        samples: Optional[Iterable[str]] = None,
+    ):
+        self.metadata = VCFMetadata()
+        self.samples: List[str] = []
+        self.targets = targets
+        self.rows_read = 0
+        self._bgzf = bgzf.BgzfReader(path)
+        try:
+            self.index = index or bgzf.load_index(path, build=build_index)
+            for raw_line in self._bgzf:
+                line = raw_line.decode("utf-8").rstrip("\n\r")
+                if line and not _handle_header_line(line, self.metadata, self.samples):
+                    break
+            self._layout = _SampleLayout(self.samples, samples)
+            self.samples = self._layout.names
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def record_count(self) -> Optional[int]:
+        """Rows in the whole file, when the index records it."""
+        return self.index.record_count
+
+    def fetch(self, chrom: str, start: int, end: int) -> Iterator[Variant]:
+        """Yield variants overlapping *chrom*:*start*-*end* (1-based, inclusive)."""
+        for raw_line in bgzf.fetch_lines(self._bgzf, self.index, chrom, start, end):
+            line = raw_line.decode("utf-8")
+            self.rows_read += 1
+            if self.targets is not None and not self.targets.matches(line):
+                continue
+            variant = _parse_row(line, self._layout)
+            if variant is not None:
+                yield variant
+
+    def close(self) -> None:
+        self._bgzf.close()
+
+    def __enter__(self) -> "IndexedVCFReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_vcf(
+    source: VCFSource,
+    *,
+    targets: Optional[TargetSites] = None,
+    samples: Optional[Iterable[str]] = None,
+) -> Iterator[Variant]:
+    """
+    Lazily yield :class:`Variant` records from *source*.
+
+    *source* may be a path (.vcf, .vcf.gz, .vcf.bgz), a bytes-like object,
+    or an open text or binary file handle.  Use :class:`VCFReader` directly
+    when the header (metadata, sample names) is also needed.
     """
-    Parse a VCF file from *source* (a file path).
+    with VCFReader(source, targets=targets, samples=samples) as reader:
+        yield from reader
+
+
+def parse_vcf(
+    source: VCFSource,
+    *,
+    max_variants: int = 0,
+    targets: Optional[TargetSites] = None,
+    samples: Optional[Iterable[str]] = None,
+) -> VCFFile:
+    """
+    Parse a VCF file from *source* (a file path, bytes, or open file handle).
 
     Parameters
     ----------
-    source : str
-        Path to a .vcf, .vcf.gz or .vcf.bgz file.
+    source : str | bytes | file handle
+        Path to a .vcf, .vcf.gz or .vcf.bgz file, raw (optionally gzipped)
+        VCF bytes, or an open handle.
     max_variants : int, optional
         If > 0, stop after reading this many variant rows (useful for previews).
+    targets : TargetSites, optional
+        Only keep rows matching these sites (targeted mode); everything
+        else is skipped without being parsed.
+    samples : list of str, optional
+        Only keep these samples' genotype columns.  Genotypes are decoded
+        lazily on first access either way.
 
     Returns
     -------
     VCFFile
         Fully parsed VCF with metadata, samples, and variant records.
     """
-    metadata = VCFMetadata()
-    samples: List[str] = []
     variants: List[Variant] = []
-    header_cols: List[str] = []
-
-    with _open_vcf(source) as fh:
-        for raw_line in fh:
-            line = raw_line.rstrip("\n\r")
-            if not line:
-                continue
 
-            # -- Meta-information lines (##) --
-            if line.startswith("##"):
-                metadata.raw.append(line)
-
-                if line.startswith("##fileformat="):
-                    metadata.file_format = line.split("=", 1)[1]
-                    continue
-
-                key, fields = _parse_structured_line(line)
-                if key and fields:
-                    fid = fields.get("ID", "")
-                    if key == "FILTER":
-                        metadata.filters[fid] = fields.get("Description", "")
-                    elif key == "INFO":
-                        metadata.infos[fid] = fields
-                    elif key == "FORMAT":
-                        metadata.formats[fid] = fields
-                    elif key == "contig":
-                        metadata.contigs[fid] = fields
-                continue
-
-            # -- Header line (#CHROM ...) --
-            if line.startswith("#CHROM") or line.startswith("#chrom"):
-                header_cols = line.lstrip("#").split("\t")
-                # Columns after FORMAT are sample names
-                if len(header_cols) > 9:
-                    samples = header_cols[9:]
-                continue
-
-            # -- Data rows --
-            cols = line.split("\t")
-            if len(cols) < 8:
-                continue                 # skip malformed lines
-
-            chrom = cols[0]
-            pos = int(cols[1])
-            var_id = cols[2] if cols[2] != "." else ""
-            ref = cols[3]
-            alt = cols[4].split(",") if cols[4] != "." else []
-            qual: Optional[float] = None
-            if cols[5] != ".":
-                try:
-                    qual = float(cols[5])
-                except ValueError:
-                    pass
-            filt = cols[6].split(";") if cols[6] != "." else ["PASS"]
-            info = _parse_info(cols[7])
-
-            fmt_keys: List[str] = []
-            if len(cols) > 8 and cols[8] != ".":
-                fmt_keys = cols[8].split(":")
-
-            genotypes: List[SampleGenotype] = []
-            for idx, sample_name in enumerate(samples):
-                col_idx = 9 + idx
-                if col_idx < len(cols):
-                    genotypes.append(
-                        _parse_genotype(fmt_keys, cols[col_idx], sample_name, alt)
-                    )
-
-            variant = Variant(
-                chrom=chrom,
-                pos=pos,
-                id=var_id,
-                ref=ref,
-                alt=alt,
-                qual=qual,
-                filter=filt,
-                info=info,
-                format_keys=fmt_keys,
-                genotypes=genotypes,
-            )
+    with VCFReader(source, targets=targets, samples=samples) as reader:
+        for variant in reader:
             variants.append(variant)
-
             if max_variants and len(variants) >= max_variants:
                 break
 
-    return VCFFile(metadata=metadata, samples=samples, variants=variants)
+    return VCFFile(metadata=reader.metadata, samples=reader.samples, variants=variants)
 
 
-def parse_vcf_bytes(data: bytes, *, filename: str = "upload.vcf", max_variants: int = 0) -> VCFFile:
+def parse_vcf_bytes(data: Union[bytes, bytearray, memoryview], *, filename: str = "upload.vcf", max_variants: int = 0) -> VCFFile:
     """
     Parse VCF content from raw bytes (e.g. a Flask file upload).
 
     Handles both plain-text and gzip/bgzip content by inspecting the magic
-    bytes (\\x1f\\x8b for gzip).
+    bytes (\\x1f\\x8b for gzip).  The buffer is read in place and
+    decompressed incrementally — no temp file and no decoded copy.
     """
-    if data[:2] == b"\x1f\x8b":
-        text = gzip.decompress(data).decode("utf-8")
-    else:
-        text = data.decode("utf-8")
-
-    # Write to a temp-like StringIO and re-use the file parser logic
-    # by converting to a line-iterator approach.
-    tmp_path = None
-    try:
-        import tempfile
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".vcf", delete=False, encoding="utf-8"
-        ) as tmp:
-            tmp.write(text)
-            tmp_path = tmp.name
-        return parse_vcf(tmp_path, max_variants=max_variants)
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+    return parse_vcf(data, max_variants=max_variants)
 
 
 # ---------------------------------------------------------------------------
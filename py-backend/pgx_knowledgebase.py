@@ -5,127 +5,71 @@ Maps gene–star-allele combinations to metabolizer phenotypes,
 and maps (gene, drug) pairs to risk predictions and dosing guidance
 based on CPIC (Clinical Pharmacogenetics Implementation Consortium)
 guidelines.
+
+Everything derived from the CPIC tables and the interaction table in
+:mod:`pgx_definitions` lives in one immutable :class:`KnowledgeBase`.
+The module-level helpers use the :func:`current` one; :func:`reload`
+builds a new one in the background (after a CPIC table or the
+definitions change) and swaps it in with
+a single rebind, so an analysis that already holds the old knowledge base
+finishes on it.
 """
 
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+import hashlib
+import importlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import cpic_tables
+import pgx_definitions
+import star_caller
+from parser import TargetSites
+from pgx_definitions import (
+    SAFE, ADJUST, TOXIC, INEFFECTIVE, UNKNOWN,
+    ULTRA_RAPID, EXTENSIVE, INTERMEDIATE, POOR, INDETERMINATE,
+    DrugGeneInteraction,
+)
 
 # ---------------------------------------------------------------------------
-# Risk levels
-# ---------------------------------------------------------------------------
-SAFE = "Safe"
-ADJUST = "Adjust Dosage"
-TOXIC = "Toxic"
-INEFFECTIVE = "Ineffective"
-UNKNOWN = "Unknown"
-
-# ---------------------------------------------------------------------------
-# Metabolizer phenotype definitions
+# Phenotype inference
 # ---------------------------------------------------------------------------
-ULTRA_RAPID = "Ultra-rapid Metabolizer"
-EXTENSIVE = "Normal Metabolizer"       # aka Extensive
-INTERMEDIATE = "Intermediate Metabolizer"
-POOR = "Poor Metabolizer"
-INDETERMINATE = "Indeterminate"
 
-# ---------------------------------------------------------------------------
-# Star-allele → function mapping
-# ---------------------------------------------------------------------------
-# For genes with CPIC Excel tables → loaded from cpic_tables (auto-discovered)
-# For genes without tables → hardcoded fallback
-_HARDCODED_ALLELE_FUNCTION: Dict[str, Dict[str, str]] = {
-    "CYP2C19": {
-        "*1":  "normal",
-        "*2":  "no_function",
-        "*3":  "no_function",
-        "*4":  "no_function",
-        "*17": "increased",
-    },
-    "CYP2C9": {
-        "*1":  "normal",
-        "*2":  "decreased",
-        "*3":  "decreased",       # CPIC classifies *3 as decreased, not no_function
-        "*5":  "decreased",
-        "*6":  "no_function",
-        "*8":  "decreased",
-        "*11": "decreased",
-    },
-    "SLCO1B1": {
-        "*1":  "normal",
-        "*5":  "decreased",
-        "*15": "decreased",
-        "*17": "decreased",
-    },
-    "TPMT": {
-        "*1":  "normal",
-        "*2":  "no_function",
-        "*3A": "no_function",
-        "*3B": "no_function",
-        "*3C": "no_function",
-    },
-    "DPYD": {
-        "*1":   "normal",
-        "*2A":  "no_function",
-        "*13":  "no_function",
-        "c.2846A>T":  "decreased",
-        "c.1236G>A/HapB3": "decreased",
-    },
-}
+def _function_score(func: str) -> float:
+    return {"normal": 1.0, "decreased": 0.5, "no_function": 0.0, "increased": 1.5}.get(func, 1.0)
 
-# Build the merged dict: CPIC tables override hardcoded entries
-ALLELE_FUNCTION: Dict[str, Dict[str, str]] = {}
-for _gene in set(list(_HARDCODED_ALLELE_FUNCTION.keys()) + cpic_tables.loaded_genes()):
-    if cpic_tables.has_gene(_gene):
-        ALLELE_FUNCTION[_gene] = cpic_tables.build_legacy_allele_function_dict(_gene)
-    elif _gene in _HARDCODED_ALLELE_FUNCTION:
-        ALLELE_FUNCTION[_gene] = _HARDCODED_ALLELE_FUNCTION[_gene]
-
-# rsID → (gene, star-allele) lookup for VCFs that lack GENE/STAR INFO tags
-# Auto-filled from CPIC tables for all loaded genes, plus hardcoded fallbacks
-_HARDCODED_RSIDS: Dict[str, Tuple[str, str]] = {
-    # CYP2C19
-    "rs4244285":  ("CYP2C19", "*2"),
-    "rs4986893":  ("CYP2C19", "*3"),
-    "rs12248560": ("CYP2C19", "*17"),
-    # CYP2C9
-    "rs1799853":  ("CYP2C9", "*2"),
-    "rs1057910":  ("CYP2C9", "*3"),
-    # SLCO1B1
-    "rs4149056":  ("SLCO1B1", "*5"),
-    # TPMT
-    "rs1800462":  ("TPMT", "*2"),
-    "rs1800460":  ("TPMT", "*3B"),
-    "rs1142345":  ("TPMT", "*3C"),
-    # DPYD
-    "rs3918290":  ("DPYD", "*2A"),
-    "rs55886062": ("DPYD", "*13"),
-    "rs67376798": ("DPYD", "c.2846A>T"),
-}
 
-# Merge: CPIC tables first (higher quality), hardcoded only if rsID not already covered
-RSID_TO_ALLELE: Dict[str, Tuple[str, str]] = {}
-for _gene in cpic_tables.loaded_genes():
-    RSID_TO_ALLELE.update(cpic_tables.build_legacy_rsid_to_allele_dict(_gene))
-for _rsid, _val in _HARDCODED_RSIDS.items():
-    if _rsid not in RSID_TO_ALLELE:
-        RSID_TO_ALLELE[_rsid] = _val
+def canonical_diplotype(allele1: str, allele2: str) -> str:
+    """``"*4", "*1"`` → ``"*1/*4"``: lower allele number first, as :func:`build_diplotype` orders them."""
+    return "/".join(cpic_tables.canonical_pair(allele1, allele2))
 
-# ---------------------------------------------------------------------------
-# Phenotype inference
-# ---------------------------------------------------------------------------
 
-def _function_score(func: str) -> float:
-    return {"normal": 1.0, "decreased": 0.5, "no_function": 0.0, "increased": 1.5}.get(func, 1.0)
+def _called_copies(detected_alleles: List[dict]) -> List[str]:
+    """One star allele per called variant copy (het once, hom twice); may include ``""``."""
+    copies: List[str] = []
+    for a in detected_alleles:
+        gt = a.get("genotype", "0/0")
+        if gt in ("1/1", "1|1"):
+            copies.extend([a.get("star_allele", "")] * 2)
+        elif gt in ("0/1", "0|1", "1|0", "1/0"):
+            copies.append(a.get("star_allele", ""))
+    return copies
 
 
-def build_diplotype(gene: str, detected_alleles: List[dict]) -> str:
+def build_diplotype(
+    gene: str,
+    detected_alleles: List[dict],
+    index: Optional[cpic_tables.AlleleIndex] = None,
+) -> str:
     """
     Build a diplotype string (e.g. '*1/*4') from detected variant alleles.
     Assumes diploid.  Variant alleles contribute one copy each (het) or
     both copies (hom).  Remaining copies are filled with *1 (wild-type).
+    With the gene's *index* the two copies are ordered by allele ID.
     """
     copies: List[str] = []
     for a in detected_alleles:
@@ -145,15 +89,9 @@ def build_diplotype(gene: str, detected_alleles: List[dict]) -> str:
     # Take the first two (most impactful)
     copies = copies[:2]
     # Canonical order: lower allele number first
-    def _sort_key(s: str) -> float:
-        n = s.lstrip("*").split("x")[0]
-        n = n.replace("A", ".1").replace("B", ".2").replace("C", ".3")
-        try:
-            return float(n)
-        except ValueError:
-            return 999.0
-    copies.sort(key=_sort_key)
-    return f"{copies[0]}/{copies[1]}"
+    if index is not None:
+        return "/".join(index.canonical(copies[0], copies[1]))
+    return canonical_diplotype(copies[0], copies[1])
 
 
 def infer_phenotype(gene: str, detected_alleles: List[dict]) -> str:
@@ -169,345 +107,771 @@ def infer_phenotype(gene: str, detected_alleles: List[dict]) -> str:
     activity-score heuristic if the diplotype is not found.
 
     For other genes: uses the activity-score heuristic.
+
+    Results are memoized per (gene, canonical diplotype) on the current
+    :class:`KnowledgeBase` (see :class:`PhenotypeMemo`).
     """
-    # ── Try official CPIC diplotype table first (for any loaded gene) ──
-    if cpic_tables.has_gene(gene):
-        diplotype = build_diplotype(gene, detected_alleles)
-        cpic_pheno = cpic_tables.infer_phenotype_from_diplotype(gene, diplotype)
-        if cpic_pheno:
-            return cpic_pheno
-        # If not found (rare combo), fall through to heuristic
-
-    # ── Heuristic: activity-score based ──
-    gene_funcs = ALLELE_FUNCTION.get(gene, {})
-
-    scores: List[float] = []
-    for a in detected_alleles:
-        star = a.get("star_allele", "")
-        gt = a.get("genotype", "0/0")
+    return _current.infer_phenotype(gene, detected_alleles)
 
-        # For genes with CPIC tables, use official activity values
-        if cpic_tables.has_gene(gene) and star:
-            av = cpic_tables.get_activity_value(gene, star)
-        else:
-            func = gene_funcs.get(star, "normal")
-            av = _function_score(func)
 
-        if gt in ("1/1", "1|1"):
-            scores.extend([av, av])
-        elif gt in ("0/1", "0|1", "1|0", "1/0"):
-            scores.append(av)
+# ---------------------------------------------------------------------------
+# Compiled interaction plans
+# ---------------------------------------------------------------------------
+
+_PLAN_MEMO_MAX = 1024
+
+
+@dataclass(frozen=True)
+class InteractionOutcome:
+    """
+    The knowledge-base half of one drug result: risk, guidance and the
+    template explanation (without variant citations) for a drug, gene and
+    phenotype.  ``interaction`` is None when no CPIC entry covers them.
+    """
+    drug: str
+    gene: str
+    phenotype: str
+    risk: str
+    recommendation: str
+    mechanism: str
+    explanation: str
+    interaction: Optional[DrugGeneInteraction] = None
+    cpic_level: str = ""
+    guidelines_url: str = ""
+
+
+def _interaction_outcome(drug: str, ix: DrugGeneInteraction) -> InteractionOutcome:
+    return InteractionOutcome(
+        drug, ix.gene, ix.phenotype, ix.risk, ix.recommendation, ix.mechanism,
+        f"The patient is classified as a {ix.phenotype} for {ix.gene}. "
+        f"{ix.mechanism} "
+        f"Based on CPIC guidelines (evidence level {ix.cpic_level}): "
+        f"{ix.recommendation}",
+        ix, ix.cpic_level, ix.guidelines_url,
+    )
+
+
+def _missing_outcome(drug: str, gene: str, phenotype: str) -> InteractionOutcome:
+    return InteractionOutcome(
+        drug, gene, phenotype, UNKNOWN,
+        f"No specific CPIC guideline found for {drug} with {phenotype} {gene}.",
+        "",
+        f"The patient is classified as a {phenotype} for {gene}, "
+        f"but no specific interaction data is available for {drug} with this phenotype.",
+    )
+
+
+def _unknown_drug_outcome(drug: str) -> InteractionOutcome:
+    return InteractionOutcome(
+        drug, "", "", UNKNOWN,
+        f"No pharmacogenomic data available for {drug} in our knowledge base.",
+        "",
+        f"The drug '{drug}' is not currently in our pharmacogenomic database. "
+        f"This does not mean it is safe — consult standard prescribing guidelines.",
+    )
 
-    if not scores:
-        return EXTENSIVE  # no variants → Normal Metabolizer
 
-    while len(scores) < 2:
-        scores.append(1.0)  # wild-type copy
+@dataclass(frozen=True)
+class DrugPlan:
+    """
+    One requested drug: its genes and, per gene, phenotype → outcome.
+    ``unknown`` is set (and ``genes`` empty) for drugs not in the table.
+    """
+    drug: str
+    genes: Tuple[str, ...]
+    outcomes: Tuple[Dict[str, InteractionOutcome], ...]
+    unknown: Optional[InteractionOutcome] = None
+
+    def outcome(self, i: int, phenotype: str) -> InteractionOutcome:
+        """Outcome for the *i*-th gene's *phenotype*."""
+        table = self.outcomes[i]
+        hit = table.get(phenotype)
+        if hit is None:
+            # A phenotype no interaction names (e.g. a CPIC "Likely ..." label)
+            hit = table[phenotype] = _missing_outcome(self.drug, self.genes[i], phenotype)
+        return hit
 
-    scores.sort()
-    total = scores[0] + scores[1]
 
-    if total >= 2.5:
-        return ULTRA_RAPID
-    elif total >= 1.5:
-        return EXTENSIVE
-    elif total >= 1.0:
-        return INTERMEDIATE
-    else:
-        return POOR
+class InteractionPlan:
+    """
+    The interaction table compiled for request-time lookups.  Every drug
+    name and synonym, in the casings requests usually arrive in, maps
+    straight to the drug's :class:`DrugPlan`, and each plan holds a ready
+    :class:`InteractionOutcome` for every known phenotype of each gene, so
+    assessing a patient is a dictionary lookup per drug and gene.
+    Compiled drug lists are memoized for cohorts and repeated requests;
+    once full, further lists are compiled but not stored.
+    """
+
+    def __init__(self, interactions: List[DrugGeneInteraction], synonyms: Dict[str, str]):
+        # drug → gene → phenotype → interaction, genes in table order
+        table: Dict[str, Dict[str, Dict[str, DrugGeneInteraction]]] = {}
+        phenotypes = {ULTRA_RAPID, EXTENSIVE, INTERMEDIATE, POOR, INDETERMINATE}
+        for ix in interactions:
+            table.setdefault(ix.drug.lower(), {}).setdefault(ix.gene, {})[ix.phenotype] = ix
+            phenotypes.add(ix.phenotype)
+
+        self.drugs: Dict[str, DrugPlan] = {}
+        for drug, genes in table.items():
+            self.drugs[drug] = DrugPlan(drug, tuple(genes), tuple(
+                {
+                    ph: _interaction_outcome(drug, by_pheno[ph]) if ph in by_pheno
+                    else _missing_outcome(drug, gene, ph)
+                    for ph in sorted(phenotypes)
+                }
+                for gene, by_pheno in genes.items()
+            ))
+
+        # Name as given → canonical drug
+        self.names: Dict[str, str] = {}
+        aliases = [(drug, drug) for drug in self.drugs]
+        aliases += [(alias.lower(), drug.lower()) for alias, drug in synonyms.items()
+                    if drug.lower() in self.drugs]
+        for alias, drug in aliases:
+            for form in (alias, alias.upper(), alias.capitalize(), alias.title()):
+                self.names.setdefault(form, drug)
+
+        self._lists: Dict[Tuple[str, ...], Tuple[DrugPlan, ...]] = {}
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Canonical (interaction-table) name of drug *name*, else None."""
+        drug = self.names.get(name)
+        if drug is None:
+            drug = self.names.get(name.strip().lower())
+        return drug
+
+    def compile(self, drugs: Sequence[str]) -> Tuple[DrugPlan, ...]:
+        """Plans for *drugs* in request order; blank names are dropped."""
+        key = tuple(drugs)
+        plans = self._lists.get(key)
+        if plans is None:
+            plans = tuple(self._plan(name) for name in drugs if name.strip())
+            if len(self._lists) < _PLAN_MEMO_MAX:
+                self._lists[key] = plans
+        return plans
+
+    def _plan(self, name: str) -> DrugPlan:
+        drug = self.resolve(name)
+        if drug is not None:
+            return self.drugs[drug]
+        clean = name.strip().lower()
+        return DrugPlan(clean, (), (), _unknown_drug_outcome(clean))
 
 
 # ---------------------------------------------------------------------------
-# Drug–Gene interaction database (CPIC-aligned)
+# Knowledge base
 # ---------------------------------------------------------------------------
 
-@dataclass
-class DrugGeneInteraction:
-    drug: str
-    gene: str
-    phenotype: str           # metabolizer phenotype
-    risk: str                # SAFE / ADJUST / TOXIC / INEFFECTIVE
-    recommendation: str      # CPIC dosing guidance
-    mechanism: str           # biological explanation
-    cpic_level: str = ""     # e.g. "A" (strongest evidence)
-    guidelines_url: str = ""
+_PHENOTYPE_MEMO_MAX = 1 << 16
+
+
+class PhenotypeMemo:
+    """
+    Bounded ``(gene, canonical diplotype) → phenotype`` table, where the
+    diplotype is an :class:`cpic_tables.AlleleIndex` ID pair (or the
+    canonical string for alleles outside the index).  Each
+    :class:`KnowledgeBase` owns one, so entries are scoped to its version
+    and dropped with it on reload.  Once full, further results are
+    returned but not stored.  The counters are unlocked and may
+    undercount slightly under concurrency.
+    """
+
+    __slots__ = ("max_entries", "_entries", "hits", "misses", "prewarmed")
 
+    def __init__(self, max_entries: int = _PHENOTYPE_MEMO_MAX):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, Any], str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = 0
 
-# Master drug-gene interaction table
-_INTERACTIONS: List[DrugGeneInteraction] = [
-    # ── CYP2D6 ──────────────────────────────────────────────────────────
-    DrugGeneInteraction("codeine", "CYP2D6", ULTRA_RAPID, TOXIC,
-        "AVOID codeine. Use alternative analgesic not metabolized by CYP2D6 (e.g., morphine, non-opioids).",
-        "CYP2D6 ultra-rapid metabolizers convert codeine to morphine at extremely high rates, leading to potentially fatal respiratory depression.",
-        "A", "https://cpicpgx.org/guidelines/guideline-for-codeine-and-cyp2d6/"),
-    DrugGeneInteraction("codeine", "CYP2D6", EXTENSIVE, SAFE,
-        "Use codeine per standard dosing guidelines.",
-        "Normal CYP2D6 activity produces expected morphine levels from codeine.",
-        "A"),
-    DrugGeneInteraction("codeine", "CYP2D6", INTERMEDIATE, ADJUST,
-        "Use codeine with caution at reduced dose, or consider alternative analgesic.",
-        "Reduced CYP2D6 activity leads to lower morphine formation; analgesic effect may be diminished.",
-        "A"),
-    DrugGeneInteraction("codeine", "CYP2D6", POOR, INEFFECTIVE,
-        "AVOID codeine. Use alternative analgesic. Codeine will provide insufficient pain relief.",
-        "CYP2D6 poor metabolizers cannot convert codeine to its active metabolite morphine, rendering it ineffective.",
-        "A"),
-
-    DrugGeneInteraction("tramadol", "CYP2D6", ULTRA_RAPID, TOXIC,
-        "AVOID tramadol. Risk of respiratory depression and seizures.",
-        "Ultra-rapid CYP2D6 metabolism converts tramadol to O-desmethyltramadol at dangerously high rates.",
-        "A"),
-    DrugGeneInteraction("tramadol", "CYP2D6", EXTENSIVE, SAFE,
-        "Use tramadol per standard dosing.",
-        "Normal CYP2D6 metabolism produces expected levels of active metabolite.",
-        "A"),
-    DrugGeneInteraction("tramadol", "CYP2D6", INTERMEDIATE, ADJUST,
-        "Use tramadol with caution; consider lower dose or alternative.",
-        "Intermediate CYP2D6 activity may reduce active metabolite formation.",
-        "A"),
-    DrugGeneInteraction("tramadol", "CYP2D6", POOR, INEFFECTIVE,
-        "AVOID tramadol. Consider alternative analgesic.",
-        "Poor CYP2D6 metabolism prevents formation of the active O-desmethyltramadol metabolite.",
-        "A"),
-
-    DrugGeneInteraction("tamoxifen", "CYP2D6", ULTRA_RAPID, SAFE,
-        "Use tamoxifen per standard dosing.",
-        "Adequate endoxifen formation with ultra-rapid CYP2D6 metabolism.",
-        "A"),
-    DrugGeneInteraction("tamoxifen", "CYP2D6", EXTENSIVE, SAFE,
-        "Use tamoxifen per standard dosing (20 mg/day).",
-        "Normal CYP2D6 converts tamoxifen to endoxifen at therapeutic levels.",
-        "A"),
-    DrugGeneInteraction("tamoxifen", "CYP2D6", INTERMEDIATE, ADJUST,
-        "Consider higher dose (40 mg/day) or alternative (aromatase inhibitor if post-menopausal).",
-        "Reduced CYP2D6 activity decreases endoxifen formation, possibly lowering efficacy for breast cancer treatment.",
-        "A"),
-    DrugGeneInteraction("tamoxifen", "CYP2D6", POOR, INEFFECTIVE,
-        "AVOID tamoxifen. Use aromatase inhibitor (if post-menopausal) or alternative endocrine therapy.",
-        "CYP2D6 poor metabolizers produce subtherapeutic endoxifen levels, compromising tamoxifen's anti-cancer efficacy.",
-        "A"),
-
-    # ── CYP2C19 ─────────────────────────────────────────────────────────
-    DrugGeneInteraction("clopidogrel", "CYP2C19", ULTRA_RAPID, SAFE,
-        "Use clopidogrel per standard dosing.",
-        "Ultra-rapid CYP2C19 metabolism provides enhanced activation of clopidogrel to its active thiol metabolite.",
-        "A"),
-    DrugGeneInteraction("clopidogrel", "CYP2C19", EXTENSIVE, SAFE,
-        "Use clopidogrel per standard dosing (75 mg/day).",
-        "Normal CYP2C19 function activates clopidogrel adequately for anti-platelet effect.",
-        "A"),
-    DrugGeneInteraction("clopidogrel", "CYP2C19", INTERMEDIATE, ADJUST,
-        "Consider alternative antiplatelet (prasugrel or ticagrelor) if undergoing PCI.",
-        "Reduced CYP2C19 function decreases clopidogrel bioactivation, increasing risk of cardiovascular events.",
-        "A"),
-    DrugGeneInteraction("clopidogrel", "CYP2C19", POOR, INEFFECTIVE,
-        "Use ALTERNATIVE antiplatelet agent (prasugrel or ticagrelor). Clopidogrel will not provide adequate platelet inhibition.",
-        "CYP2C19 poor metabolizers cannot bioactivate clopidogrel, leading to treatment failure and increased thrombotic risk.",
-        "A"),
-
-    DrugGeneInteraction("omeprazole", "CYP2C19", ULTRA_RAPID, INEFFECTIVE,
-        "Increase dose to 2-3× standard or use alternative PPI (rabeprazole).",
-        "Ultra-rapid CYP2C19 metabolism clears omeprazole too quickly for adequate acid suppression.",
-        "A"),
-    DrugGeneInteraction("omeprazole", "CYP2C19", EXTENSIVE, SAFE,
-        "Use omeprazole per standard dosing (20 mg/day).",
-        "Normal CYP2C19 activity provides expected omeprazole pharmacokinetics.",
-        "A"),
-    DrugGeneInteraction("omeprazole", "CYP2C19", INTERMEDIATE, SAFE,
-        "Use omeprazole per standard dosing. Slightly elevated drug levels are clinically beneficial.",
-        "Intermediate CYP2C19 metabolism results in higher omeprazole exposure, which may improve acid suppression.",
-        "A"),
-    DrugGeneInteraction("omeprazole", "CYP2C19", POOR, ADJUST,
-        "Consider 50% dose reduction. Monitor for adverse effects.",
-        "CYP2C19 poor metabolizers have markedly elevated omeprazole exposure (up to 10×), increasing risk of adverse effects.",
-        "A"),
-
-    DrugGeneInteraction("escitalopram", "CYP2C19", ULTRA_RAPID, INEFFECTIVE,
-        "Consider alternative SSRI not metabolized by CYP2C19 or increase dose with monitoring.",
-        "Ultra-rapid CYP2C19 metabolism may result in subtherapeutic escitalopram levels.",
-        "A"),
-    DrugGeneInteraction("escitalopram", "CYP2C19", EXTENSIVE, SAFE,
-        "Use escitalopram per standard dosing (10-20 mg/day).",
-        "Normal CYP2C19 metabolism provides expected escitalopram exposure.",
-        "A"),
-    DrugGeneInteraction("escitalopram", "CYP2C19", INTERMEDIATE, SAFE,
-        "Use escitalopram per standard dosing.",
-        "Intermediate CYP2C19 metabolism has modest impact on escitalopram levels.",
-        "A"),
-    DrugGeneInteraction("escitalopram", "CYP2C19", POOR, ADJUST,
-        "Reduce dose by 50%. Consider alternative SSRI if adverse effects occur.",
-        "CYP2C19 poor metabolizers have significantly elevated escitalopram plasma concentrations, increasing side-effect risk.",
-        "A"),
-
-    DrugGeneInteraction("voriconazole", "CYP2C19", ULTRA_RAPID, INEFFECTIVE,
-        "Use alternative antifungal agent or increase dose with therapeutic drug monitoring.",
-        "Ultra-rapid CYP2C19 metabolism clears voriconazole too rapidly for adequate antifungal activity.",
-        "A"),
-    DrugGeneInteraction("voriconazole", "CYP2C19", EXTENSIVE, SAFE,
-        "Use voriconazole per standard dosing.",
-        "Normal CYP2C19 function provides expected voriconazole pharmacokinetics.",
-        "A"),
-    DrugGeneInteraction("voriconazole", "CYP2C19", INTERMEDIATE, SAFE,
-        "Use voriconazole per standard dosing.",
-        "Intermediate CYP2C19 metabolism has minimal clinical impact on voriconazole levels.",
-        "A"),
-    DrugGeneInteraction("voriconazole", "CYP2C19", POOR, TOXIC,
-        "Reduce dose by 50% or use alternative antifungal. Monitor trough levels closely.",
-        "CYP2C19 poor metabolizers have dramatically elevated voriconazole exposure, risking hepatotoxicity and visual disturbances.",
-        "A"),
-
-    # ── CYP2C9 ──────────────────────────────────────────────────────────
-    DrugGeneInteraction("warfarin", "CYP2C9", EXTENSIVE, SAFE,
-        "Use standard warfarin dosing algorithm with INR monitoring.",
-        "Normal CYP2C9 metabolism clears S-warfarin at expected rates.",
-        "A", "https://cpicpgx.org/guidelines/guideline-for-warfarin-and-cyp2c9-and-vkorc1/"),
-    DrugGeneInteraction("warfarin", "CYP2C9", INTERMEDIATE, ADJUST,
-        "Reduce initial dose by 25-50%. Increase INR monitoring frequency.",
-        "Reduced CYP2C9 function decreases S-warfarin clearance, increasing bleeding risk at standard doses.",
-        "A"),
-    DrugGeneInteraction("warfarin", "CYP2C9", POOR, TOXIC,
-        "Reduce initial dose by 50-80%. Use frequent INR monitoring. Consider alternative anticoagulant (DOAC).",
-        "CYP2C9 poor metabolizers accumulate S-warfarin to dangerously high levels, causing severe bleeding risk.",
-        "A"),
-
-    DrugGeneInteraction("celecoxib", "CYP2C9", EXTENSIVE, SAFE,
-        "Use celecoxib per standard dosing.",
-        "Normal CYP2C9 metabolism provides expected celecoxib clearance.",
-        "A"),
-    DrugGeneInteraction("celecoxib", "CYP2C9", INTERMEDIATE, ADJUST,
-        "Reduce starting dose by 50%. Use lowest effective dose.",
-        "Intermediate CYP2C9 metabolism results in elevated celecoxib exposure.",
-        "A"),
-    DrugGeneInteraction("celecoxib", "CYP2C9", POOR, TOXIC,
-        "Reduce dose by 75% or avoid celecoxib. Use alternative NSAID or analgesic.",
-        "CYP2C9 poor metabolizers have significantly impaired celecoxib clearance, increasing GI and cardiovascular toxicity risk.",
-        "A"),
-
-    DrugGeneInteraction("phenytoin", "CYP2C9", EXTENSIVE, SAFE,
-        "Use phenytoin per standard dosing with therapeutic drug monitoring.",
-        "Normal CYP2C9 function provides expected phenytoin pharmacokinetics.",
-        "A"),
-    DrugGeneInteraction("phenytoin", "CYP2C9", INTERMEDIATE, ADJUST,
-        "Reduce dose by 25%. Monitor phenytoin levels closely.",
-        "Reduced CYP2C9 activity leads to higher phenytoin levels and narrower therapeutic window.",
-        "A"),
-    DrugGeneInteraction("phenytoin", "CYP2C9", POOR, TOXIC,
-        "Reduce dose by 50% or use alternative antiepileptic. Monitor drug levels closely.",
-        "CYP2C9 poor metabolizers accumulate phenytoin, risking CNS toxicity (ataxia, nystagmus, seizures).",
-        "A"),
-
-    # ── SLCO1B1 ─────────────────────────────────────────────────────────
-    DrugGeneInteraction("simvastatin", "SLCO1B1", EXTENSIVE, SAFE,
-        "Use simvastatin per standard dosing (up to 40 mg/day).",
-        "Normal SLCO1B1 transporter function provides adequate hepatic uptake of simvastatin acid.",
-        "A", "https://cpicpgx.org/guidelines/guideline-for-simvastatin-and-slco1b1/"),
-    DrugGeneInteraction("simvastatin", "SLCO1B1", INTERMEDIATE, ADJUST,
-        "Limit simvastatin to ≤20 mg/day or use alternative statin (rosuvastatin/pravastatin).",
-        "Reduced SLCO1B1 function increases systemic simvastatin acid exposure, raising myopathy risk (OR ~2.6 per *5 allele).",
-        "A"),
-    DrugGeneInteraction("simvastatin", "SLCO1B1", POOR, TOXIC,
-        "AVOID simvastatin. Use alternative statin (rosuvastatin or pravastatin at lowest effective dose).",
-        "SLCO1B1 poor function causes dramatically elevated simvastatin acid levels, with ~18× increased myopathy risk including rhabdomyolysis.",
-        "A"),
-
-    DrugGeneInteraction("atorvastatin", "SLCO1B1", EXTENSIVE, SAFE,
-        "Use atorvastatin per standard dosing.",
-        "Normal SLCO1B1 function provides expected hepatic uptake of atorvastatin.",
-        "B"),
-    DrugGeneInteraction("atorvastatin", "SLCO1B1", INTERMEDIATE, ADJUST,
-        "Use lower dose atorvastatin or consider pravastatin/rosuvastatin.",
-        "Reduced SLCO1B1 function modestly increases atorvastatin systemic exposure.",
-        "B"),
-    DrugGeneInteraction("atorvastatin", "SLCO1B1", POOR, ADJUST,
-        "Use lowest effective dose or switch to pravastatin/rosuvastatin. Monitor for muscle symptoms.",
-        "Poor SLCO1B1 function significantly increases atorvastatin exposure and myopathy risk.",
-        "B"),
-
-    # ── TPMT ────────────────────────────────────────────────────────────
-    DrugGeneInteraction("azathioprine", "TPMT", EXTENSIVE, SAFE,
-        "Use azathioprine per standard dosing (2-3 mg/kg/day).",
-        "Normal TPMT activity provides expected thiopurine metabolism and safe thioguanine nucleotide (TGN) levels.",
-        "A", "https://cpicpgx.org/guidelines/guideline-for-thiopurines-and-tpmt-and-nudt15/"),
-    DrugGeneInteraction("azathioprine", "TPMT", INTERMEDIATE, ADJUST,
-        "Reduce dose to 30-70% of standard. Monitor CBC weekly for first months.",
-        "Intermediate TPMT activity causes higher TGN accumulation, increasing myelosuppression risk.",
-        "A"),
-    DrugGeneInteraction("azathioprine", "TPMT", POOR, TOXIC,
-        "Reduce dose to 10% of standard or AVOID. Use alternative immunosuppressant. Mandatory CBC monitoring.",
-        "TPMT-deficient patients accumulate lethal TGN concentrations, causing severe/fatal myelosuppression (pancytopenia).",
-        "A"),
-
-    DrugGeneInteraction("mercaptopurine", "TPMT", EXTENSIVE, SAFE,
-        "Use mercaptopurine per protocol dosing.",
-        "Normal TPMT activity provides safe thiopurine metabolism.",
-        "A"),
-    DrugGeneInteraction("mercaptopurine", "TPMT", INTERMEDIATE, ADJUST,
-        "Reduce dose to 30-70% of standard. Monitor CBC closely.",
-        "Intermediate TPMT activity increases TGN accumulation and myelosuppression risk.",
-        "A"),
-    DrugGeneInteraction("mercaptopurine", "TPMT", POOR, TOXIC,
-        "Reduce dose to 10% of standard or AVOID. Mandatory intensive CBC monitoring.",
-        "TPMT deficiency causes dangerous TGN accumulation and life-threatening myelotoxicity.",
-        "A"),
-
-    # ── DPYD ────────────────────────────────────────────────────────────
-    DrugGeneInteraction("fluorouracil", "DPYD", EXTENSIVE, SAFE,
-        "Use 5-fluorouracil per standard dosing.",
-        "Normal DPD enzyme activity provides expected fluorouracil catabolism.",
-        "A", "https://cpicpgx.org/guidelines/guideline-for-fluoropyrimidines-and-dpyd/"),
-    DrugGeneInteraction("fluorouracil", "DPYD", INTERMEDIATE, ADJUST,
-        "Reduce initial dose by 50%. Titrate based on toxicity and efficacy.",
-        "Reduced DPD activity impairs fluorouracil catabolism, increasing exposure and toxicity risk (mucositis, myelosuppression).",
-        "A"),
-    DrugGeneInteraction("fluorouracil", "DPYD", POOR, TOXIC,
-        "AVOID fluorouracil and all fluoropyrimidines. Use alternative chemotherapy.",
-        "DPD-deficient patients cannot catabolize fluorouracil, resulting in severe/fatal toxicity (mucositis, neutropenia, neurotoxicity).",
-        "A"),
-
-    DrugGeneInteraction("capecitabine", "DPYD", EXTENSIVE, SAFE,
-        "Use capecitabine per standard dosing.",
-        "Normal DPD activity provides expected capecitabine/fluorouracil metabolism.",
-        "A"),
-    DrugGeneInteraction("capecitabine", "DPYD", INTERMEDIATE, ADJUST,
-        "Reduce initial dose by 50%. Monitor closely for toxicity.",
-        "Reduced DPD activity impairs fluoropyrimidine catabolism, increasing toxicity risk.",
-        "A"),
-    DrugGeneInteraction("capecitabine", "DPYD", POOR, TOXIC,
-        "AVOID capecitabine. Use alternative chemotherapy regimen.",
-        "DPD deficiency causes life-threatening fluoropyrimidine toxicity.",
-        "A"),
-]
-
-# Build fast lookup:  (drug_lower, gene_upper, phenotype) → interaction
-_INTERACTION_INDEX: Dict[Tuple[str, str, str], DrugGeneInteraction] = {}
-for _ix in _INTERACTIONS:
-    _key = (_ix.drug.lower(), _ix.gene.upper(), _ix.phenotype)
-    _INTERACTION_INDEX[_key] = _ix
-
-# All drug names in the knowledge base
-KNOWN_DRUGS = sorted({ix.drug for ix in _INTERACTIONS})
-
-# All gene names in the knowledge base
-KNOWN_GENES = sorted({ix.gene for ix in _INTERACTIONS})
-
-# Drug → list of relevant genes
-DRUG_GENES: Dict[str, List[str]] = {}
-for _ix in _INTERACTIONS:
-    DRUG_GENES.setdefault(_ix.drug.lower(), [])
-    if _ix.gene not in DRUG_GENES[_ix.drug.lower()]:
-        DRUG_GENES[_ix.drug.lower()].append(_ix.gene)
+    def get(self, key: Tuple[str, Any]) -> Optional[str]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: Tuple[str, Any], value: str) -> None:
+        if len(self._entries) < self.max_entries:
+            self._entries[key] = value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "prewarmed": self.prewarmed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class GeneData:
+    """
+    What one gene contributes to a knowledge base, derived from its CPIC
+    tables (or, without them, the hardcoded fallbacks) the first time the
+    gene is screened.
+    """
+
+    __slots__ = ("gene", "allele_function", "rsid_to_allele", "fallback_rsids",
+                 "position_index", "allele_index", "star_caller", "sites")
+
+    def __init__(
+        self,
+        gene: str,
+        tables: cpic_tables.CpicTables,
+        hardcoded_functions: Dict[str, Dict[str, str]],
+        hardcoded_rsids: Dict[str, Tuple[str, str]],
+    ):
+        self.gene = gene
+        # Only used for rsIDs the CPIC tables of the screened genes don't cover
+        self.fallback_rsids = {rsid: val for rsid, val in hardcoded_rsids.items() if val[0] == gene}
+        self.allele_index: Optional[cpic_tables.AlleleIndex] = None
+        self.star_caller: Optional[star_caller.StarAlleleCaller] = None
+
+        if tables.has_gene(gene):
+            # CPIC tables override hardcoded entries
+            self.allele_function = cpic_tables.build_legacy_allele_function_dict(gene, tables)
+            self.rsid_to_allele = cpic_tables.build_legacy_rsid_to_allele_dict(gene, tables)
+            # (chrom, pos, ref, alt) → (gene, star_allele, hgvs_site), for rows
+            # whose ID column is "." — lowest allele first, as for rsIDs
+            self.position_index = {
+                key: (gene, *hits[0]) for key, hits in tables.get_position_alleles(gene).items()
+            }
+            self.allele_index = tables.allele_index(gene)
+            self.star_caller = star_caller.StarAlleleCaller.from_tables(tables, gene)
+            self.sites = tables.get_definition_sites(gene)
+        else:
+            self.allele_function = hardcoded_functions.get(gene, {})
+            self.rsid_to_allele = {}
+            self.position_index = {}
+            if gene in hardcoded_functions:
+                self.allele_index = cpic_tables.AlleleIndex(list(self.allele_function) + ["*1"])
+            self.sites = []
+
+
+class GeneScope:
+    """
+    A knowledge base narrowed to some genes: the merged indexes an
+    analysis reads (rsIDs, definition positions, allele functions,
+    star-allele callers, target sites and regions), built from those
+    genes' tables only.  Every other attribute is the knowledge base's
+    own.  Get one from :meth:`KnowledgeBase.for_drugs` or
+    :meth:`KnowledgeBase.scope`.
+    """
+
+    def __init__(self, kb: "KnowledgeBase", genes: Sequence[str]):
+        self.kb = kb
+        data = [kb.gene_data(gene) for gene in genes]
+        self.known_genes = [g for g in kb.known_genes if g in genes]
+        self.known_gene_set = frozenset(g.upper() for g in self.known_genes)
+        self.allele_function: Dict[str, Dict[str, str]] = {d.gene: d.allele_function for d in data}
+
+        # Merge: CPIC tables first (higher quality), hardcoded only if rsID not already covered
+        self.rsid_to_allele: Dict[str, Tuple[str, str]] = {}
+        for d in data:
+            self.rsid_to_allele.update(d.rsid_to_allele)
+        for d in data:
+            for rsid, val in d.fallback_rsids.items():
+                self.rsid_to_allele.setdefault(rsid, val)
+
+        self.position_index: Dict[cpic_tables.PositionKey, Tuple[str, str, str]] = {}
+        for d in data:
+            for key, hit in d.position_index.items():
+                self.position_index.setdefault(key, hit)
+
+        self.allele_indexes: Dict[str, cpic_tables.AlleleIndex] = {
+            d.gene: d.allele_index for d in data if d.allele_index is not None
+        }
+        # Multi-site diplotype callers for the genes with star-allele tables
+        self.star_callers: Dict[str, star_caller.StarAlleleCaller] = {
+            d.gene: d.star_caller for d in data if d.star_caller is not None
+        }
+
+        self.target_sites = TargetSites(
+            ids=frozenset(self.rsid_to_allele),
+            positions=frozenset(site for d in data for site in d.sites),
+            genes=self.known_gene_set,
+        )
+        self.gene_regions: Dict[str, Tuple[str, int, int]] = {}
+        for d in data:
+            if d.sites:
+                chrom = d.sites[0][0]
+                positions = [p for c, p in d.sites if c == chrom]
+                self.gene_regions[d.gene] = (chrom, min(positions), max(positions))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "kb":
+            raise AttributeError(name)
+        return getattr(self.kb, name)
+
+    def lookup_position(self, chrom: str, pos: int, ref: str, alts: List[str]) -> Optional[Tuple[str, str, str]]:
+        """
+        (gene, star_allele, hgvs_site) for the first of *alts* that defines
+        a CPIC allele at *chrom*:*pos*, else None.  Indels match any
+        non-SNV definition site at the same position.
+        """
+        if chrom.startswith("chr"):
+            chrom = chrom[3:]
+        for alt in alts:
+            if not alt or alt == "." or alt[0] == "<" or alt == "*":
+                continue
+            if len(ref) == 1 and len(alt) == 1:
+                hit = self.position_index.get((chrom, pos, ref, alt))
+            else:
+                hit = self.position_index.get((chrom, pos, "", ""))
+            if hit:
+                return hit
+        return None
+
+
+class KnowledgeBase:
+    """
+    One immutable version of the knowledge base: a CPIC table generation
+    merged with the hardcoded fallbacks, plus the drug–gene interaction
+    table and the indexes built from them.  ``version`` identifies its
+    content; cached analysis results are only valid for the version that
+    produced them.
+
+    Per-gene data is built the first time a gene is screened (see
+    :meth:`gene_data` and :meth:`for_drugs`), so an analysis only loads
+    the tables of the genes its drugs need.  The whole-knowledge-base
+    indexes (``rsid_to_allele``, ``star_callers``, ...) build every gene.
+    """
+
+    def __init__(
+        self,
+        tables: cpic_tables.CpicTables,
+        interactions: List[DrugGeneInteraction],
+        hardcoded_functions: Dict[str, Dict[str, str]],
+        hardcoded_rsids: Dict[str, Tuple[str, str]],
+        *,
+        synonyms: Optional[Dict[str, str]] = None,
+        source_mtime_ns: int = 0,
+    ):
+        self.tables = tables
+        self.interactions = interactions
+        self.hardcoded_functions = hardcoded_functions
+        self.hardcoded_rsids = hardcoded_rsids
+        self.drug_synonyms = dict(synonyms or {})
+        # mtime of pgx_definitions when it was read (see changed())
+        self.source_mtime_ns = source_mtime_ns
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+
+        # Fast lookup:  (drug_lower, gene_upper, phenotype) → interaction
+        self.interaction_index: Dict[Tuple[str, str, str], DrugGeneInteraction] = {}
+        for ix in interactions:
+            self.interaction_index[(ix.drug.lower(), ix.gene.upper(), ix.phenotype)] = ix
+
+        # All drug / gene names in the knowledge base
+        self.known_drugs = sorted({ix.drug for ix in interactions})
+        self.known_genes = sorted({ix.gene for ix in interactions})
+        self.known_gene_set = frozenset(g.upper() for g in self.known_genes)
+        # Every gene with data: in a CPIC table, the fallbacks or the interactions
+        self.all_genes = sorted(set(self.known_genes) | set(tables.genes()) | set(hardcoded_functions))
+
+        # Drug → list of relevant genes
+        self.drug_genes: Dict[str, List[str]] = {}
+        for ix in interactions:
+            genes = self.drug_genes.setdefault(ix.drug.lower(), [])
+            if ix.gene not in genes:
+                genes.append(ix.gene)
+
+        # Drug list → gene → phenotype → result template, synonyms included
+        self.interaction_plan = InteractionPlan(interactions, self.drug_synonyms)
+
+        # The table files' content hash plus everything read from
+        # pgx_definitions — known up front, without loading a table
+        self.version = hashlib.sha256(
+            (tables.version + repr(interactions) + repr(sorted(self.drug_synonyms.items()))
+             + repr(sorted(hardcoded_functions.items())) + repr(sorted(hardcoded_rsids.items()))
+             + f"caller{star_caller.CALLER_VERSION}").encode()
+        ).hexdigest()[:16]
+
+        # gene → GeneData, and gene tuple → GeneScope; filled on first use
+        # under the tables' lock (the one CpicTables.ensure_loaded takes)
+        self._genes: Dict[str, GeneData] = {}
+        self._scopes: Dict[Tuple[str, ...], GeneScope] = {}
+        self.phenotype_memo = PhenotypeMemo()
+
+    def warm(self) -> None:
+        """
+        Load every table, build every gene's data and pre-fill the
+        phenotype memo, so first requests pay for none of them.
+        """
+        self.tables.load_all()
+        self.scope()
+        self.prewarm_phenotypes()
+
+    def prewarm_phenotypes(self) -> None:
+        """Memoize the phenotype of every canonically ordered CPIC diplotype."""
+        memo = self.phenotype_memo
+        for gene in self.tables.genes():
+            self.tables.ensure_loaded(gene, "diplo")
+            for diplotype, dp in self.tables.diplotype_phenotype.get(gene, {}).items():
+                parts = diplotype.split("/")
+                if len(parts) == 2:
+                    memo.put(self._memo_key(gene, *parts), dp.metabolizer_phenotype)
+        memo.prewarmed = len(memo)
+
+    # ── per-gene data ──
+
+    def gene_data(self, gene: str) -> GeneData:
+        """*gene*'s :class:`GeneData`, built (and its tables loaded) on first use."""
+        data = self._genes.get(gene)
+        if data is None:
+            with self.tables._lock:
+                data = self._genes.get(gene)
+                if data is None:
+                    data = GeneData(gene, self.tables, self.hardcoded_functions, self.hardcoded_rsids)
+                    self._genes[gene] = data
+        return data
+
+    def scope(self, genes: Optional[Iterable[str]] = None) -> GeneScope:
+        """The :class:`GeneScope` of *genes* (default: every gene), built once."""
+        key = tuple(sorted(set(genes))) if genes is not None else tuple(self.all_genes)
+        view = self._scopes.get(key)
+        if view is None:
+            with self.tables._lock:
+                view = self._scopes.get(key)
+                if view is None:
+                    view = self._scopes[key] = GeneScope(self, key)
+        return view
+
+    def for_drugs(self, drugs: Sequence[str]) -> GeneScope:
+        """
+        The scope an analysis of *drugs* screens: the genes they interact
+        with, or every known gene when *drugs* is empty.
+        """
+        if not drugs:
+            return self.scope(self.known_genes)
+        return self.scope(
+            gene for plan in self.interaction_plan.compile(drugs) if plan.unknown is None
+            for gene in plan.genes
+        )
+
+    @property
+    def allele_function(self) -> Dict[str, Dict[str, str]]:
+        return self.scope().allele_function
+
+    @property
+    def rsid_to_allele(self) -> Dict[str, Tuple[str, str]]:
+        return self.scope().rsid_to_allele
+
+    @property
+    def position_index(self) -> Dict[cpic_tables.PositionKey, Tuple[str, str, str]]:
+        return self.scope().position_index
+
+    @property
+    def allele_indexes(self) -> Dict[str, cpic_tables.AlleleIndex]:
+        return self.scope().allele_indexes
+
+    @property
+    def star_callers(self) -> Dict[str, star_caller.StarAlleleCaller]:
+        return self.scope().star_callers
+
+    @property
+    def target_sites(self) -> TargetSites:
+        return self.scope().target_sites
+
+    @property
+    def gene_regions(self) -> Dict[str, Tuple[str, int, int]]:
+        return self.scope().gene_regions
+
+    # ── lookups ──
+
+    def infer_phenotype(self, gene: str, detected_alleles: List[dict]) -> str:
+        """See the module-level :func:`infer_phenotype`."""
+        copies = _called_copies(detected_alleles)
+        if len(copies) > 2:
+            # The diplotype keeps the first two copies but the activity
+            # score the two lowest, so no diplotype key stands for this
+            return self._infer_phenotype(gene, detected_alleles)
+        # A copy without a star allele scores as wild-type, like the padding
+        copies = [c or "*1" for c in copies] + ["*1"] * (2 - len(copies))
+        return self.phenotype_for_pair(gene, copies[0], copies[1])
+
+    def _memo_key(self, gene: str, allele1: str, allele2: str) -> Tuple[str, Any]:
+        index = self.gene_data(gene).allele_index
+        ids = index.pair(allele1, allele2) if index is not None else None
+        return (gene, ids if ids is not None else canonical_diplotype(allele1, allele2))
+
+    def phenotype_for_pair(self, gene: str, allele1: str, allele2: str) -> str:
+        """Phenotype of the diplotype *allele1*/*allele2*, through the memo."""
+        key = self._memo_key(gene, allele1, allele2)
+        phenotype = self.phenotype_memo.get(key)
+        if phenotype is None:
+            phenotype = self._infer_phenotype(gene, [
+                {"star_allele": allele1, "genotype": "0/1"},
+                {"star_allele": allele2, "genotype": "0/1"},
+            ])
+            self.phenotype_memo.put(key, phenotype)
+        return phenotype
+
+    def build_diplotype(self, gene: str, detected_alleles: List[dict]) -> str:
+        """:func:`build_diplotype` ordered through *gene*'s allele index."""
+        return build_diplotype(gene, detected_alleles, self.gene_data(gene).allele_index)
+
+    def _infer_phenotype(self, gene: str, detected_alleles: List[dict]) -> str:
+        tables = self.tables
+
+        # ── Try official CPIC diplotype table first (for any loaded gene) ──
+        if tables.has_gene(gene):
+            diplotype = self.build_diplotype(gene, detected_alleles)
+            dp = tables.lookup_diplotype_phenotype(gene, diplotype)
+            if dp:
+                return dp.metabolizer_phenotype
+            # If not found (rare combo), fall through to heuristic
+
+        # ── Heuristic: activity-score based ──
+        gene_funcs = self.gene_data(gene).allele_function
+
+        scores: List[float] = []
+        for a in detected_alleles:
+            star = a.get("star_allele", "")
+            gt = a.get("genotype", "0/0")
+
+            # For genes with CPIC tables, use official activity values
+            if tables.has_gene(gene) and star:
+                af = tables.get_allele_function(gene, star)
+                av = af.activity_value if af and af.activity_value is not None else 1.0
+            else:
+                func = gene_funcs.get(star, "normal")
+                av = _function_score(func)
+
+            if gt in ("1/1", "1|1"):
+                scores.extend([av, av])
+            elif gt in ("0/1", "0|1", "1|0", "1/0"):
+                scores.append(av)
+
+        if not scores:
+            return EXTENSIVE  # no variants → Normal Metabolizer
+
+        while len(scores) < 2:
+            scores.append(1.0)  # wild-type copy
+
+        scores.sort()
+        total = scores[0] + scores[1]
+
+        if total >= 2.5:
+            return ULTRA_RAPID
+        elif total >= 1.5:
+            return EXTENSIVE
+        elif total >= 1.0:
+            return INTERMEDIATE
+        else:
+            return POOR
+
+    def lookup_position(self, chrom: str, pos: int, ref: str, alts: List[str]) -> Optional[Tuple[str, str, str]]:
+        """:meth:`GeneScope.lookup_position` over every gene."""
+        return self.scope().lookup_position(chrom, pos, ref, alts)
+
+    def lookup_interaction(self, drug: str, gene: str, phenotype: str) -> Optional[DrugGeneInteraction]:
+        drug = self.interaction_plan.resolve(drug) or drug.lower()
+        return self.interaction_index.get((drug, gene.upper(), phenotype))
+
+    def get_genes_for_drug(self, drug: str) -> List[str]:
+        drug = self.interaction_plan.resolve(drug) or drug.lower()
+        return self.drug_genes.get(drug, [])
 
 
 def lookup_interaction(drug: str, gene: str, phenotype: str) -> Optional[DrugGeneInteraction]:
     """Look up a drug–gene interaction by drug name, gene, and metabolizer phenotype."""
-    return _INTERACTION_INDEX.get((drug.lower(), gene.upper(), phenotype))
+    return _current.lookup_interaction(drug, gene, phenotype)
 
 
 def get_genes_for_drug(drug: str) -> List[str]:
     """Return the gene(s) relevant to a drug."""
-    return DRUG_GENES.get(drug.lower(), [])
+    return _current.get_genes_for_drug(drug)
 
 
 def get_all_drugs() -> List[str]:
     """Return all supported drug names."""
-    return KNOWN_DRUGS
+    return _current.known_drugs
+
+
+# ---------------------------------------------------------------------------
+# Targeted parsing
+# ---------------------------------------------------------------------------
+
+def build_target_sites() -> TargetSites:
+    """
+    The parser pre-filter for pharmacogenomic rows: every known rsID,
+    the CHROM:POS of every CPIC allele-definition site, and the screened
+    genes (for VCFs annotated with INFO GENE/PX tags).
+    """
+    return _current.target_sites
+
+
+def build_gene_regions() -> Dict[str, Tuple[str, int, int]]:
+    """
+    Gene → (chrom, start, end) spanning every CPIC allele-definition site
+    (GRCh38, 1-based inclusive, chromosome without ``chr``).  Used for
+    indexed region queries on large bgzipped VCFs.
+    """
+    return _current.gene_regions
+
+
+# ---------------------------------------------------------------------------
+# Hot reload
+# ---------------------------------------------------------------------------
+
+_RELOAD_LOCK = threading.Lock()
+_THREAD_LOCK = threading.Lock()
+_reload_thread: Optional[threading.Thread] = None
+_last_error: Optional[str] = None
+_last_reload: Optional[str] = None
+
+
+def _source_mtime_ns() -> int:
+    try:
+        return os.stat(pgx_definitions.__file__).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _read_definitions() -> Tuple[
+    List[DrugGeneInteraction], Dict[str, Dict[str, str]], Dict[str, Tuple[str, str]], Dict[str, str]
+]:
+    """
+    Reload :mod:`pgx_definitions` and return its interaction table,
+    hardcoded fallbacks and drug synonyms, so edits to them are picked up
+    without a restart.
+    """
+    importlib.invalidate_caches()
+    module = importlib.reload(pgx_definitions)
+    return (module._INTERACTIONS, module._HARDCODED_ALLELE_FUNCTION,
+            module._HARDCODED_RSIDS, module._DRUG_SYNONYMS)
+
+
+def current() -> KnowledgeBase:
+    """
+    The knowledge base new analyses should use.  Callers that make several
+    lookups should take it once and keep it, so a concurrent reload cannot
+    mix two versions into one result.
+    """
+    return _current
+
+
+def changed() -> bool:
+    """True when a CPIC table or the definitions differ from what ``current()`` was built from."""
+    kb = _current
+    return (cpic_tables.tables_signature() != kb.tables.version
+            or _source_mtime_ns() != kb.source_mtime_ns)
+
+
+def reload(*, force: bool = False) -> KnowledgeBase:
+    """
+    Build a knowledge base from the tables and definitions on disk, load
+    all of its tables and swap it in.  Unless *force* is set, a build
+    whose version equals the current one is discarded.  Returns the knowledge
+    base in effect afterwards; on error the current one stays in place.
+    """
+    global _current, _last_error, _last_reload
+    with _RELOAD_LOCK:
+        t0 = time.perf_counter()
+        try:
+            mtime_ns = _source_mtime_ns()
+            interactions, functions, rsids, synonyms = _read_definitions()
+            tables = cpic_tables.CpicTables.discover()
+            kb = KnowledgeBase(tables, interactions, functions, rsids,
+                               synonyms=synonyms, source_mtime_ns=mtime_ns)
+            kb.warm()
+        except Exception as e:
+            _last_error = f"{type(e).__name__}: {e}"
+            print(f"[pgx_kb] Reload failed, keeping {_current.version}: {_last_error}")
+            return _current
+
+        _last_error = None
+        _last_reload = datetime.now(timezone.utc).isoformat()
+        elapsed = (time.perf_counter() - t0) * 1000
+        if kb.version == _current.version and not force:
+            # A touched or reverted definitions file: keep serving the old object
+            _current.source_mtime_ns = mtime_ns
+            print(f"[pgx_kb] Reload found no changes ({kb.version}, {elapsed:.0f} ms)")
+            return _current
+
+        previous = _current.version
+        cpic_tables.install(tables)
+        _current = kb
+        print(f"[pgx_kb] Knowledge base {previous} → {kb.version} ({elapsed:.0f} ms)")
+        return kb
+
+
+def reload_async(*, force: bool = False) -> bool:
+    """Start :func:`reload` in a background thread; False if one is already running."""
+    global _reload_thread
+    with _THREAD_LOCK:
+        if _reload_thread is not None and _reload_thread.is_alive():
+            return False
+        _reload_thread = threading.Thread(
+            target=reload, kwargs={"force": force}, name="kb-reload", daemon=True,
+        )
+        _reload_thread.start()
+    return True
+
+
+def reload_status() -> Dict[str, Any]:
+    kb = _current
+    return {
+        "version": kb.version,
+        "tablesVersion": kb.tables.version,
+        "phenotypeMemo": kb.phenotype_memo.stats(),
+        "loadedAt": kb.loaded_at,
+        "reloading": _reload_thread is not None and _reload_thread.is_alive(),
+        "lastReload": _last_reload,
+        "lastError": _last_error,
+    }
+
+
+def start_watcher(interval: float) -> threading.Thread:
+    """Poll every *interval* seconds and reload when :func:`changed` reports a change."""
+    def _watch() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                if changed():
+                    reload_async()
+            except OSError as e:
+                print(f"[pgx_kb] Watcher check failed: {e}")
+
+    thread = threading.Thread(target=_watch, name="kb-watcher", daemon=True)
+    thread.start()
+    print(f"[pgx_kb] Watching for knowledge-base changes every {interval:g}s")
+    return thread
+
+
+# Module attributes kept for backward compat, resolved against the current
+# knowledge base — hold ``current()`` instead where consistency matters
+_KB_ATTRS = {
+    "ALLELE_FUNCTION": "allele_function",
+    "RSID_TO_ALLELE": "rsid_to_allele",
+    "KNOWN_DRUGS": "known_drugs",
+    "KNOWN_GENES": "known_genes",
+    "DRUG_GENES": "drug_genes",
+    "DRUG_SYNONYMS": "drug_synonyms",
+    "_INTERACTION_INDEX": "interaction_index",
+    "PGX_TARGET_SITES": "target_sites",
+    "PGX_GENE_REGIONS": "gene_regions",
+    "KB_VERSION": "version",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _KB_ATTRS:
+        return getattr(_current, _KB_ATTRS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_current = KnowledgeBase(
+    cpic_tables.current(), pgx_definitions._INTERACTIONS,
+    pgx_definitions._HARDCODED_ALLELE_FUNCTION, pgx_definitions._HARDCODED_RSIDS,
+    synonyms=pgx_definitions._DRUG_SYNONYMS,
+    source_mtime_ns=_source_mtime_ns(),
+)
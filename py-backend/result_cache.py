@@ -0,0 +1,396 @@
+"""
+Analysis Result Cache for Pharmaguard
+=====================================
+Content-addressed cache of finished ``/analyze`` responses, so re-opening
+a report for a VCF that was already analyzed skips parsing and the LLM
+calls entirely.
+
+Entries are keyed by :func:`cache_key` over
+
+  - the SHA-256 of the uploaded bytes (:func:`vcf_digest`), hashed as
+    they are without inflating or parsing them
+  - the sample ID
+  - the drug list in request order, synonyms resolved to the canonical
+    names (the report lists its drugs in that order)
+  - the knowledge-base version (``pgx_knowledgebase.current().version``)
+  - the explanation mode (``"llm"`` or ``"template"``), so template
+    reports are not served once an LLM is configured
+
+:class:`ResultCache` keeps an in-memory LRU and optionally writes through
+to a second tier (:class:`DiskTier`, :class:`SqliteTier` or
+:class:`MongoTier`) that survives restarts and is shared between workers.
+The same classes back the LLM output cache (:mod:`llm_cache`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from parser import VCFSource
+
+_CHUNK = 1 << 20
+
+
+def vcf_digest(source: VCFSource) -> str:
+    """
+    SHA-256 hex digest of the raw bytes of *source* (a path, bytes or a
+    binary handle).  Nothing is inflated or parsed, so a file uploaded
+    compressed and uncompressed gets two digests.
+
+    A caller's binary handle is rewound afterwards so it can be parsed.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+
+    h = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            for chunk in iter(lambda: fh.read(_CHUNK), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    start = source.tell()
+    for chunk in iter(lambda: source.read(_CHUNK), b""):
+        h.update(chunk)
+    source.seek(start)
+    return h.hexdigest()
+
+
+def cache_key(
+    digest: str,
+    sample: Optional[str],
+    drugs: Iterable[str],
+    kb_version: str,
+    explanations: str = "",
+) -> str:
+    """
+    Stable key for one (VCF, sample, drug list, knowledge base, explanation
+    mode) analysis.  *drugs* are keyed in order, repeats included; pass
+    canonical names so synonyms share an entry.
+    """
+    drug_list = [d.strip().lower() for d in drugs if d.strip()]
+    payload = json.dumps([digest, sample or "", drug_list, kb_version, explanations], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Second tiers
+# ---------------------------------------------------------------------------
+
+class DiskTier:
+    """
+    One JSON file per entry under *directory*; writes are atomic.  With
+    *ttl* (seconds) files older than that read as missing and are removed;
+    with *max_entries* the oldest files are removed once there are more.
+    """
+
+    name = "disk"
+
+    def __init__(self, directory: str, *, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entry(key)
+        return entry[0] if entry is not None else None
+
+    def entry(self, key: str) -> Optional[Tuple[dict, float]]:
+        """``(value, time stored)`` for *key*, or None."""
+        path = self._path(key)
+        try:
+            created = os.path.getmtime(path)
+            if self.ttl and time.time() - created > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh), created
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[cache] Disk read failed for {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, value: dict) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(value, fh, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[cache] Disk write failed for {key[:12]}: {e}")
+            return
+        with self._lock:
+            self._puts += 1
+            # Trim in batches rather than on every write
+            evict = (self.ttl or self.max_entries) and self._puts % 64 == 0
+        if evict:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+        entries.sort()
+        drop = 0
+        if self.ttl:
+            cutoff = time.time() - self.ttl
+            while drop < len(entries) and entries[drop][0] < cutoff:
+                drop += 1
+        if self.max_entries:
+            drop = max(drop, len(entries) - self.max_entries)
+        for _, path in entries[:drop]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def clear(self) -> None:
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+
+class SqliteTier:
+    """
+    Entries in one SQLite table, safe to share between worker processes.
+    With *ttl* (seconds) older entries read as missing and are dropped;
+    with *max_entries* the least recently read entries are evicted once
+    the table grows past it.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, *, table: str = "entries",
+                 ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)")
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entry(key)
+        return entry[0] if entry is not None else None
+
+    def entry(self, key: str) -> Optional[Tuple[dict, float]]:
+        """``(value, time stored)`` for *key*, or None."""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if self.ttl and now - row[1] > self.ttl:
+                    self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    return None
+                self._db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0]), row[1]
+        except (sqlite3.Error, ValueError) as e:
+            print(f"[cache] SQLite read failed for {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, value: dict) -> None:
+        now = time.time()
+        try:
+            with self._lock:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, separators=(",", ":")), now, now),
+                )
+                self._puts += 1
+                # Trim in batches rather than on every write
+                if self.max_entries and self._puts % 64 == 0:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            print(f"[cache] SQLite write failed for {key[:12]}: {e}")
+
+    def _evict(self, now: float) -> None:
+        if self.ttl:
+            self._db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,),
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+
+
+class MongoTier:
+    """
+    Entries stored as ``{_id: key, result: ..., created: ...}`` documents
+    in *collection*.  With *ttl* (seconds) older entries read as missing
+    and are deleted; a TTL index on ``expires`` has MongoDB drop the ones
+    never read again.
+    """
+
+    name = "mongo"
+
+    def __init__(self, collection, *, ttl: Optional[float] = None):
+        self.collection = collection
+        self.ttl = ttl
+        if ttl:
+            try:
+                collection.create_index("expires", expireAfterSeconds=0)
+            except Exception as e:
+                print(f"[cache] Mongo TTL index not created: {e}")
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entry(key)
+        return entry[0] if entry is not None else None
+
+    def entry(self, key: str) -> Optional[Tuple[dict, float]]:
+        """``(value, time stored)`` for *key*, or None."""
+        try:
+            doc = self.collection.find_one({"_id": key})
+            if doc is None:
+                return None
+            created = doc.get("created", 0)
+            if self.ttl and time.time() - created > self.ttl:
+                self.collection.delete_one({"_id": key})
+                return None
+        except Exception as e:
+            print(f"[cache] Mongo read failed for {key[:12]}: {e}")
+            return None
+        return doc["result"], created
+
+    def put(self, key: str, value: dict) -> None:
+        try:
+            now = time.time()
+            doc = {"_id": key, "result": value, "created": now}
+            if self.ttl:
+                doc["expires"] = datetime.fromtimestamp(now + self.ttl, timezone.utc)
+            self.collection.replace_one({"_id": key}, doc, upsert=True)
+        except Exception as e:
+            print(f"[cache] Mongo write failed for {key[:12]}: {e}")
+
+    def clear(self) -> None:
+        self.collection.delete_many({})
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+class ResultCache:
+    """
+    Thread-safe LRU of analysis responses with an optional second tier.
+
+    ``get`` checks memory first, then the tier (promoting hits into
+    memory); ``put`` writes to both.  With *ttl* (seconds) memory entries
+    expire that long after they were first stored, in whichever tier, so
+    a promoted entry does not outlive it.  Cached dicts are shared, so
+    callers must copy before modifying one.
+    """
+
+    def __init__(self, max_entries: int = 256, tier=None, *, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.tier = tier
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored = entry
+                if self._expired(stored):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+        entry = self.tier.entry(key) if self.tier is not None else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored = entry
+            self.hits += 1
+            self.tier_hits += 1
+            if not self._expired(stored):
+                self._remember(key, value, stored)
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._remember(key, value, time.time())
+        if self.tier is not None:
+            self.tier.put(key, value)
+
+    def _expired(self, stored: float) -> bool:
+        return bool(self.ttl) and time.time() - stored > self.ttl
+
+    def _remember(self, key: str, value: dict, stored: float) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (value, stored)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.tier_hits = 0
+        if self.tier is not None:
+            self.tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "tierHits": self.tier_hits,
+                "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "ttl": self.ttl,
+                "tier": self.tier.name if self.tier is not None else None,
+            }
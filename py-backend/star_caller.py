@@ -0,0 +1,300 @@
+"""
+Multi-Site Star-Allele Caller for Pharmaguard
+=============================================
+Calls a sample's diplotype from every allele-defining site of a gene at
+once, instead of mapping each rsID to a single (lowest-numbered) allele.
+
+Each gene's CPIC allele definition table is compiled into a bitmatrix of
+alleles × defining variants, packed into ``uint64`` words:
+
+  - ``bits``   variants the allele definitely carries
+  - ``maybe``  those plus the variants it may carry (IUPAC codes in the
+               table, e.g. the many sub-allele sites of CYP2D6 *4)
+
+and, for every unordered allele pair, the variants that diplotype must
+and may show on one or both copies.  A sample's
+calls at the defining sites become the same kind of bit vectors, so
+scoring every candidate diplotype is a handful of vectorized XOR / AND /
+popcount operations.
+
+Candidates are ranked by
+
+  1. defining-site genotypes the diplotype does not explain, over the
+     called sites (phased calls are compared haplotype by haplotype);
+  2. the same count over sites that were not called (``./.`` or absent
+     from the VCF), measured against the default allele (``*1``), so a
+     silent site is read as wild-type rather than as the reference
+     sequence — CYP2C19 *1 differs from the GRCh38 (*38) sequence;
+  3. the lowest-numbered alleles.
+
+Samples with the same calls are scored once, which keeps cohort calling
+cheap; see ``bench_star_caller.py`` for CYP2D6 timings.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import cpic_tables
+from genotype_matrix import MISSING, PAD, _decode_call
+
+# Bump when the calling rules change; part of the knowledge-base version
+CALLER_VERSION = 2
+
+# Samples scored per vectorized block: (n_pairs, block, words) arrays
+_BLOCK = 8
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per row of a ``uint64`` array, summed over the last axis."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    as_bytes = words.view(np.uint8)
+    return _POPCOUNT8[as_bytes].sum(axis=-1, dtype=np.int32)
+
+
+def _pack(flags: np.ndarray) -> np.ndarray:
+    """Pack a (rows, n_bits) bool array into (rows, words) ``uint64``."""
+    n_words = max(1, (flags.shape[1] + 63) // 64)
+    padded = np.zeros((flags.shape[0], n_words * 64), dtype=bool)
+    padded[:, :flags.shape[1]] = flags
+    return np.packbits(padded, axis=1, bitorder="little").view(np.uint64)
+
+
+@dataclass(frozen=True)
+class StarCall:
+    """The best-scoring diplotype for one sample and gene."""
+    gene: str
+    allele1: str
+    allele2: str
+    mismatches: int        # called site genotypes the diplotype does not explain
+    phased: bool
+
+    @property
+    def diplotype(self) -> str:
+        return f"{self.allele1}/{self.allele2}"
+
+
+# (chrom, pos, ref, alts, rsid) of one VCF row
+Site = Tuple[str, int, str, Sequence[str], str]
+
+
+class StarAlleleCaller:
+    """
+    The compiled definition bitmatrix of one gene.  Build it with
+    :meth:`from_tables`; it is immutable and safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        gene: str,
+        variants: List[Tuple[str, int, str, str, str, str]],
+        alleles: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]],
+    ):
+        self.gene = gene
+        self.variants = variants
+        # The first row of the table is the reference sequence; *1 is the
+        # default for sites without a call (CYP2C19: *38 and *1 differ)
+        reference = next(iter(alleles))
+        default = "*1" if "*1" in alleles else reference
+        # Alleles with no SNV/indel definition (whole-gene deletions,
+        # duplications) look like the reference here and cannot be called
+        callable_ = [
+            name for name, (definite, ambiguous) in alleles.items()
+            if definite or ambiguous or name in (reference, default)
+        ]
+        self.alleles: Tuple[str, ...] = tuple(sorted(callable_, key=cpic_tables.allele_sort_key))
+        n_alleles, n_variants = len(self.alleles), len(variants)
+
+        bits = np.zeros((n_alleles, n_variants), dtype=bool)
+        maybe = np.zeros((n_alleles, n_variants), dtype=bool)
+        for i, name in enumerate(self.alleles):
+            definite, ambiguous = alleles[name]
+            bits[i, list(definite)] = True
+            maybe[i, list(definite) + list(ambiguous)] = True
+        self.bits = _pack(bits)            # definitely carried
+        self.maybe = _pack(maybe)          # carried or possibly carried
+        self.n_words = self.bits.shape[1]
+        self.default = self.bits[self.alleles.index(default)]
+
+        # Every unordered pair, lowest alleles first, with the variants it
+        # must show (het / hom / any) and may show (any / hom)
+        self.pair_i, self.pair_j = np.triu_indices(n_alleles)
+        a, b = self.bits[self.pair_i], self.bits[self.pair_j]
+        ma, mb = self.maybe[self.pair_i], self.maybe[self.pair_j]
+        self.pair_any = a | b
+        self.pair_hom = a & b
+        self.pair_may_any = ma | mb
+        self.pair_may_hom = ma & mb
+
+        # VCF row → variant number, by position or (other builds) by rsID
+        self._by_key: Dict[cpic_tables.PositionKey, int] = {}
+        self._by_rsid: Dict[str, List[int]] = {}
+        for vid, (chrom, pos, ref, alt, _, rsid) in enumerate(variants):
+            if ref:
+                self._by_key.setdefault((chrom, pos, ref, alt), vid)
+            else:
+                self._by_key.setdefault((chrom, pos - 1, "", ""), vid)
+                self._by_key.setdefault((chrom, pos, "", ""), vid)
+            if rsid:
+                self._by_rsid.setdefault(rsid, []).append(vid)
+
+    @classmethod
+    def from_tables(cls, tables: cpic_tables.CpicTables, gene: str) -> Optional["StarAlleleCaller"]:
+        """Compile *gene*'s definition table, or None without star alleles to call."""
+        variants, alleles = tables.get_allele_definitions(gene)
+        if len(alleles) < 2 or not variants:
+            return None
+        return cls(gene, variants, alleles)
+
+    # ── mapping VCF rows ──
+
+    def variant_id(self, chrom: str, pos: int, ref: str, alt: str, rsid: str = "") -> Optional[int]:
+        """Number of the defining variant *alt* at this row, if any."""
+        if chrom.startswith("chr"):
+            chrom = chrom[3:]
+        if len(ref) == 1 and len(alt) == 1:
+            vid = self._by_key.get((chrom, pos, ref, alt))
+        else:
+            vid = self._by_key.get((chrom, pos, "", ""))
+        if vid is not None:
+            return vid
+        # Fall back to the rsID (e.g. GRCh37 coordinates): the ALT must
+        # match unless the rsID defines a single variant
+        candidates: List[int] = []
+        for rs in rsid.split(";"):
+            candidates.extend(self._by_rsid.get(rs.strip(), ()))
+        for vid in candidates:
+            if self.variants[vid][3] == alt:
+                return vid
+        return candidates[0] if len(set(candidates)) == 1 else None
+
+    def row_variants(self, sites: Sequence[Site]) -> List[List[Tuple[int, int]]]:
+        """Per row, the (ALT index, variant number) pairs it reports."""
+        out = []
+        for chrom, pos, ref, alts, rsid in sites:
+            hits = []
+            for k, alt in enumerate(alts, start=1):
+                vid = self.variant_id(chrom, pos, ref, alt, rsid or "")
+                if vid is not None:
+                    hits.append((k, vid))
+            out.append(hits)
+        return out
+
+    # ── calling ──
+
+    def call(
+        self, sites: Sequence[Site], genotypes: Sequence[str],
+        row_variants: Optional[List[List[Tuple[int, int]]]] = None,
+    ) -> StarCall:
+        """Call one sample from its GT strings at *sites*."""
+        decoded = [_decode_call(gt) for gt in genotypes]
+        ploidy = max((len(a) for a, _ in decoded), default=2)
+        alleles = np.full((len(decoded), 1, max(ploidy, 2)), PAD, dtype=np.int8)
+        phased = np.zeros((len(decoded), 1), dtype=bool)
+        for r, (a, p) in enumerate(decoded):
+            alleles[r, 0, :len(a)] = a
+            phased[r, 0] = p
+        return self.call_many(sites, alleles, phased, row_variants)[0]
+
+    def call_many(
+        self, sites: Sequence[Site], alleles: np.ndarray, phased: np.ndarray,
+        row_variants: Optional[List[List[Tuple[int, int]]]] = None,
+    ) -> List[StarCall]:
+        """
+        Call every sample of a genotype block: *alleles* is int8
+        (n_rows, n_samples, ploidy) as in :class:`GenotypeMatrix`, *phased*
+        bool (n_rows, n_samples).  Rows that are not defining sites are
+        ignored; pass :meth:`row_variants` of *sites* if already computed.
+        A haploid call (``PAD`` second copy) has no second copy, so a
+        hemizygous ALT counts once, like a heterozygous one.
+        """
+        if alleles.shape[2] < 2:
+            pad = np.full(alleles.shape[:2] + (2 - alleles.shape[2],), PAD, dtype=alleles.dtype)
+            alleles = np.concatenate([alleles, pad], axis=2)
+        n_samples = alleles.shape[1]
+        n_variants = len(self.variants)
+        if row_variants is None:
+            row_variants = self.row_variants(sites)
+
+        uncalled = np.zeros((n_samples, n_variants), dtype=bool)
+        observed = np.zeros((n_samples, n_variants), dtype=bool)
+        hap_a = np.zeros((n_samples, n_variants), dtype=bool)
+        hap_b = np.zeros((n_samples, n_variants), dtype=bool)
+        all_phased = np.ones(n_samples, dtype=bool)
+        for r, hits in enumerate(row_variants):
+            if not hits:
+                continue
+            first, second = alleles[r, :, 0], alleles[r, :, 1]
+            missing = (first == MISSING) | (second == MISSING)
+            # A haploid call has nothing to phase
+            het = (first != second) & ~missing & (second != PAD)
+            all_phased &= phased[r] | ~het
+            for k, vid in hits:
+                observed[:, vid] = True
+                uncalled[:, vid] |= missing
+                hap_a[:, vid] |= (first == k)
+                hap_b[:, vid] |= (second == k)
+        # A site never reported is treated as not called
+        uncalled |= ~observed
+
+        het = hap_a ^ hap_b
+        hom = hap_a & hap_b
+        packed = np.hstack([_pack(x) for x in (het, hom, ~uncalled, hap_a, hap_b)])
+        keys = np.hstack([packed.view(np.uint8), all_phased[:, None].astype(np.uint8)])
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        w = self.n_words
+        u = unique[:, :-1].copy().view(np.uint64)
+        u_phased = unique[:, -1].astype(bool)
+        best = np.empty(len(unique), dtype=np.int64)
+        misses = np.empty(len(unique), dtype=np.int32)
+        for start in range(0, len(unique), _BLOCK):
+            block = slice(start, start + _BLOCK)
+            best[block], misses[block] = self._score(
+                u[block, 0:w], u[block, w:2 * w], u[block, 2 * w:3 * w],
+                u[block, 3 * w:4 * w], u[block, 4 * w:5 * w], u_phased[block],
+            )
+
+        calls = []
+        for s in np.asarray(inverse).reshape(-1).tolist():
+            pair = best[s]
+            calls.append(StarCall(
+                gene=self.gene,
+                allele1=self.alleles[self.pair_i[pair]],
+                allele2=self.alleles[self.pair_j[pair]],
+                mismatches=int(misses[s]),
+                phased=bool(u_phased[s]),
+            ))
+        return calls
+
+    def _score(self, het, hom, called, hap_a, hap_b, phased) -> Tuple[np.ndarray, np.ndarray]:
+        """Best pair index and its mismatch count for each of a block of samples."""
+        ref = called & ~het & ~hom
+        miss = _popcount(
+            (hom[None] & ~self.pair_may_hom[:, None, :])          # hom, but a copy lacks it
+            | (het[None] & (self.pair_hom[:, None, :] | ~self.pair_may_any[:, None, :]))
+            | (ref[None] & self.pair_any[:, None, :])               # absent, but required
+        )                                                           # (n_pairs, n_block)
+
+        if phased.any():
+            bits, maybe = self.bits[:, None, :], self.maybe[:, None, :]
+            cost_a = _popcount(called[None] & ((hap_a[None] & ~maybe) | (~hap_a[None] & bits)))
+            cost_b = _popcount(called[None] & ((hap_b[None] & ~maybe) | (~hap_b[None] & bits)))
+            i, j = self.pair_i, self.pair_j
+            by_hap = np.minimum(cost_a[i] + cost_b[j], cost_a[j] + cost_b[i])
+            miss = np.where(phased[None, :], by_hap, miss)
+
+        # Uncalled sites, measured against the default allele
+        fixed = self.bits[:, None, :] | ~self.maybe[:, None, :]
+        guess = _popcount((self.bits[:, None, :] ^ self.default) & fixed & ~called[None])
+        guess = guess[self.pair_i] + guess[self.pair_j]
+
+        rank = miss.astype(np.int64) * (len(self.variants) * 2 + 1) + guess
+        best = rank.argmin(axis=0)
+        return best, miss[best, np.arange(miss.shape[1])]
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(BACKEND, "data")
+
+# The backend modules are imported as top-level modules, as app.py does
+sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture(autouse=True)
+def _no_llm(monkeypatch):
+    """Keep tests offline: template explanations, no persistent LLM cache."""
+    for var in ("GROQ_API_KEY", "OPENAI_API_KEY", "LLM_API_KEY"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("LLM_CACHE_DB", "")
@@ -0,0 +1,72 @@
+import os
+import threading
+
+import analyzer
+import pgx_knowledgebase
+from conftest import DATA
+from pgx_knowledgebase import POOR
+
+
+def _jobs(drugs):
+    kb = pgx_knowledgebase.current()
+    jobs = []
+    for drug in drugs:
+        gene = kb.get_genes_for_drug(drug)[0]
+        jobs.append((drug, kb.lookup_interaction(drug, gene, POOR), POOR, []))
+    return jobs
+
+
+def test_a_failing_explanation_call_only_loses_its_own_result(monkeypatch, capsys):
+    monkeypatch.setenv("LLM_API_KEY", "test")
+
+    def post(drug, url, body, key, api_key, timeout):
+        if drug == "warfarin":
+            raise RuntimeError("boom")
+        return f"explained {drug}"
+
+    monkeypatch.setattr(analyzer, "_post_explanation", post)
+    jobs = _jobs(["codeine", "warfarin", "clopidogrel"])
+    assert analyzer._generate_llm_explanations(jobs) == ["explained codeine", None, "explained clopidogrel"]
+    assert "Explanation for warfarin failed: RuntimeError: boom" in capsys.readouterr().out
+
+
+def test_missed_deadline_cancels_queued_calls(monkeypatch):
+    monkeypatch.setenv("LLM_API_KEY", "test")
+    release = threading.Event()
+    started = []
+
+    def post(drug, url, body, key, api_key, timeout):
+        started.append(drug)
+        release.wait(5)
+        return drug
+
+    monkeypatch.setattr(analyzer, "_post_explanation", post)
+    monkeypatch.setattr(analyzer, "_llm_pool", None)
+    monkeypatch.setattr(analyzer, "LLM_MAX_CONCURRENCY", 1)
+    drugs = ["codeine", "warfarin", "clopidogrel", "simvastatin"]
+    explanations = analyzer._iter_llm_explanations(_jobs(drugs), deadline=0.2)
+    assert list(explanations) == []             # nothing back within the deadline
+    release.set()
+    pool = analyzer._llm_pool
+    pool.shutdown(wait=True)
+    # only the call that was already running went out
+    assert started == ["codeine"]
+
+
+def test_cohort_matches_single_sample_analysis():
+    vcf = os.path.join(DATA, "100samples.vcf.bgz")
+    drugs = pgx_knowledgebase.current().known_drugs
+
+    def report(result):
+        d = result.to_dict()
+        return d["genes"], [{k: v for k, v in e.items() if k not in ("timestamp", "quality_metrics")}
+                            for e in d["results"]]
+
+    cohort = list(analyzer.analyze_cohort(vcf, drugs))
+    assert len(cohort) == 100
+    for result in cohort[::17]:
+        assert report(result) == report(analyzer.analyze_stream(vcf, drugs, sample=result.patient_id))
+
+    picked = [cohort[5].patient_id, cohort[1].patient_id]
+    # results come back in file order
+    assert [r.patient_id for r in analyzer.analyze_cohort(vcf, drugs, picked)] == picked[::-1]
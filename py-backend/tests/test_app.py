@@ -0,0 +1,327 @@
+import io
+import json
+import os
+import tempfile
+import time
+
+import pytest
+
+import analyzer
+from conftest import DATA
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    os.environ.setdefault("KB_PREWARM", "0")
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "result_cache", app_module.ResultCache(0))
+    return app_module.app.test_client()
+
+
+def _vcf(name="pharmcat.example.vcf"):
+    with open(os.path.join(DATA, name), "rb") as fh:
+        return fh.read()
+
+
+def _post(client, data, drugs="codeine,clopidogrel,warfarin", path="/analyze", **extra):
+    form = {"vcf_file": (io.BytesIO(data), "upload.vcf"), "drugs": drugs, **extra}
+    return client.post(path, data=form, content_type="multipart/form-data")
+
+
+def _stable(report):
+    """A report without its timings and timestamps."""
+    report = dict(report)
+    for key in ("timestamp", "_parse_time_ms", "_cached"):
+        report.pop(key, None)
+    report["results"] = [
+        {k: v for k, v in entry.items() if k not in ("timestamp", "quality_metrics")}
+        for entry in report["results"]
+    ]
+    return report
+
+
+def test_parallel_parse_spools_upload(app_module, client, monkeypatch, tmp_path):
+    data = _vcf()
+    serial = _post(client, data)
+    assert serial.status_code == 200
+
+    monkeypatch.setattr(app_module, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(app_module, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    parallel = _post(client, data)
+    assert parallel.status_code == 200
+    assert _stable(parallel.get_json()) == _stable(serial.get_json())
+    assert list(tmp_path.iterdir()) == []          # spooled upload removed
+
+
+@pytest.fixture
+def cached_client(app_module, monkeypatch):
+    cache = app_module.ResultCache(16)
+    monkeypatch.setattr(app_module, "result_cache", cache)
+    return app_module.app.test_client(), cache
+
+
+def test_cache_hit_is_restamped(cached_client):
+    client, cache = cached_client
+    first = _post(client, _vcf()).get_json()
+    second = _post(client, _vcf()).get_json()
+    assert "_cached" not in first and second["_cached"] is True
+    assert second["timestamp"] > first["timestamp"]
+    assert {e["timestamp"] for e in second["results"]} == {second["timestamp"]}
+    assert _stable(second) == _stable(first)
+
+
+@pytest.fixture
+def llm_stub(monkeypatch):
+    from llm_stub import StubServer
+    with StubServer(fail_rate=1.0, status=400) as stub:
+        monkeypatch.setenv("LLM_API_KEY", "stub")
+        monkeypatch.setenv("LLM_BASE_URL", stub.base_url)
+        yield stub
+
+
+def test_template_reports_are_not_served_once_llm_is_configured(cached_client, monkeypatch):
+    client, cache = cached_client
+    _post(client, _vcf())                                   # no key: template report, cached
+    assert cache.stats()["entries"] == 1
+
+    from llm_stub import StubServer
+    with StubServer() as stub:
+        monkeypatch.setenv("LLM_API_KEY", "stub")
+        monkeypatch.setenv("LLM_BASE_URL", stub.base_url)
+        report = _post(client, _vcf()).get_json()
+    assert "_cached" not in report
+    texts = [e["llm_generated_explanation"]["summary"] for e in report["results"]]
+    assert any(t.startswith("Stub completion") for t in texts)
+
+
+def test_reports_with_llm_fallbacks_are_not_cached(cached_client, llm_stub):
+    client, cache = cached_client
+    report = _post(client, _vcf()).get_json()               # every LLM call rejected
+    assert not any(e["llm_generated_explanation"]["summary"].startswith("Stub completion")
+                   for e in report["results"])
+    assert cache.stats()["entries"] == 0
+
+    llm_stub.fail_rate = 0.0                                 # provider back
+    assert "_cached" not in _post(client, _vcf()).get_json()
+    assert cache.stats()["entries"] == 1
+    assert _post(client, _vcf()).get_json()["_cached"] is True
+
+
+def _ndjson(resp):
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+def test_cohort_streams_one_line_per_sample(client):
+    data = _vcf("100samples.vcf.bgz")
+    expected = {r.patient_id: r.to_dict() for r in analyzer.analyze_cohort(data, ["codeine", "warfarin"])}
+    resp = _post(client, data, drugs="codeine,warfarin", path="/analyze/cohort")
+    assert resp.status_code == 200 and resp.mimetype == "application/x-ndjson"
+    lines = _ndjson(resp)
+    assert [line["patient_id"] for line in lines] == list(expected)
+    for line in lines:
+        assert _stable(line) == _stable(expected[line["patient_id"]])
+
+    picked = list(expected)[3:1:-1]
+    lines = _ndjson(_post(client, data, drugs="codeine", path="/analyze/cohort", samples=",".join(picked)))
+    assert sorted(line["patient_id"] for line in lines) == sorted(picked)
+
+
+def test_cohort_failure_ends_the_stream_with_an_error_line(client, monkeypatch):
+    assess = analyzer._assess
+
+    def flaky(patient_id, *args, **kwargs):
+        if flaky.calls == 2:
+            raise RuntimeError("boom")
+        flaky.calls += 1
+        return assess(patient_id, *args, **kwargs)
+
+    flaky.calls = 0
+    monkeypatch.setattr(analyzer, "_assess", flaky)
+    resp = _post(client, _vcf("100samples.vcf.bgz"), drugs="codeine", path="/analyze/cohort")
+    assert resp.status_code == 200
+    lines = _ndjson(resp)
+    assert len(lines) == 3
+    assert all("error" not in line for line in lines[:2])
+    assert lines[2] == {"error": "Analysis failed: boom"}
+
+
+def test_cohort_rejects_bad_input(client):
+    assert _post(client, _vcf(), drugs=" ", path="/analyze/cohort").status_code == 400
+    resp = _post(client, b"##fileformat=VCFv4.2\n#CHROM\tPOS\xff\n", path="/analyze/cohort")
+    assert resp.status_code == 400 and resp.get_json()["error"].startswith("Failed to parse VCF file")
+
+
+def test_cache_resolves_synonyms_and_keeps_drug_order(cached_client):
+    client, cache = cached_client
+    first = _post(client, _vcf(), drugs="warfarin,codeine").get_json()
+    synonym = _post(client, _vcf(), drugs="Coumadin, codeine").get_json()
+    assert synonym["_cached"] is True and _stable(synonym) == _stable(first)
+
+    reordered = _post(client, _vcf(), drugs="codeine,warfarin").get_json()
+    assert "_cached" not in reordered
+    assert [e["drug"] for e in reordered["results"]] == ["codeine", "warfarin"]
+
+    repeated = _post(client, _vcf(), drugs="warfarin,warfarin").get_json()
+    assert "_cached" not in repeated
+    assert [e["drug"] for e in repeated["results"]] == ["warfarin", "warfarin"]
+    assert cache.stats()["entries"] == 3
+
+
+@pytest.fixture
+def jobs_app(app_module, monkeypatch, tmp_path):
+    """The app with a fresh memory job store and runner, spooling into *tmp_path*."""
+    import jobs
+    monkeypatch.setattr(app_module, "_job_store", jobs.MemoryJobStore())
+    monkeypatch.setattr(app_module, "_job_runner", None)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    return app_module
+
+
+def _poll(client, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_async_analysis_spools_the_upload(jobs_app, client, tmp_path):
+    sync = _post(client, _vcf()).get_json()
+    resp = _post(client, _vcf(), **{"async": "true"})
+    assert resp.status_code == 202
+    job = _poll(client, resp.get_json()["jobId"])
+    assert job["status"] == "done"
+    assert _stable(job["result"]) == _stable(sync)
+    assert list(tmp_path.iterdir()) == []          # spooled upload removed
+
+    failed = _post(client, b"##fileformat=VCFv4.2\n#CHROM\tPOS\xff\n", **{"async": "true"})
+    job = _poll(client, failed.get_json()["jobId"])
+    assert job["status"] == "failed" and job["error"].startswith("Failed to parse VCF file")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_polling_reads_the_store_without_starting_workers(jobs_app, client):
+    assert client.get("/jobs/nope").status_code == 404
+    jobs_app._job_store.create({"id": "j1", "kind": "analyze", "status": "queued", "attempts": 0,
+                                         "createdAt": "", "updatedAt": "", "result": None, "error": None})
+    assert client.get("/jobs/j1").get_json()["status"] == "queued"
+    assert jobs_app._job_runner is None
+
+
+def test_async_is_refused_without_a_shared_store(jobs_app, client, monkeypatch):
+    monkeypatch.setattr(jobs_app, "ASYNC_JOBS", False)
+    resp = _post(client, _vcf(), **{"async": "true"})
+    assert resp.status_code == 503 and "JOB_STORE" in resp.get_json()["error"]
+    assert jobs_app._job_runner is None
+    assert _post(client, _vcf()).status_code == 200
+
+
+def _events(resp):
+    """``[(event, data), ...]`` of a server-sent-event response."""
+    events = []
+    for block in resp.get_data(as_text=True).split("\n\n"):
+        if block.strip():
+            fields = dict(line.split(": ", 1) for line in block.splitlines())
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def _assembled(events):
+    """The /analyze report the events of a stream add up to."""
+    genes = events[0][1]
+    results = {}
+    for event, data in events:
+        if event in ("result", "explanation"):
+            results[data["index"]] = {k: v for k, v in data.items() if k != "index"}
+    return {
+        "patient_id": genes["patient_id"],
+        "timestamp": genes["timestamp"],
+        "results": [results[i] for i in sorted(results)],
+        "genes": genes["genes"],
+        "summary": events[-1][1],
+    }
+
+
+def test_stream_events_add_up_to_the_report(cached_client):
+    client, cache = cached_client
+    drugs = "codeine,clopidogrel,warfarin"
+    resp = _post(client, _vcf(), drugs=drugs, path="/analyze/stream")
+    assert resp.status_code == 200 and resp.mimetype == "text/event-stream"
+    events = _events(resp)
+    assert [e for e, _ in events] == ["genes"] + ["result"] * 3 + ["summary"]
+    assert [d["index"] for e, d in events if e == "result"] == [0, 1, 2]
+    assert "llm_explanation" in events[-1][1]
+
+    # the finished report was cached, and /analyze serves it
+    assert cache.stats()["entries"] == 1
+    report = _post(client, _vcf(), drugs=drugs).get_json()
+    assert report["_cached"] is True
+    assert _stable(_assembled(events)) == _stable(report)
+
+    # a cached report is replayed as the same events
+    replay = _events(_post(client, _vcf(), drugs=drugs, path="/analyze/stream"))
+    assert [e for e, _ in replay] == [e for e, _ in events]
+    assert replay[0][1]["_cached"] is True
+    assert _stable(_assembled(replay)) == _stable(report)
+
+
+def test_stream_sends_llm_explanations_as_they_arrive(cached_client, llm_stub):
+    client, cache = cached_client
+    llm_stub.fail_rate = 0.0
+    events = _events(_post(client, _vcf(), drugs="codeine,warfarin", path="/analyze/stream"))
+    names = [e for e, _ in events]
+    assert names[:3] == ["genes", "result", "result"] and names[-1] == "summary"
+    explained = [d for e, d in events if e == "explanation"]
+    assert sorted(d["index"] for d in explained) == [0, 1]
+    assert all(d["llm_generated_explanation"]["summary"].startswith("Stub completion") for d in explained)
+    assert cache.stats()["entries"] == 1
+
+
+def test_stream_failure_ends_with_an_error_event(cached_client, monkeypatch):
+    client, cache = cached_client
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(analyzer, "_assess_drugs", broken)
+    resp = _post(client, _vcf(), path="/analyze/stream")
+    assert resp.status_code == 200
+    events = _events(resp)
+    assert [e for e, _ in events] == ["genes", "error"]
+    assert events[-1][1] == {"error": "Analysis failed: boom"}
+    assert cache.stats()["entries"] == 0
+
+    resp = _post(client, b"##fileformat=VCFv4.2\n#CHROM\tPOS\xff\n", path="/analyze/stream")
+    assert resp.status_code == 400 and resp.get_json()["error"].startswith("Failed to parse VCF file")
+
+
+def test_kb_reload_needs_the_admin_token(app_module, client, monkeypatch):
+    import pgx_knowledgebase
+    calls = []
+    monkeypatch.setattr(pgx_knowledgebase, "reload_async", lambda force=False: calls.append(force) or True)
+
+    # no token configured: admin routes are closed
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "")
+    assert client.post("/admin/kb/reload").status_code == 403
+    assert client.post("/admin/kb/reload", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "s3cret")
+    for headers in ({}, {"X-Admin-Token": "wrong"}, {"X-Admin-Token": "s3cret "}):
+        assert client.post("/admin/kb/reload", headers=headers).status_code == 403
+        assert client.get("/admin/kb", headers=headers).status_code == 403
+    assert calls == []
+
+    ok = {"X-Admin-Token": "s3cret"}
+    resp = client.post("/admin/kb/reload?force=1", headers=ok)
+    assert resp.status_code == 202 and resp.get_json()["started"] is True
+    assert client.post("/admin/kb/reload", headers=ok).status_code == 202
+    assert calls == [True, False]
+    status = client.get("/admin/kb", headers=ok).get_json()
+    assert status["version"] == pgx_knowledgebase.current().version
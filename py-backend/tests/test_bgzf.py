@@ -0,0 +1,140 @@
+import os
+import shutil
+
+import pytest
+
+import bgzf
+from analyzer import analyze_regions, analyze_stream
+from conftest import DATA
+
+VCF = os.path.join(DATA, "100samples.vcf.bgz")
+
+
+@pytest.fixture
+def vcf(tmp_path):
+    """The cohort file in a temp dir, so indexes written next to it are discarded."""
+    path = tmp_path / "cohort.vcf.bgz"
+    shutil.copy(VCF, path)
+    return str(path)
+
+
+def _records(path):
+    """(chrom, 0-based beg, end, line, voffset) for every record, by linear scan."""
+    out = []
+    with bgzf.BgzfReader(path) as reader:
+        while True:
+            voffset = reader.tell()
+            line = reader.readline()
+            if not line:
+                return out
+            line = line.rstrip(b"\r\n")
+            if line and line[:1] != b"#":
+                chrom, pos, _, ref = line.split(b"\t", 4)[:4]
+                beg = int(pos) - 1
+                out.append((chrom.decode(), beg, beg + max(len(ref), 1), line, voffset))
+
+
+def _scan(records, chrom, start, end):
+    return [r[3] for r in records if r[0] == chrom and r[1] < end and r[2] > start - 1]
+
+
+def _fetch(path, index, chrom, start, end):
+    with bgzf.BgzfReader(path) as reader:
+        return list(bgzf.fetch_lines(reader, index, chrom, start, end))
+
+
+def _regions(records):
+    """Windows around every record plus each contig's full span."""
+    regions = []
+    for chrom, beg, end, _, _ in records[::7]:
+        regions.append((chrom, max(1, beg - 5000), end + 5000))
+        regions.append((chrom, beg + 1, beg + 1))
+    for chrom in {r[0] for r in records}:
+        regions.append((chrom, 1, 300_000_000))
+    return regions
+
+
+@pytest.mark.parametrize("csi", [False, True])
+def test_index_round_trip_matches_linear_scan(vcf, csi):
+    if csi:
+        built = bgzf.build_index(vcf, csi=True, min_shift=12, depth=6)
+        bgzf.write_csi(built, vcf + ".csi")
+    else:
+        built = bgzf.build_index(vcf)
+        bgzf.write_tbi(built, vcf + ".tbi")
+
+    loaded = bgzf.load_index(vcf)
+    assert loaded.is_csi == csi
+    assert (loaded.min_shift, loaded.depth) == ((12, 6) if csi else (14, 5))
+    assert loaded.names == built.names
+    for a, b in zip(loaded.refs, built.refs):
+        assert a.bins == b.bins
+        assert a.linear == b.linear
+        assert a.loffsets == b.loffsets
+        assert a.n_mapped == b.n_mapped
+
+    records = _records(vcf)
+    assert loaded.record_count == len(records)
+    for chrom, start, end in _regions(records):
+        assert _fetch(vcf, loaded, chrom, start, end) == _scan(records, chrom, start, end), (chrom, start, end)
+
+
+@pytest.mark.parametrize("csi", [False, True])
+def test_region_across_block_boundary(vcf, csi):
+    index = bgzf.build_index(vcf, csi=csi, min_shift=12 if csi else 14, depth=6 if csi else 5)
+    records = _records(vcf)
+    # Two neighbouring records on one contig that sit in different BGZF blocks
+    pairs = [
+        (a, b) for a, b in zip(records, records[1:])
+        if a[0] == b[0] and bgzf.split_voffset(a[4])[0] != bgzf.split_voffset(b[4])[0]
+    ]
+    assert pairs
+    for a, b in pairs:
+        got = _fetch(vcf, index, a[0], a[1] + 1, b[1] + 1)
+        assert got == _scan(records, a[0], a[1] + 1, b[1] + 1)
+        assert a[3] in got and b[3] in got
+
+
+def test_unknown_contig_and_empty_region(vcf):
+    index = bgzf.build_index(vcf)
+    assert _fetch(vcf, index, "chrUn_KI270302v1", 1, 1000) == []
+    assert _fetch(vcf, index, "chr22", 1, 10) == []
+    # "chr" prefix is optional
+    assert _fetch(vcf, index, "22", 1, 300_000_000) == _fetch(vcf, index, "chr22", 1, 300_000_000)
+
+
+def test_tabix_rejects_custom_binning(vcf):
+    with pytest.raises(ValueError):
+        bgzf.build_index(vcf, min_shift=12)
+
+
+def test_writer_round_trip(tmp_path):
+    data = b"".join(b"line %d\n" % i for i in range(50_000))      # several blocks
+    path = tmp_path / "lines.bgz"
+    writer = bgzf.BgzfWriter(path)
+    writer.write(data)
+    writer.close()
+    assert bgzf.is_bgzf(path)
+    with open(path, "rb") as fh:
+        assert len(bgzf.block_offsets(fh)) > 2
+    with bgzf.BgzfReader(str(path)) as reader:
+        assert b"".join(reader) == data
+
+
+def _comparable(result):
+    d = result.to_dict()
+    for entry in d["results"]:
+        entry.pop("timestamp")
+        entry.pop("quality_metrics")
+    return d["genes"], d["results"], d["summary"]
+
+
+def test_analyze_regions_matches_analyze_stream(vcf):
+    with bgzf.BgzfReader(vcf) as reader:
+        samples = next(l for l in reader if l.startswith(b"#CHROM")).decode().split("\t")[9:]
+    drugs = ["codeine", "clopidogrel", "warfarin", "simvastatin", "fluorouracil", "azathioprine"]
+    for sample in samples[:20]:
+        regions = analyze_regions(vcf, drugs, sample)
+        stream = analyze_stream(vcf, drugs, sample)
+        assert _comparable(regions) == _comparable(stream), sample
+    assert os.path.exists(vcf + ".tbi")
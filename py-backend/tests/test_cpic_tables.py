@@ -0,0 +1,37 @@
+import os
+import shutil
+
+import pytest
+
+import cpic_tables
+from conftest import DATA
+
+
+@pytest.fixture
+def tables_dir(tmp_path, monkeypatch):
+    """A copy of data/tables that the module reads instead."""
+    path = tmp_path / "tables"
+    shutil.copytree(os.path.join(DATA, "tables"), path, ignore=shutil.ignore_patterns(".snapshot"))
+    monkeypatch.setattr(cpic_tables, "_DATA_DIR", path)
+    monkeypatch.setattr(cpic_tables, "_SNAPSHOT_DIR", path / ".snapshot")
+    return path
+
+
+def test_signature_follows_content_not_mtimes(tables_dir):
+    original = cpic_tables.tables_signature()
+    assert original
+
+    # Same content on another host or checkout: new mtimes, same version
+    workbook = next(tables_dir.glob("*.xlsx"))
+    os.utime(workbook, (1_000_000_000, 1_000_000_000))
+    assert cpic_tables.tables_signature() == original
+
+    workbook.write_bytes(workbook.read_bytes() + b"\0")
+    changed = cpic_tables.tables_signature()
+    assert changed != original
+
+
+def test_copied_tables_keep_the_version(tables_dir, monkeypatch):
+    copied = cpic_tables.CpicTables.discover().version
+    monkeypatch.setattr(cpic_tables, "_DATA_DIR", cpic_tables.Path(DATA) / "tables")
+    assert cpic_tables.tables_signature() == copied
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobFailed, JobRunner, MemoryJobStore, QueueFull, SqliteJobStore
+
+
+class _Recording:
+    """A store that also records every status a job passes through."""
+
+    def __init__(self, store):
+        self.store = store
+        self.name = store.name
+        self.statuses = {}
+
+    def create(self, job):
+        self.statuses.setdefault(job["id"], []).append(job["status"])
+        self.store.create(job)
+
+    def update(self, job_id, **fields):
+        if "status" in fields:
+            self.statuses.setdefault(job_id, []).append(fields["status"])
+        self.store.update(job_id, **fields)
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def purge(self, older_than):
+        self.store.purge(older_than)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return _Recording(MemoryJobStore())
+    return _Recording(SqliteJobStore(str(tmp_path / "jobs.sqlite")))
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _wait_status(runner, job_id, status):
+    _wait(lambda: (runner.get(job_id) or {}).get("status") == status)
+    return runner.get(job_id)
+
+
+def test_job_runs_to_done(store):
+    runner = JobRunner(store, workers=2)
+    job_id = runner.submit("analyze", lambda: {"ok": 1})
+    job = _wait_status(runner, job_id, DONE)
+    assert job["result"] == {"ok": 1} and job["error"] is None and job["attempts"] == 1
+    assert job["kind"] == "analyze"
+    assert store.statuses[job_id] == [QUEUED, RUNNING, DONE]
+    assert runner.get("nope") is None
+
+
+def test_failed_attempts_are_retried_with_backoff(store):
+    runner = JobRunner(store, workers=1, max_attempts=3, backoff=0.1)
+    started = []
+
+    def flaky():
+        started.append(time.monotonic())
+        if len(started) < 3:
+            raise RuntimeError(f"attempt {len(started)}")
+        return "third time"
+
+    job_id = runner.submit("analyze", flaky)
+    job = _wait_status(runner, job_id, DONE)
+    assert job["result"] == "third time" and job["attempts"] == 3 and job["error"] is None
+    assert store.statuses[job_id] == [QUEUED, RUNNING, QUEUED, RUNNING, QUEUED, RUNNING, DONE]
+    # exponential backoff: 0.1s, then 0.2s
+    assert started[1] - started[0] >= 0.1
+    assert started[2] - started[1] >= 0.2
+
+
+def test_gives_up_after_max_attempts(store):
+    runner = JobRunner(store, workers=1, max_attempts=2, backoff=0.01)
+
+    def broken():
+        raise ValueError("bad")
+
+    job_id = runner.submit("analyze", broken)
+    job = _wait_status(runner, job_id, FAILED)
+    assert job["attempts"] == 2 and job["error"] == "ValueError: bad" and job["result"] is None
+    assert store.statuses[job_id] == [QUEUED, RUNNING, QUEUED, RUNNING, FAILED]
+
+
+def test_job_failed_is_not_retried(store):
+    runner = JobRunner(store, workers=1, max_attempts=3, backoff=0.01)
+    calls = []
+
+    def rejected():
+        calls.append(1)
+        raise JobFailed("Invalid VCF")
+
+    job_id = runner.submit("analyze", rejected)
+    job = _wait_status(runner, job_id, FAILED)
+    time.sleep(0.05)
+    assert job["error"] == "Invalid VCF" and job["attempts"] == 1 and calls == [1]
+    assert store.statuses[job_id] == [QUEUED, RUNNING, FAILED]
+
+
+def test_queue_full_on_submit_and_on_requeue(store):
+    runner = JobRunner(store, workers=1, max_queue=1, max_attempts=3, backoff=0.3)
+    release = threading.Event()
+
+    def fail_once():
+        raise RuntimeError("transient")
+
+    def block():
+        release.wait(10)
+        return "released"
+
+    retried = runner.submit("a", fail_once)
+    _wait(lambda: store.statuses[retried] == [QUEUED, RUNNING, QUEUED])
+
+    # occupy the only worker and fill the queue before the retry is due
+    blocker = runner.submit("b", block)
+    _wait_status(runner, blocker, RUNNING)
+    waiting = runner.submit("c", lambda: "c")
+    with pytest.raises(QueueFull):
+        runner.submit("d", lambda: "d")
+
+    job = _wait_status(runner, retried, FAILED)
+    assert job["error"] == "Job queue is full (retry dropped)" and job["attempts"] == 1
+
+    release.set()
+    assert _wait_status(runner, blocker, DONE)["result"] == "released"
+    assert _wait_status(runner, waiting, DONE)["result"] == "c"
+    assert runner.stats()["submitted"] == 3
+
+
+def test_purge_drops_only_old_finished_jobs(store):
+    runner = JobRunner(store, workers=1)
+    release = threading.Event()
+    done = runner.submit("a", lambda: 1)
+    _wait_status(runner, done, DONE)
+    running = runner.submit("b", lambda: release.wait(10))
+    _wait_status(runner, running, RUNNING)
+    recorded = runner.record("cached", {"hit": True})
+    assert runner.get(recorded)["status"] == DONE
+
+    store.purge(3600)
+    assert runner.get(done) is not None and runner.get(recorded) is not None
+    time.sleep(0.05)
+    store.purge(0.01)
+    assert runner.get(done) is None and runner.get(recorded) is None
+    assert runner.get(running)["status"] == RUNNING
+    release.set()
+
+
+def test_submit_purges_periodically(store, monkeypatch):
+    monkeypatch.setattr(jobs, "_PURGE_EVERY", 2)
+    runner = JobRunner(store, workers=1, retention=0.01)
+    first = runner.submit("a", lambda: 1)
+    _wait_status(runner, first, DONE)
+    time.sleep(0.05)
+    second = runner.submit("b", lambda: 2)
+    assert runner.get(first) is None
+    _wait_status(runner, second, DONE)
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    runner = JobRunner(SqliteJobStore(path), workers=1)
+    job_id = runner.submit("analyze", lambda: {"n": 1})
+    _wait_status(runner, job_id, DONE)
+    # another worker process polling the same file
+    assert SqliteJobStore(path).get(job_id)["result"] == {"n": 1}
+
+
+def test_cleanup_runs_once_the_job_ends(store):
+    runner = JobRunner(store, workers=1, max_attempts=2, backoff=0.01)
+    cleaned = []
+    attempts = []
+
+    def flaky():
+        attempts.append(len(cleaned))
+        raise RuntimeError("transient")
+
+    done = runner.submit("a", lambda: 1, cleanup=lambda: cleaned.append("done"))
+    _wait_status(runner, done, DONE)
+    failed = runner.submit("b", flaky, cleanup=lambda: cleaned.append("failed"))
+    _wait_status(runner, failed, FAILED)
+    _wait(lambda: len(cleaned) == 2)
+    # not cleaned up between attempts
+    assert attempts == [1, 1] and cleaned == ["done", "failed"]
+
+
+def test_cleanup_runs_when_the_queue_is_full(store):
+    runner = JobRunner(store, workers=1, max_queue=1)
+    release = threading.Event()
+    blocker = runner.submit("a", lambda: release.wait(10))
+    _wait_status(runner, blocker, RUNNING)
+    runner.submit("b", lambda: "b")
+    cleaned = []
+    with pytest.raises(QueueFull):
+        runner.submit("c", lambda: "c", cleanup=lambda: cleaned.append("c"))
+    assert cleaned == ["c"]
+    release.set()
@@ -0,0 +1,128 @@
+import json
+import marshal
+import struct
+import zlib
+
+import pytest
+
+import kb_store
+from kb_store import MappedTable, open_table, write_table
+
+
+def _keys_in_slot(slot, mask, count):
+    """The first *count* keys that hash to *slot* in a table of mask+1 slots."""
+    keys = []
+    i = 0
+    while len(keys) < count:
+        key = f"k{i}"
+        if zlib.crc32(key.encode("utf-8")) & mask == slot:
+            keys.append(key)
+        i += 1
+    return keys
+
+
+@pytest.fixture
+def table(tmp_path):
+    opened = []
+
+    def _open(items, meta=None):
+        path = str(tmp_path / f"t{len(opened)}.kb")
+        write_table(path, items, meta)
+        t = open_table(path)
+        assert t is not None
+        opened.append(t)
+        return t
+
+    yield _open
+    for t in opened:
+        t.close()
+
+
+def test_round_trip_values(table):
+    items = [("a", 1), ("b", ("x", None, 2.5)), ("ü", "ünïcode"), ("", [1, 2]), ("none", None)]
+    t = table(items, {"source": "test"})
+    assert dict(t) == dict(items)
+    assert t.meta["source"] == "test" and t.meta["marshal"] == marshal.version
+
+
+def test_collisions_wrap_around_the_last_slot(table):
+    # four items -> eight slots; all of them hash to the last slot
+    colliding = _keys_in_slot(7, 7, 4)
+    t = table([(k, i) for i, k in enumerate(colliding)])
+    assert t._n_slots == 8
+    for i, k in enumerate(colliding):
+        assert t[k] == i and k in t
+    # a missing key on the same chain walks the wrapped cluster to an empty slot
+    missing = _keys_in_slot(7, 7, 5)[-1]
+    assert missing not in t
+    with pytest.raises(KeyError):
+        t[missing]
+
+
+def test_missing_and_non_str_keys(table):
+    t = table([("CYP2D6", "gene")])
+    assert t.get("CYP2C19") is None
+    with pytest.raises(KeyError):
+        t["CYP2C19"]
+    for key in (1, None, b"CYP2D6", ("CYP2D6",)):
+        assert key not in t
+        with pytest.raises(KeyError):
+            t[key]
+
+
+def test_iter_len_and_empty_table(table):
+    items = [(f"key{i}", i * i) for i in range(100)]
+    t = table(items)
+    assert list(t) == [k for k, _ in items]
+    assert len(t) == 100 and t._n_slots == 256
+    assert list(t.items()) == items
+
+    empty = table([])
+    assert len(empty) == 0 and list(empty) == [] and "x" not in empty
+
+
+def test_duplicate_keys_keep_the_last_value(table):
+    t = table([("a", 1), ("b", 2), ("a", 3)])
+    assert len(t) == 2 and t["a"] == 3
+
+
+def test_open_table_rejects_damaged_files(tmp_path):
+    path = tmp_path / "t.kb"
+    write_table(str(path), [(f"key{i}", "v" * 50) for i in range(20)])
+    blob = path.read_bytes()
+
+    assert open_table(str(tmp_path / "missing.kb")) is None
+    for damaged in (
+        b"",                               # empty file
+        blob[:10],                         # short header
+        blob[:40],                         # inside the metadata
+        blob[:-1],                         # last record cut short
+        blob[:len(blob) // 2],             # inside the slots / records
+        blob + b"\0",                      # trailing garbage
+        b"NOTAKB\0\0" + blob[8:],          # wrong magic
+    ):
+        path.write_bytes(damaged)
+        assert open_table(str(path)) is None, len(damaged)
+        with pytest.raises((ValueError, struct.error)):
+            MappedTable(str(path)).close()
+
+
+def test_open_table_rejects_other_marshal_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "t.kb")
+    monkeypatch.setattr(kb_store.marshal, "version", marshal.version + 1)
+    write_table(path, [("a", 1)])
+    monkeypatch.undo()
+
+    t = MappedTable(path)
+    assert t.meta["marshal"] == marshal.version + 1
+    t.close()
+    assert open_table(path) is None
+
+
+def test_file_size_is_recorded(tmp_path):
+    path = tmp_path / "t.kb"
+    write_table(str(path), [("a", "x" * 1000)], {"pad": "y" * 300})
+    size = path.stat().st_size
+    _, meta_len, _, _ = struct.unpack_from("<8sIII", path.read_bytes())
+    meta = json.loads(path.read_bytes()[20:20 + meta_len])
+    assert meta["file_size"] == size
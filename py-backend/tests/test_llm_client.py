@@ -0,0 +1,158 @@
+import time
+
+import httpx
+import pytest
+
+from llm_client import CircuitOpenError, LLMClient, LLMError
+from llm_stub import StubServer
+
+BODY = {"model": "stub", "messages": [{"role": "user", "content": "hello"}]}
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def _make(**kwargs):
+        kwargs = {"retries": 2, "backoff": 0.01, "breaker_failures": 3, "breaker_cooldown": 0.2, **kwargs}
+        c = LLMClient(**kwargs)
+        clients.append(c)
+        return c
+
+    yield _make
+    for c in clients:
+        c.close()
+
+
+def _url(stub):
+    return f"{stub.base_url}/chat/completions"
+
+
+def test_retries_outages_then_succeeds(make_client):
+    client = make_client()
+    with StubServer(fail_first=2, status=503) as stub:
+        assert client.complete(_url(stub), BODY, "k", kind="test").startswith("Stub completion")
+        assert stub.requests == 3
+    calls = client.stats()["calls"]["test"]
+    assert (calls["calls"], calls["ok"], calls["failed"], calls["retries"]) == (1, 1, 0, 2)
+    assert client.stats()["consecutiveFailures"] == 0
+
+
+def test_gives_up_after_the_last_retry(make_client):
+    client = make_client(retries=1)
+    with StubServer(fail_rate=1.0, status=502) as stub:
+        with pytest.raises(LLMError, match="HTTP 502"):
+            client.complete(_url(stub), BODY, "k")
+        assert stub.requests == 2
+    assert client.stats()["consecutiveFailures"] == 1
+
+
+def test_retry_after_is_honoured(make_client):
+    client = make_client(retries=1)
+    with StubServer(fail_first=1, status=429, retry_after=0.3) as stub:
+        t0 = time.monotonic()
+        client.complete(_url(stub), BODY, "k")
+        assert time.monotonic() - t0 >= 0.3
+        assert stub.requests == 2
+
+
+def test_retry_after_past_the_deadline_fails_at_once(make_client):
+    client = make_client(retries=3)
+    with StubServer(fail_rate=1.0, status=429, retry_after=30) as stub:
+        t0 = time.monotonic()
+        with pytest.raises(LLMError, match="HTTP 429"):
+            client.complete(_url(stub), BODY, "k", timeout=1.0)
+        assert time.monotonic() - t0 < 1.0
+        assert stub.requests == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker(make_client):
+    client = make_client()
+    with StubServer(fail_rate=1.0, status=401) as stub:
+        for _ in range(5):
+            with pytest.raises(LLMError, match="HTTP 401"):
+                client.complete(_url(stub), BODY, "k")
+        assert stub.requests == 5
+    assert client.state == "closed"
+    assert client.stats()["consecutiveFailures"] == 0
+
+
+def test_breaker_opens_half_opens_and_closes(make_client):
+    client = make_client(retries=0)
+    with StubServer(fail_rate=1.0, status=503) as stub:
+        for _ in range(3):
+            with pytest.raises(LLMError):
+                client.complete(_url(stub), BODY, "k", kind="test")
+        assert client.state == "open"
+
+        # open: calls fail without reaching the provider
+        with pytest.raises(CircuitOpenError):
+            client.complete(_url(stub), BODY, "k", kind="test")
+        assert stub.requests == 3
+        assert client.stats()["calls"]["test"]["fastFailed"] == 1
+
+        # half-open: the failed probe re-opens the breaker
+        time.sleep(0.25)
+        assert client.state == "half-open"
+        with pytest.raises(LLMError):
+            client.complete(_url(stub), BODY, "k")
+        assert stub.requests == 4 and client.state == "open"
+
+        # a successful probe closes it
+        time.sleep(0.25)
+        stub.fail_rate = 0.0
+        client.complete(_url(stub), BODY, "k")
+        assert client.state == "closed"
+        client.complete(_url(stub), BODY, "k")
+        assert stub.requests == 6
+
+
+@pytest.mark.parametrize("bad_url", ["http://[::1", "nope://host/chat/completions"])
+def test_a_bad_url_probe_releases_the_half_open_slot(make_client, bad_url):
+    client = make_client(retries=0)
+    with StubServer(fail_rate=1.0, status=503) as stub:
+        for _ in range(3):
+            with pytest.raises(LLMError):
+                client.complete(_url(stub), BODY, "k")
+        time.sleep(0.25)
+        assert client.state == "half-open"
+
+        # the probe fails before any request goes out
+        with pytest.raises(LLMError) as err:
+            client.complete(bad_url, BODY, "k")
+        assert not isinstance(err.value, CircuitOpenError)
+        assert not client._probing
+
+        # the next call is let through as the probe and closes the breaker
+        stub.fail_rate = 0.0
+        client.complete(_url(stub), BODY, "k")
+        assert client.state == "closed"
+
+
+def test_malformed_response_is_an_llm_error(make_client):
+    def handler(request):
+        return httpx.Response(200, json={"choices": []})
+
+    client = make_client(transport=httpx.MockTransport(handler))
+    with pytest.raises(LLMError, match="Malformed"):
+        client.complete("http://llm.test/v1/chat/completions", BODY, "k")
+    assert client.stats()["consecutiveFailures"] == 1
+
+
+def test_unexpected_errors_become_llm_errors(make_client):
+    def handler(request):
+        raise httpx.TooManyRedirects("loop", request=request)
+
+    client = make_client(transport=httpx.MockTransport(handler))
+    with pytest.raises(LLMError, match="TooManyRedirects"):
+        client.complete("http://llm.test/v1/chat/completions", BODY, "k")
+
+    def broken(request):
+        raise RuntimeError("transport bug")
+
+    client = make_client(transport=httpx.MockTransport(broken), breaker_failures=1)
+    client._failures, client._open_until = 1, 0.0        # half-open
+    with pytest.raises(LLMError, match="RuntimeError: transport bug"):
+        client.complete("http://llm.test/v1/chat/completions", BODY, "k")
+    assert not client._probing
+    assert client.stats()["calls"]["chat"]["failed"] == 1
@@ -0,0 +1,76 @@
+import gzip
+import os
+
+import pytest
+
+import parallel_parser
+from bgzf import BgzfWriter
+from conftest import DATA
+from parallel_parser import ParallelVCFReader
+from parser import VCFReader
+from pgx_knowledgebase import PGX_TARGET_SITES
+
+
+@pytest.fixture(scope="module")
+def vcf_text():
+    """The cohort file with its body repeated, as plain text."""
+    with open(os.path.join(DATA, "100samples.vcf.bgz"), "rb") as fh:
+        lines = gzip.decompress(fh.read()).splitlines(keepends=True)
+    header = b"".join(l for l in lines if l.startswith(b"#"))
+    body = b"".join(l for l in lines if not l.startswith(b"#"))
+    return header + body * 4
+
+
+@pytest.fixture(scope="module", autouse=True)
+def _stop_pools():
+    yield
+    parallel_parser.shutdown()
+
+
+def _scan(reader):
+    with reader:
+        rows = [(v.chrom, v.pos, v.ref, tuple(v.alt), v.id) for v in reader]
+        return rows, reader.rows_read
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_parallel_matches_serial(tmp_path, vcf_text, compressed):
+    path = tmp_path / ("cohort.vcf.bgz" if compressed else "cohort.vcf")
+    if compressed:
+        with BgzfWriter(path) as out:
+            out.write(vcf_text)
+    else:
+        path.write_bytes(vcf_text)
+    expected = _scan(VCFReader(str(path), targets=PGX_TARGET_SITES))
+    assert expected[0]
+
+    for source in (str(path), path.read_bytes()):
+        # Chunks far smaller than the file, so lines straddle chunk edges
+        reader = ParallelVCFReader(source, targets=PGX_TARGET_SITES, workers=3, chunk_bytes=20_000)
+        assert reader._serial is None
+        assert _scan(reader) == expected
+
+
+def test_pool_is_shared_and_survives_abandoned_readers(tmp_path, vcf_text):
+    path = tmp_path / "cohort.vcf"
+    path.write_bytes(vcf_text)
+    expected = _scan(VCFReader(str(path), targets=None))
+
+    first = ParallelVCFReader(str(path), targets=None, workers=2, chunk_bytes=10_000)
+    it = iter(first)
+    next(it)
+    it.close()                                    # stop part-way
+    pool = parallel_parser._executor(2)
+
+    again = ParallelVCFReader(str(path), targets=None, workers=2, chunk_bytes=10_000)
+    assert _scan(again) == expected
+    assert parallel_parser._executor(2) is pool
+    assert pool._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_plain_gzip_is_read_serially(tmp_path, vcf_text):
+    path = tmp_path / "cohort.vcf.gz"
+    path.write_bytes(gzip.compress(vcf_text))
+    reader = ParallelVCFReader(str(path), targets=PGX_TARGET_SITES, workers=3, chunk_bytes=20_000)
+    assert reader._serial is not None
+    assert _scan(reader) == _scan(VCFReader(str(path), targets=PGX_TARGET_SITES))
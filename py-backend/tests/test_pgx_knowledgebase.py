@@ -0,0 +1,131 @@
+import importlib
+import os
+import shutil
+import time
+
+import pytest
+
+import analyzer
+import cpic_tables
+import pgx_definitions
+import pgx_knowledgebase
+from pgx_knowledgebase import POOR, DrugGeneInteraction
+
+from conftest import DATA
+
+
+@pytest.fixture
+def definitions(tmp_path, monkeypatch):
+    """A copy of pgx_definitions.py that reload() picks up instead of the real one."""
+    path = tmp_path / "pgx_definitions.py"
+    shutil.copy(pgx_definitions.__file__, path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    importlib.reload(pgx_definitions)
+    pgx_knowledgebase.reload(force=True)
+    assert pgx_definitions.__file__ == str(path)
+    yield path
+    monkeypatch.undo()
+    importlib.reload(pgx_definitions)
+    pgx_knowledgebase.reload(force=True)
+    assert pgx_definitions.__file__ != str(path)
+
+
+def _edit(path, old, new):
+    text = path.read_text()
+    assert old in text
+    path.write_text(text.replace(old, new, 1))
+    # make sure the mtime moves even on coarse-grained filesystems
+    mtime = time.time() + 2
+    os.utime(path, (mtime, mtime))
+
+
+def test_reload_picks_up_definition_edits(definitions):
+    before = pgx_knowledgebase.current()
+    assert before.lookup_interaction("codeine", "CYP2D6", POOR).risk == "Ineffective"
+    assert not pgx_knowledgebase.changed()
+
+    _edit(definitions, '"xeloda": "capecitabine",', '"xeloda": "capecitabine",\n    "tylenol-3": "codeine",')
+    _edit(definitions, '"AVOID codeine. Use alternative analgesic. Codeine will provide',
+          '"AVOID codeine (edited). Use alternative analgesic. Codeine will provide')
+    assert pgx_knowledgebase.changed()
+
+    after = pgx_knowledgebase.reload()
+    assert after is pgx_knowledgebase.current() and after is not before
+    assert after.version != before.version
+    assert pgx_knowledgebase.KB_VERSION == after.version
+    assert not pgx_knowledgebase.changed()
+
+    ix = after.lookup_interaction("tylenol-3", "CYP2D6", POOR)
+    assert ix.recommendation.startswith("AVOID codeine (edited)")
+    # reloaded rows are still instances of the class callers imported
+    assert type(ix) is DrugGeneInteraction
+    # an analysis holding the old knowledge base keeps its answers
+    assert before.lookup_interaction("tylenol-3", "CYP2D6", POOR) is None
+    assert before.lookup_interaction("codeine", "CYP2D6", POOR).recommendation.startswith("AVOID codeine.")
+
+
+def test_touched_definitions_keep_the_current_knowledge_base(definitions):
+    before = pgx_knowledgebase.current()
+    mtime = time.time() + 2
+    os.utime(definitions, (mtime, mtime))
+    assert pgx_knowledgebase.changed()
+    assert pgx_knowledgebase.reload() is before
+    assert not pgx_knowledgebase.changed()
+
+
+def test_broken_definitions_keep_the_current_knowledge_base(definitions):
+    before = pgx_knowledgebase.current()
+    _edit(definitions, "_DRUG_SYNONYMS: Dict[str, str] = {", "_DRUG_SYNONYMS: Dict[str, str] = {{")
+    assert pgx_knowledgebase.reload() is before
+    status = pgx_knowledgebase.reload_status()
+    assert status["version"] == before.version
+    assert status["lastError"].startswith("SyntaxError")
+
+
+def test_watcher_reloads_in_the_background(definitions):
+    before = pgx_knowledgebase.current()
+    _edit(definitions, '"xeloda": "capecitabine",', '"xeloda": "capecitabine",\n    "tylenol-3": "codeine",')
+    pgx_knowledgebase.start_watcher(0.05)
+    deadline = time.monotonic() + 30
+    while pgx_knowledgebase.current() is before and time.monotonic() < deadline:
+        time.sleep(0.05)
+    kb = pgx_knowledgebase.current()
+    assert kb is not before
+    assert kb.get_genes_for_drug("Tylenol-3") == ["CYP2D6"]
+    assert pgx_knowledgebase.reload_status()["lastError"] is None
+
+
+def _fresh_kb():
+    """A knowledge base over a new table generation, nothing loaded yet."""
+    return pgx_knowledgebase.KnowledgeBase(
+        cpic_tables.CpicTables.discover(), pgx_definitions._INTERACTIONS,
+        pgx_definitions._HARDCODED_ALLELE_FUNCTION, pgx_definitions._HARDCODED_RSIDS,
+        synonyms=pgx_definitions._DRUG_SYNONYMS,
+    )
+
+
+def test_an_analysis_loads_only_its_drugs_genes():
+    kb = _fresh_kb()
+    assert kb.version == pgx_knowledgebase.current().version
+    assert kb.tables.loaded == set()
+
+    result = analyzer.analyze_stream(os.path.join(DATA, "sample.vcf"), ["warfarin"], kb=kb)
+    assert kb.tables.loaded == {"CYP2C9"}
+    assert [g.gene for g in result.genes] == ["CYP2C9"]
+    assert result.summary["knowledgeBaseVersion"] == kb.version
+
+    # a synonym resolves to the same, already built, scope
+    assert kb.for_drugs(["Coumadin"]) is kb.for_drugs(["warfarin"])
+    assert kb.tables.loaded == {"CYP2C9"}
+
+
+def test_scoped_results_match_the_full_knowledge_base():
+    kb = _fresh_kb()
+    path = os.path.join(DATA, "sample.vcf")
+    scoped = analyzer.analyze_stream(path, ["clopidogrel", "codeine"], kb=kb).to_dict()
+    full = analyzer.analyze_stream(path, [], kb=kb).to_dict()
+    assert kb.tables.loaded == set(kb.known_genes)
+    genes = {g["gene"]: g for g in full["genes"]}
+    assert [g["gene"] for g in scoped["genes"]] == ["CYP2C19", "CYP2D6"]
+    for gene in scoped["genes"]:
+        assert gene == genes[gene["gene"]]
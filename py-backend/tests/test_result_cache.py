@@ -0,0 +1,116 @@
+import hashlib
+import io
+import os
+import time
+
+from result_cache import DiskTier, MongoTier, ResultCache, SqliteTier, cache_key, vcf_digest
+
+
+def test_cache_key_components():
+    base = cache_key("d", "s1", ["Warfarin", "codeine"], "kb1", "llm")
+    assert base == cache_key("d", "s1", [" warfarin", "CODEINE", ""], "kb1", "llm")
+    for other in (
+        cache_key("e", "s1", ["warfarin", "codeine"], "kb1", "llm"),
+        cache_key("d", "s2", ["warfarin", "codeine"], "kb1", "llm"),
+        cache_key("d", "s1", ["warfarin"], "kb1", "llm"),
+        cache_key("d", "s1", ["codeine", "warfarin"], "kb1", "llm"),
+        cache_key("d", "s1", ["warfarin", "codeine", "warfarin"], "kb1", "llm"),
+        cache_key("d", "s1", ["warfarin", "codeine"], "kb2", "llm"),
+        cache_key("d", "s1", ["warfarin", "codeine"], "kb1", "template"),
+    ):
+        assert other != base
+
+
+def test_vcf_digest_hashes_the_raw_bytes(tmp_path):
+    data = b"##fileformat=VCFv4.2\n" * 1000
+    path = tmp_path / "a.vcf"
+    path.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    assert vcf_digest(data) == vcf_digest(str(path)) == digest
+
+    handle = io.BytesIO(b"xx" + data)
+    handle.seek(2)
+    assert vcf_digest(handle) == digest and handle.tell() == 2
+
+
+def test_disk_tier_ttl(tmp_path):
+    tier = DiskTier(str(tmp_path), ttl=60)
+    tier.put("a", {"v": 1})
+    assert tier.get("a") == {"v": 1}
+    old = time.time() - 120
+    os.utime(tmp_path / "a.json", (old, old))
+    assert tier.get("a") is None
+    assert not (tmp_path / "a.json").exists()
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    tier = DiskTier(str(tmp_path), max_entries=10)
+    now = time.time()
+    for i in range(64):
+        tier.put(f"k{i}", {"v": i})
+        os.utime(tmp_path / f"k{i}.json", (now - 1000 + i, now - 1000 + i))
+        if i < 63:
+            assert len(tier) == i + 1
+    # the 64th write trims to the newest 10
+    assert len(tier) == 10
+    assert tier.get("k53") is None and tier.get("k63") == {"v": 63}
+
+
+def test_memory_ttl_and_tier_promotion(tmp_path):
+    tier = SqliteTier(str(tmp_path / "c.sqlite"))
+    cache = ResultCache(4, tier, ttl=0.05)
+    cache.put("k", {"v": 1})
+    assert cache.get("k") == {"v": 1}
+    time.sleep(0.1)
+    fresh = ResultCache(4, tier)
+    assert fresh.get("k") == {"v": 1} and fresh.stats()["tierHits"] == 1
+
+
+def test_promoted_entries_keep_their_age(tmp_path):
+    tier = SqliteTier(str(tmp_path / "c.sqlite"))
+    ResultCache(4, tier).put("k", {"v": 1})
+    time.sleep(0.06)
+    cache = ResultCache(4, tier, ttl=0.1)
+    assert cache.get("k") == {"v": 1}
+    time.sleep(0.06)
+    # 0.12s after it was stored: the memory copy has expired too
+    assert cache._entries["k"][1] < time.time() - 0.1
+    cache.get("k")
+    assert "k" not in cache._entries
+
+    # an entry already older than the memory TTL is served but not kept
+    tier.put("old", {"v": 2})
+    time.sleep(0.12)
+    assert cache.get("old") == {"v": 2} and "old" not in cache._entries
+
+
+class _Collection:
+    """The few pymongo collection methods MongoTier calls."""
+
+    def __init__(self):
+        self.docs = {}
+        self.indexes = []
+
+    def create_index(self, field, **options):
+        self.indexes.append((field, options))
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = doc
+
+    def delete_one(self, query):
+        self.docs.pop(query["_id"], None)
+
+
+def test_mongo_tier_expires_entries():
+    collection = _Collection()
+    tier = MongoTier(collection, ttl=60)
+    assert collection.indexes == [("expires", {"expireAfterSeconds": 0})]
+    tier.put("k", {"v": 1})
+    assert tier.get("k") == {"v": 1}
+    assert collection.docs["k"]["expires"].timestamp() > time.time() + 59
+    collection.docs["k"]["created"] -= 120
+    assert tier.get("k") is None
+    assert "k" not in collection.docs
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+import analyzer
+import pgx_knowledgebase
+from genotype_matrix import GenotypeMatrix, MISSING, PAD
+from parser import parse_vcf_bytes
+
+
+@pytest.fixture(scope="module")
+def cyp2c19():
+    return pgx_knowledgebase.current().star_callers["CYP2C19"]
+
+
+@pytest.fixture(scope="module")
+def cyp2d6():
+    return pgx_knowledgebase.current().star_callers["CYP2D6"]
+
+
+def _site(caller, rsid):
+    """The (chrom, pos, ref, alts, rsid) VCF row of *caller*'s defining site *rsid*."""
+    chrom, pos, ref, alt, _, rs = next(v for v in caller.variants if v[5] == rsid)
+    return (chrom, pos, ref, [alt], rs)
+
+
+# CYP2C19 *2 = rs12769205 + rs4244285, *17 = rs12248560; *1 and both of
+# them also carry rs3758581, which the reference sequence (*38) lacks
+
+def _vcf(sites, samples, chrom_prefix=""):
+    """A VCF with *sites* and one GT column per sample (S0, S1, ...)."""
+    lines = [
+        "##fileformat=VCFv4.2",
+        "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"
+        + "\t".join(f"S{i}" for i in range(len(samples))),
+    ]
+    for r, (chrom, pos, ref, alts, rsid) in enumerate(sites):
+        calls = "\t".join(s[r] for s in samples)
+        lines.append(f"{chrom_prefix}{chrom}\t{pos}\t{rsid or '.'}\t{ref}\t{','.join(alts)}\t.\tPASS\t.\tGT\t{calls}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_ranks_the_explaining_diplotype_first(cyp2c19):
+    sites = [_site(cyp2c19, rs) for rs in ("rs12769205", "rs4244285", "rs3758581", "rs12248560")]
+    call = cyp2c19.call(sites, ["0/1", "0/1", "1/1", "0/1"])
+    assert (call.diplotype, call.mismatches, call.phased) == ("*2/*17", 0, False)
+    # one *2 site alone still prefers the lower-numbered partner
+    assert cyp2c19.call(sites[1:2], ["0/1"]).diplotype == "*1/*2"
+    # hom for both *2 sites
+    assert cyp2c19.call(sites[:3], ["1/1", "1/1", "1/1"]).diplotype == "*2/*2"
+
+
+def test_phased_calls_are_scored_per_haplotype(cyp2c19):
+    sites = [_site(cyp2c19, rs) for rs in ("rs12769205", "rs4244285", "rs3758581", "rs12248560")]
+    trans = cyp2c19.call(sites, ["0|1", "0|1", "1|1", "1|0"])
+    assert (trans.diplotype, trans.mismatches, trans.phased) == ("*2/*17", 0, True)
+    # *2 and *17 variants on the same haplotype: no allele carries both
+    cis = cyp2c19.call(sites, ["0|1", "0|1", "1|1", "0|1"])
+    assert cis.phased and cis.mismatches == 1
+    assert cis.diplotype != "*2/*17"
+    # one unphased het makes the whole sample unphased
+    mixed = cyp2c19.call(sites, ["0|1", "0|1", "1|1", "0/1"])
+    assert (mixed.diplotype, mixed.mismatches, mixed.phased) == ("*2/*17", 0, False)
+
+
+def test_uncalled_sites_default_to_star1(cyp2c19):
+    assert cyp2c19.call([], []).diplotype == "*1/*1"
+    site = [_site(cyp2c19, "rs3758581")]
+    for missing in ("./.", ".", ".|."):
+        assert cyp2c19.call(site, [missing]).diplotype == "*1/*1"
+    # called as reference, the sample matches the GRCh38 sequence (*38)
+    assert cyp2c19.call(site, ["0/0"]).diplotype == "*38/*38"
+    assert cyp2c19.call(site, ["0/1"]).diplotype == "*1/*38"
+
+
+def test_iupac_sites_may_be_either(cyp2d6):
+    star4 = _site(cyp2d6, "rs3892097")        # the one definite *4 site
+    maybe = _site(cyp2d6, "rs28371736")       # an IUPAC site of *4
+    for gt in ("0/0", "0/1", "1/1"):
+        call = cyp2d6.call([star4, maybe], ["1/1", gt])
+        assert (call.diplotype, call.mismatches) == ("*4/*4", 0), gt
+
+
+def test_rsid_fallback_for_other_builds(cyp2c19):
+    grch38 = _site(cyp2c19, "rs4244285")
+    vid = cyp2c19.variant_id(*grch38[:3], grch38[3][0])
+    # GRCh37 coordinates of the same variant
+    assert cyp2c19.variant_id("chr10", 96541616, "G", "A", "rs4244285") == vid
+    assert cyp2c19.variant_id("10", 96541616, "G", "A", "rs0;rs4244285") == vid
+    assert cyp2c19.variant_id("10", 96541616, "G", "A", "") is None
+    assert cyp2c19.variant_id("10", 96541616, "G", "A", "rs1") is None
+
+    sites = [("10", 96541616, "G", ["A"], "rs4244285")] + [_site(cyp2c19, rs) for rs in ("rs12769205", "rs3758581")]
+    call = cyp2c19.call(sites, ["0/1", "0/1", "1/1"])
+    assert (call.diplotype, call.mismatches) == ("*1/*2", 0)
+
+
+def test_haploid_alt_is_one_copy(cyp2c19):
+    site = [_site(cyp2c19, "rs4244285")]
+    hemi = cyp2c19.call(site, ["1"])
+    assert (hemi.diplotype, hemi.mismatches) == ("*1/*2", 0)
+    assert cyp2c19.call([_site(cyp2c19, "rs12248560")], ["1"]).diplotype == "*1/*17"
+    assert cyp2c19.call(site, ["0"]).diplotype == cyp2c19.call(site, ["0/0"]).diplotype
+
+
+def test_call_many_agrees_with_call(cyp2c19, cyp2d6):
+    rng = np.random.default_rng(7)
+    gts = ["0/0", "0/1", "1/1", "0|1", "1|0", "1|1", "./.", ".", "0", "1", "1/.", "0/2"]
+    for caller in (cyp2c19, cyp2d6):
+        sites = [(c, p, r, [a], rs) for c, p, r, a, _, rs in caller.variants[:40]]
+        samples = [rng.choice(gts, size=len(sites)).tolist() for _ in range(60)]
+        # a few duplicate samples exercise the shared scoring of equal calls
+        samples += samples[:5]
+        expected = [caller.call(sites, s) for s in samples]
+
+        vcf = parse_vcf_bytes(_vcf(sites, samples))
+        matrix = GenotypeMatrix.from_variants(vcf.variants, vcf.samples)
+        assert caller.call_many(sites, matrix.alleles, matrix.phased) == expected
+
+
+def test_call_many_pads_haploid_blocks(cyp2c19):
+    sites = [_site(cyp2c19, rs) for rs in ("rs4244285", "rs12248560")]
+    alleles = np.array([[[1], [0], [MISSING]], [[0], [1], [MISSING]]], dtype=np.int8)
+    phased = np.zeros((2, 3), dtype=bool)
+    calls = cyp2c19.call_many(sites, alleles, phased)
+    assert [c.diplotype for c in calls] == ["*1/*2", "*1/*17", "*1/*1"]
+    padded = np.concatenate([alleles, np.full_like(alleles, PAD)], axis=2)
+    assert cyp2c19.call_many(sites, padded, phased) == calls
+
+
+def test_haploid_cohort_matches_single_sample_calls(cyp2c19):
+    # every CYP2C19 target row is haploid or "." across the whole cohort
+    sites = [_site(cyp2c19, rs) for rs in ("rs12769205", "rs4244285", "rs12248560")]
+    vcf = _vcf(sites, [["1", "1", "0"], ["0", "0", "1"], [".", ".", "."], ["0", "0", "0"]], "chr")
+
+    def calls(result):
+        return ([d.diplotype for d in result.drug_results],
+                [g.activity_score_description for g in result.genes if g.gene == "CYP2C19"])
+
+    cohort = {r.patient_id: calls(r) for r in analyzer.analyze_cohort(vcf, ["clopidogrel"])}
+    assert cohort == {
+        s: calls(analyzer.analyze_stream(vcf, ["clopidogrel"], sample=s)) for s in ("S0", "S1", "S2", "S3")
+    }
+    assert cohort["S0"][0] == ["*1/*2"]
+    assert "called *1/*17" in cohort["S1"][1][0]
@@ -0,0 +1,43 @@
+"""
+Warm the LLM explanation cache
+==============================
+Analyzes every sample of the given VCFs with LLM explanations on, so the
+explanations for the genotypes that occur in them are served from
+:mod:`llm_cache` without a completion.  An explanation request cites the
+patient's detected variants, so only real genotypes produce the keys
+later analyses look up; pick VCFs representative of the expected cohort.
+
+    python warm_llm_cache.py data/100samples.vcf.bgz
+
+Needs the same LLM_* / GROQ_API_KEY settings as the server; calls run on
+the analyzer's bounded pool (LLM_MAX_CONCURRENCY), each sample waiting at
+most LLM_DEADLINE_S.
+"""
+
+import argparse
+import time
+
+import analyzer
+import llm_cache
+import pgx_knowledgebase
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("vcf", nargs="+", help="VCFs whose samples are analyzed")
+    args = ap.parse_args()
+
+    if not analyzer._llm_api_key():
+        raise SystemExit("No LLM API key set (GROQ_API_KEY / OPENAI_API_KEY / LLM_API_KEY)")
+
+    kb = pgx_knowledgebase.current()
+    for path in args.vcf:
+        t0 = time.perf_counter()
+        n = sum(1 for _ in analyzer.analyze_cohort(path, kb.known_drugs, use_llm=True, kb=kb))
+        print(f"{path}: {n} samples ({time.perf_counter() - t0:.1f}s)")
+
+    print(f"Cache: {llm_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()